@@ -407,4 +407,8 @@ KEYWORD_MAPPINGS = {
     },
 
     
-}
\ No newline at end of file
+}
+# 內容創建指令的觸發字首與樣式（content_creator 未自行宣告時使用）
+# 與「創建說明」中列出的指令一致，其餘訊息不會進入創建解析
+CREATION_COMMAND_PREFIXES = ["創建", "建立", "新增", "設定", "規劃", "約"]
+CREATION_COMMAND_PATTERNS = []
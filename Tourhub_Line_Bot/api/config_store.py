@@ -0,0 +1,195 @@
+"""
+可熱更新的設定（KEYWORD_MAPPINGS / MESSAGE_TEMPLATES）
+- 來源：CONFIG_SOURCE=file 讀 CONFIG_FILE（JSON，含 version），
+  CONFIG_SOURCE=db 讀 system_configs 表的 keyword_mappings / message_templates（config_type=json）；
+  未設定時只使用 api/config.py 的內建值
+- 輪詢很便宜：檔案只看 mtime / 大小，資料庫只查 MAX(updated_at)；版本改變才載入
+- 載入與衍生物件（關鍵字比對器、靜態卡片快取等，由 register_builder 註冊）在背景執行緒建好後，
+  以一次指派整份替換，請求不會看到建到一半的狀態
+- 替換前檢查 message_templates 的結構，格式錯誤的設定不會生效
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from api import config
+
+logger = logging.getLogger(__name__)
+
+CONFIG_SOURCE = os.environ.get('CONFIG_SOURCE', '').lower()  # '', 'file', 'db'
+CONFIG_FILE = os.environ.get('CONFIG_FILE', '')
+CONFIG_POLL_SECONDS = float(os.environ.get('CONFIG_POLL_SECONDS', '30'))
+
+CONFIG_KEYS = ('keyword_mappings', 'message_templates')
+
+VERSION_QUERY = (
+    "SELECT MAX(updated_at) AS version, COUNT(*) AS total FROM system_configs "
+    "WHERE config_key IN (%s, %s) AND is_active = TRUE"
+)
+CONFIG_QUERY = (
+    "SELECT config_key, config_value FROM system_configs "
+    "WHERE config_key IN (%s, %s) AND is_active = TRUE AND config_type = 'json'"
+)
+
+# message_templates 各區段必須有的欄位（對應 api/index.py 的 Flex 模板）；值為 list 的欄位另列
+TEMPLATE_SECTIONS = {
+    'help': ('title', 'color', 'features'),
+    'feature_menu': ('title', 'color', 'description'),
+}
+TEMPLATE_GROUPS = {
+    'features': ('title', 'description', 'button_text', 'color', 'url'),
+    'feature_details': ('title', 'color', 'description', 'details', 'usage_steps', 'button_text', 'url'),
+}
+LIST_FIELDS = ('features', 'details', 'usage_steps')
+
+
+class ConfigSnapshot:
+    """某一版本的設定與由它建出的衍生物件（建立後不再修改）"""
+
+    def __init__(self, version, keyword_mappings, message_templates, artifacts=None):
+        self.version = version
+        self.keyword_mappings = keyword_mappings
+        self.message_templates = message_templates
+        self.artifacts = artifacts or {}
+
+
+_builders = {}
+_current = ConfigSnapshot('builtin', config.KEYWORD_MAPPINGS, config.MESSAGE_TEMPLATES)
+_reload_lock = threading.Lock()
+_last_poll = 0.0
+_last_probe = None
+
+
+def current() -> ConfigSnapshot:
+    return _current
+
+
+def get_artifact(name: str):
+    return _current.artifacts[name]
+
+
+def register_builder(name: str, func):
+    """註冊衍生物件：func(snapshot) 於每次載入新設定時在背景重建"""
+    _builders[name] = func
+    _current.artifacts[name] = func(_current)
+
+
+# ---- 設定來源 ----
+
+def _probe():
+    """回傳代表目前來源版本的便宜指紋，無法取得時回傳 None"""
+    if CONFIG_SOURCE == 'file' and CONFIG_FILE:
+        try:
+            stat = os.stat(CONFIG_FILE)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    if CONFIG_SOURCE == 'db':
+        from api.database import _fetch_all
+        rows = _fetch_all(VERSION_QUERY, CONFIG_KEYS)
+        if not rows or not rows[0]['total']:
+            return None
+        return (str(rows[0]['version']), rows[0]['total'])
+    return None
+
+
+def _load(probe):
+    """讀取設定，回傳 (version, keyword_mappings, message_templates)"""
+    if CONFIG_SOURCE == 'file':
+        with open(CONFIG_FILE, encoding='utf-8') as f:
+            data = json.load(f)
+        version = data.get('version') or f"mtime:{probe[0]}"
+    else:
+        from api.database import _fetch_all
+        data = {row['config_key']: json.loads(row['config_value']) for row in _fetch_all(CONFIG_QUERY, CONFIG_KEYS)}
+        version = f"db:{probe[0]}"
+    return (
+        version,
+        data.get('keyword_mappings') or config.KEYWORD_MAPPINGS,
+        data.get('message_templates') or config.MESSAGE_TEMPLATES,
+    )
+
+
+def _validate(keyword_mappings, message_templates):
+    if not isinstance(keyword_mappings, dict) or not isinstance(message_templates, dict):
+        raise ValueError("設定格式錯誤：keyword_mappings / message_templates 需為物件")
+    for key, mapping in keyword_mappings.items():
+        if not isinstance(mapping.get('keywords'), list) or not mapping.get('template'):
+            raise ValueError(f"關鍵字設定 {key} 缺少 keywords 或 template")
+    for section, fields in TEMPLATE_SECTIONS.items():
+        _validate_template(section, message_templates.get(section), fields)
+    for group, fields in TEMPLATE_GROUPS.items():
+        templates = message_templates.get(group)
+        if not isinstance(templates, dict):
+            raise ValueError(f"訊息模板 {group} 需為物件")
+        for name, template in templates.items():
+            _validate_template(f"{group}.{name}", template, fields)
+
+
+def _validate_template(name, template, fields):
+    if not isinstance(template, dict):
+        raise ValueError(f"訊息模板 {name} 需為物件")
+    for field in fields:
+        value = template.get(field)
+        if field in LIST_FIELDS:
+            if not isinstance(value, list):
+                raise ValueError(f"訊息模板 {name} 的 {field} 需為陣列")
+        elif not isinstance(value, str) or not value:
+            raise ValueError(f"訊息模板 {name} 缺少 {field}")
+
+
+# ---- 載入與替換 ----
+
+def install(version, keyword_mappings, message_templates) -> ConfigSnapshot:
+    """建好所有衍生物件後一次替換目前設定"""
+    global _current
+    _validate(keyword_mappings, message_templates)
+    snapshot = ConfigSnapshot(version, keyword_mappings, message_templates)
+    for name, build in _builders.items():
+        snapshot.artifacts[name] = build(snapshot)
+    _current = snapshot
+    logger.info(f"🔄 設定已更新為版本 {version}")
+    return snapshot
+
+
+def reload(force: bool = False) -> dict:
+    """檢查來源版本，有變更（或 force）時重新載入；同時只允許一個載入在進行"""
+    global _last_probe
+    if not _reload_lock.acquire(blocking=False):
+        return {'status': 'skipped', 'reason': 'running'}
+    try:
+        probe = _probe()
+        if probe is None:
+            return {'status': 'unchanged', 'version': _current.version, 'source': CONFIG_SOURCE or 'builtin'}
+        if probe == _last_probe and not force:
+            return {'status': 'unchanged', 'version': _current.version}
+        version, keyword_mappings, message_templates = _load(probe)
+        _last_probe = probe
+        if version == _current.version and not force:
+            return {'status': 'unchanged', 'version': version}
+        install(version, keyword_mappings, message_templates)
+        return {'status': 'reloaded', 'version': version}
+    finally:
+        _reload_lock.release()
+
+
+def poll():
+    """請求路徑上呼叫：每 CONFIG_POLL_SECONDS 最多在背景檢查一次，不阻塞請求"""
+    global _last_poll
+    if not CONFIG_SOURCE:
+        return
+    now = time.monotonic()
+    if now - _last_poll < CONFIG_POLL_SECONDS:
+        return
+    _last_poll = now
+    threading.Thread(target=_reload_in_background, name='config-reload', daemon=True).start()
+
+
+def _reload_in_background():
+    try:
+        reload()
+    except Exception as e:
+        logger.error(f"設定重新載入失敗，沿用版本 {_current.version}: {e}")
@@ -0,0 +1,48 @@
+"""
+內容創建指令前置過濾
+- 創建指令宣告觸發字首（creation_prefixes）與正規表示式（creation_patterns，從訊息開頭比對），
+  未宣告時使用 config 的預設值
+- 預先編譯成一個正規表示式，明顯不是創建指令的訊息直接略過 parse_and_create
+- 通過 / 略過次數記錄在 creation_gate 指標
+"""
+
+import re
+import logging
+
+from api import metrics
+from api.config import CREATION_COMMAND_PREFIXES, CREATION_COMMAND_PATTERNS
+
+logger = logging.getLogger(__name__)
+
+
+class CreationGate:
+    """以觸發字首與樣式判斷訊息是否可能是創建指令"""
+
+    def __init__(self, prefixes=(), patterns=()):
+        self.prefixes = tuple(prefixes)
+        self.patterns = tuple(patterns)
+        # 字首較長者優先，避免被較短的字首截斷（只影響比對效率，不影響結果）
+        alternatives = [re.escape(p) for p in sorted(self.prefixes, key=len, reverse=True)]
+        regex = None
+        if alternatives:
+            regex = r'\s*(?:' + '|'.join(alternatives) + ')'
+        if self.patterns:
+            extra = '|'.join(f'(?:{p})' for p in self.patterns)
+            regex = f'(?:{regex})|{extra}' if regex else extra
+        self._match = re.compile(regex).match if regex else None
+
+    def allows(self, text: str) -> bool:
+        passed = bool(self._match and text and self._match(text))
+        metrics.incr('creation_gate', label='pass' if passed else 'reject')
+        return passed
+
+
+def build_creation_gate(creator) -> CreationGate:
+    """依 content_creator 宣告的觸發條件建立過濾器"""
+    prefixes = getattr(creator, 'creation_prefixes', None)
+    patterns = getattr(creator, 'creation_patterns', None)
+    if prefixes is None and patterns is None:
+        prefixes, patterns = CREATION_COMMAND_PREFIXES, CREATION_COMMAND_PATTERNS
+    gate = CreationGate(prefixes or (), patterns or ())
+    logger.info(f"🚦 創建指令過濾：字首 {len(gate.prefixes)} 個、樣式 {len(gate.patterns)} 個")
+    return gate
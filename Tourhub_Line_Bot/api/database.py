@@ -3,6 +3,8 @@ import os
 import logging
 from datetime import datetime
 
+from api import snapshot_store
+
 logger = logging.getLogger(__name__)
 
 def get_database_connection():
@@ -27,8 +29,36 @@ def get_database_connection():
 
 ## 已移除未使用的 get_trip_details 函式
 
+def format_location_trip(trip):
+    """地區行程查詢結果的輸出格式"""
+    duration_days = trip.get('duration_days')
+    if duration_days is None and trip.get('start_date') and trip.get('end_date'):
+        duration_days = (trip['end_date'] - trip['start_date']).days + 1
+    return {
+        "id": trip['trip_id'],
+        "title": trip['title'],
+        "duration": f"{duration_days}天{duration_days-1}夜" if duration_days and duration_days > 1 else "1天",
+        "description": trip['description'] or "精彩行程",
+        "highlights": trip['description'] or f"{trip['area']}精彩景點",
+        "favorite_count": trip['favorite_count']
+    }
+
+LOCATION_TRIPS_LIMIT = 5
+
 def get_trips_by_location(location):
-    """根據地區獲取行程列表"""
+    """根據地區獲取行程列表：優先使用程序內的 n-gram 索引（地區、標題、描述），
+    索引無法建立時改用 LIKE 查詢地區欄位"""
+    try:
+        from api.trip_search import search_trips
+        trips = search_trips(location, limit=LOCATION_TRIPS_LIMIT)
+        if trips is not None:
+            logger.info(f"成功獲取 {location} 地區 {len(trips)} 筆行程資料（索引）")
+            return trips
+    except Exception as e:
+        logger.error(f"行程索引查詢失敗，改用資料庫查詢: {e}")
+    return _get_trips_by_location_like(location)
+
+def _get_trips_by_location_like(location):
     try:
         connection = get_database_connection()
         if not connection:
@@ -49,24 +79,15 @@ def get_trips_by_location(location):
         LEFT JOIN trip_stats ts ON t.trip_id = ts.trip_id
         WHERE t.area LIKE %s
         ORDER BY ts.popularity_score DESC, ts.favorite_count DESC
-        LIMIT 5
+        LIMIT %s
         """
         
-        cursor.execute(query, (f"%{location}%",))
+        cursor.execute(query, (f"%{location}%", LOCATION_TRIPS_LIMIT))
         results = cursor.fetchall()
         cursor.close()
         connection.close()
         
-        trips = []
-        for trip in results:
-            trips.append({
-                "id": trip['trip_id'],
-                "title": trip['title'],
-                "duration": f"{trip['duration_days']}天{trip['duration_days']-1}夜" if trip['duration_days'] > 1 else "1天",
-                "description": trip['description'] or "精彩行程",
-                "highlights": trip['description'] or f"{trip['area']}精彩景點",
-                "favorite_count": trip['favorite_count']
-            })
+        trips = [format_location_trip(trip) for trip in results]
         
         logger.info(f"成功獲取 {location} 地區 {len(trips)} 筆行程資料")
         return trips
@@ -75,12 +96,260 @@ def get_trips_by_location(location):
         logger.error(f"獲取地區行程失敗: {e}")
         return []
 
+# 排行榜排序：熱門分數、收藏數、分享數，同分時以 trip_id 決定先後；
+# 沒有 trip_stats 的行程排在最後（依 trip_id）
+_RANKED_TRIPS_COLUMNS = """
+SELECT
+    t.trip_id,
+    t.title,
+    t.area,
+    t.start_date,
+    t.end_date,
+    ts.trip_id IS NOT NULL AS has_stats,
+    ts.popularity_score,
+    ts.favorite_count,
+    ts.share_count
+"""
+# 依 trip_stats 的排序索引（database/ranking_indexes.sql）由高至低讀取，不需排序；
+# 有統計資料的行程用完後再依 trip_id 接續沒有統計資料的行程
+_RANKED_STATS_FROM = """
+FROM trip_stats ts
+JOIN line_trips t ON t.trip_id = ts.trip_id
+"""
+_RANKED_STATS_ORDER = """
+ORDER BY ts.popularity_score DESC, ts.favorite_count DESC, ts.share_count DESC, ts.trip_id DESC
+"""
+RANKED_TRIPS_QUERY = _RANKED_TRIPS_COLUMNS + _RANKED_STATS_FROM + _RANKED_STATS_ORDER + "LIMIT %s"
+RANKED_TRIP_AT_QUERY = _RANKED_TRIPS_COLUMNS + _RANKED_STATS_FROM + _RANKED_STATS_ORDER + "LIMIT %s, 1"
+RANKED_TRIPS_COUNT_QUERY = "SELECT COUNT(*) AS total" + _RANKED_STATS_FROM
+
+# 「更多排行」以排序鍵接續查詢（keyset），每頁成本與名次深度無關；
+# 展開成 <= 加上逐欄比較，讓索引能從游標位置開始範圍掃描
+RANKED_TRIPS_AFTER_QUERY = _RANKED_TRIPS_COLUMNS + _RANKED_STATS_FROM + """
+WHERE ts.popularity_score <= %s
+  AND (ts.popularity_score < %s OR (ts.popularity_score = %s
+  AND (ts.favorite_count < %s OR (ts.favorite_count = %s
+  AND (ts.share_count < %s OR (ts.share_count = %s AND ts.trip_id < %s))))))
+""" + _RANKED_STATS_ORDER + "LIMIT %s"
+_UNRANKED_TRIPS_QUERY = _RANKED_TRIPS_COLUMNS + """
+FROM line_trips t
+LEFT JOIN trip_stats ts ON t.trip_id = ts.trip_id
+WHERE ts.trip_id IS NULL{after}
+ORDER BY t.trip_id DESC
+"""
+UNRANKED_TRIPS_QUERY = _UNRANKED_TRIPS_QUERY.format(after="") + "LIMIT %s"
+UNRANKED_TRIPS_AFTER_QUERY = _UNRANKED_TRIPS_QUERY.format(after=" AND t.trip_id < %s") + "LIMIT %s"
+UNRANKED_TRIP_AT_QUERY = _UNRANKED_TRIPS_QUERY.format(after="") + "LIMIT %s, 1"
+
+# 詳細行程：一次取回指定名次的行程、前 N 筆行程明細與明細總數（LATERAL 需 MySQL 8.0.14+）；
+# 明細依 line_trip_details 的 (trip_id, date, start_time) 索引排序後截斷
+RANKED_TRIP_DETAILS_QUERY = """
+SELECT
+    r.*,
+    d.location,
+    d.date,
+    d.start_time,
+    d.end_time,
+    d.description
+FROM (
+    SELECT
+        t.trip_id,
+        t.title,
+        t.area,
+        t.start_date,
+        t.end_date,
+        ts.trip_id IS NOT NULL AS has_stats,
+        ts.popularity_score,
+        ts.favorite_count,
+        ts.share_count,
+        (SELECT COUNT(*) FROM line_trip_details c WHERE c.trip_id = t.trip_id) AS detail_count
+""" + _RANKED_STATS_FROM + _RANKED_STATS_ORDER + """
+    LIMIT %s, 1
+) r
+LEFT JOIN LATERAL (
+    SELECT location, date, start_time, end_time, description
+    FROM line_trip_details
+    WHERE trip_id = r.trip_id
+    ORDER BY date, start_time
+    LIMIT %s
+) d ON TRUE
+"""
+TRIP_DETAILS_QUERY = """
+SELECT
+    location,
+    date,
+    start_time,
+    end_time,
+    description,
+    (SELECT COUNT(*) FROM line_trip_details c WHERE c.trip_id = %s) AS detail_count
+FROM line_trip_details
+WHERE trip_id = %s
+ORDER BY date, start_time
+LIMIT %s
+"""
+_DETAIL_COLUMNS = ('location', 'date', 'start_time', 'end_time', 'description')
+ITINERARY_DETAIL_LIMIT = 6
+_lateral_supported = True
+
+# 背景刷新的排行榜快照（共用快照儲存）筆數與有效秒數
+RANKED_TRIPS_SNAPSHOT_SIZE = int(os.environ.get('RANKED_TRIPS_SNAPSHOT_SIZE', '50'))
+RANKED_TRIPS_SNAPSHOT_MAX_AGE = int(os.environ.get('RANKED_TRIPS_SNAPSHOT_MAX_AGE', '900'))
+
+def _fetch_all(query, params):
+    connection = get_database_connection()
+    if not connection:
+        raise RuntimeError("資料庫連接失敗")
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall() or []
+    finally:
+        cursor.close()
+        connection.close()
+
+def _query_ranked_trips(limit):
+    return get_ranked_trips_after(None, limit)
+
+def _fresh_ranked_rows():
+    return snapshot_store.load('ranked_trips', RANKED_TRIPS_SNAPSHOT_MAX_AGE)
+
+def refresh_ranked_trips_snapshot():
+    """重新查詢排行榜前 N 名並更新快照（供排程工作呼叫）"""
+    rows = _query_ranked_trips(RANKED_TRIPS_SNAPSHOT_SIZE)
+    snapshot_store.save('ranked_trips', rows)
+    return {'rows': len(rows)}
+
+def get_ranked_trips(limit=10):
+    """取得排行榜前 limit 名行程：優先使用背景快照，沒有或過舊時才查詢資料庫"""
+    rows = _fresh_ranked_rows()
+    # 快照筆數不足上限代表已涵蓋全部行程
+    if rows is not None and (limit <= len(rows) or len(rows) < RANKED_TRIPS_SNAPSHOT_SIZE):
+        return rows[:limit]
+    try:
+        return _query_ranked_trips(limit)
+    except Exception as e:
+        logger.error(f"查詢排行榜失敗: {e}")
+        return []
+
+def _snapshot_ranked_trip(rank):
+    """從快照取第 rank 名：回傳 (快照是否涵蓋該名次, 行程或 None)"""
+    rows = _fresh_ranked_rows()
+    if rows is not None and (rank <= len(rows) or len(rows) < RANKED_TRIPS_SNAPSHOT_SIZE):
+        return True, (rows[rank - 1] if rank <= len(rows) else None)
+    return False, None
+
+def get_ranked_trip(rank):
+    """取得第 rank 名行程，找不到時回傳 None"""
+    rank = int(rank)
+    if rank < 1:
+        return None
+    covered, trip = _snapshot_ranked_trip(rank)
+    if covered:
+        return trip
+    try:
+        rows = _fetch_all(RANKED_TRIP_AT_QUERY, (rank - 1,))
+        if rows:
+            return rows[0]
+        # 名次超過有統計資料的行程數，換算成沒有統計資料行程中的位置
+        ranked = _fetch_all(RANKED_TRIPS_COUNT_QUERY, ())[0]['total']
+        rows = _fetch_all(UNRANKED_TRIP_AT_QUERY, (rank - 1 - ranked,)) if rank > ranked else []
+        return rows[0] if rows else None
+    except Exception as e:
+        logger.error(f"查詢第{rank}名行程失敗: {e}")
+        return None
+
+def get_ranked_trips_at(ranks):
+    """一次取得多個名次的行程：回傳 {名次: 行程}，找不到的名次不在結果中
+
+    名次是排序後的位置而不是資料欄位，無法以 IN 查詢；改為取前 max(ranks) 名
+    （快照涵蓋時不查詢，否則沿排序索引讀取一次）
+    """
+    ranks = sorted({int(rank) for rank in ranks if int(rank) >= 1})
+    if not ranks:
+        return {}
+    rows = get_ranked_trips(ranks[-1])
+    return {rank: rows[rank - 1] for rank in ranks if rank <= len(rows)}
+
+def get_ranked_trips_after(key, limit):
+    """取得排序鍵 key（見 pagination.ranking_key）之後的 limit 筆排行資料，key 為 None 時從第一名開始"""
+    limit = int(limit)
+    if key is None or key[0] == 0:
+        if key is None:
+            rows = _fetch_all(RANKED_TRIPS_QUERY, (limit,))
+        else:
+            popularity, favorites, shares, trip_id = key[1:]
+            rows = _fetch_all(RANKED_TRIPS_AFTER_QUERY, (
+                popularity, popularity, popularity, favorites, favorites, shares, shares, trip_id, limit
+            ))
+        if len(rows) >= limit:
+            return rows
+        # 有統計資料的行程已列完，接續沒有統計資料的行程
+        rows += _fetch_all(UNRANKED_TRIPS_QUERY, (limit - len(rows),))
+        return rows
+    return _fetch_all(UNRANKED_TRIPS_AFTER_QUERY, (key[1], limit))
+
+def _split_detail_rows(rows):
+    """把每列都帶著行程欄位的查詢結果拆成 (明細列表, 明細總數)"""
+    # 沒有明細時 LEFT JOIN 仍會回傳一列，明細欄位皆為 NULL
+    details = [
+        {column: row[column] for column in _DETAIL_COLUMNS} for row in rows
+        if any(row[column] is not None for column in _DETAIL_COLUMNS)
+    ]
+    # 外層不保證保留子查詢的順序，筆數很少，在這裡依 date, start_time 重排（NULL 在前，同 MySQL）
+    details.sort(key=lambda d: (d['date'] is not None, d['date'], d['start_time'] is not None, d['start_time']))
+    return details, (rows[0]['detail_count'] or 0) if rows else 0
+
+def get_trip_details(trip_id, limit=ITINERARY_DETAIL_LIMIT):
+    """取得行程的前 limit 筆明細與明細總數（一次查詢）"""
+    rows = _fetch_all(TRIP_DETAILS_QUERY, (trip_id, trip_id, int(limit)))
+    return [{column: row[column] for column in _DETAIL_COLUMNS} for row in rows], \
+        (rows[0]['detail_count'] if rows else 0)
+
+def get_ranked_trip_details(rank, limit=ITINERARY_DETAIL_LIMIT):
+    """取得第 rank 名行程與其前 limit 筆明細：回傳 (行程, 明細列表, 明細總數)，找不到行程時行程為 None
+
+    快照已有該名次時只查明細；否則以一次 LATERAL 查詢同時取回行程與明細，
+    資料庫不支援 LATERAL 或名次落在沒有統計資料的行程時，改為先查名次再查明細
+    """
+    global _lateral_supported
+    rank = int(rank)
+    if rank < 1:
+        return None, [], 0
+
+    covered, trip = _snapshot_ranked_trip(rank)
+    if not covered and _lateral_supported:
+        try:
+            rows = _fetch_all(RANKED_TRIP_DETAILS_QUERY, (rank - 1, int(limit)))
+            if rows:
+                trip = {key: value for key, value in rows[0].items() if key not in _DETAIL_COLUMNS and key != 'detail_count'}
+                details, detail_count = _split_detail_rows(rows)
+                return trip, details, detail_count
+        except Exception as e:
+            # 1064：語法錯誤（MySQL 8.0.14 以前不支援 LATERAL），之後不再嘗試
+            if getattr(e, 'errno', None) == 1064:
+                _lateral_supported = False
+                logger.warning("資料庫不支援 LATERAL，詳細行程改用兩次查詢")
+            else:
+                logger.error(f"查詢第{rank}名詳細行程失敗: {e}")
+    if not covered:
+        trip = get_ranked_trip(rank)
+    if not trip:
+        return None, [], 0
+    details, detail_count = get_trip_details(trip['trip_id'], limit)
+    return trip, details, detail_count
+
 ## 已移除未使用的 get_leaderboard_rank_details 函式
 
 ## 已移除未使用的 get_simple_itinerary_by_rank 函式
 
 # 收藏功能：資料庫持久化
+_user_favorites_table_ready = False
+
 def ensure_user_favorites_table_exists(connection):
+    """確認 user_favorites 表存在（每個程序成功一次後就不再執行 DDL）"""
+    global _user_favorites_table_ready
+    if _user_favorites_table_ready:
+        return True
     try:
         cursor = connection.cursor()
         cursor.execute(
@@ -88,98 +357,112 @@ def ensure_user_favorites_table_exists(connection):
             CREATE TABLE IF NOT EXISTS user_favorites (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 line_user_id VARCHAR(128) NOT NULL,
-                rank INT NOT NULL,
+                `rank` INT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY uniq_user_rank (line_user_id, rank)
+                UNIQUE KEY uniq_user_rank (line_user_id, `rank`)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
             """
         )
         cursor.close()
+        _user_favorites_table_ready = True
         return True
     except Exception as e:
         logger.error(f"建立 user_favorites 表失敗: {e}")
         return False
 
-def add_user_favorite_db(line_user_id: str, rank: int) -> bool:
-    """新增收藏，若已存在則回傳 False"""
+FAVORITES_WRITE_CHUNK = 500
+# {rows} 依批次筆數展開為 (%s, %s), (%s, %s), ...
+FAVORITES_UPSERT_QUERY = (
+    "INSERT INTO user_favorites (line_user_id, `rank`) VALUES {rows} "
+    "ON DUPLICATE KEY UPDATE `rank` = VALUES(`rank`)"
+)
+FAVORITES_DELETE_QUERY = "DELETE FROM user_favorites WHERE (line_user_id, `rank`) IN ({rows})"
+
+def _favorite_rows(chunk):
+    return ", ".join(["(%s, %s)"] * len(chunk)), [value for user_id, rank in chunk for value in (user_id, int(rank))]
+
+def apply_user_favorite_changes(adds, removes):
+    """批次寫入收藏變更：adds / removes 為 (line_user_id, rank) 列表，
+    以多列 INSERT ... ON DUPLICATE KEY 與 DELETE ... IN 在同一個交易內完成，失敗時丟出例外"""
+    connection = get_database_connection()
+    if not connection:
+        raise RuntimeError("資料庫連接失敗")
     try:
-        connection = get_database_connection()
-        if not connection:
-            return False
         if not ensure_user_favorites_table_exists(connection):
-            return False
-
+            raise RuntimeError("user_favorites 表不存在")
         cursor = connection.cursor()
         try:
-            cursor.execute(
-                """
-                INSERT INTO user_favorites (line_user_id, rank)
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE rank = VALUES(rank)
-                """,
-                (line_user_id, int(rank))
-            )
-            # 插入或更新都視為成功
-            inserted = True
+            connection.start_transaction()
+            for query, changes in ((FAVORITES_UPSERT_QUERY, adds), (FAVORITES_DELETE_QUERY, removes)):
+                for i in range(0, len(changes), FAVORITES_WRITE_CHUNK):
+                    rows, params = _favorite_rows(changes[i:i + FAVORITES_WRITE_CHUNK])
+                    cursor.execute(query.format(rows=rows), params)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
         finally:
             cursor.close()
-            connection.close()
+    finally:
+        connection.close()
 
-        return inserted
-    except Exception as e:
-        logger.error(f"新增收藏失敗: {e}")
-        return False
+# 操作日誌：由 operation_log_sink 累積後批次寫入
+OPERATION_LOG_COLUMNS = (
+    'unified_user_id', 'module_id', 'operation_type', 'operation_data',
+    'result_status', 'error_message', 'created_at',
+)
+OPERATION_LOG_WRITE_CHUNK = 500
+# {rows} 依批次筆數展開為 (%s, ...), (%s, ...), ...
+OPERATION_LOGS_INSERT_QUERY = (
+    "INSERT INTO user_operation_logs (" + ", ".join(OPERATION_LOG_COLUMNS) + ") VALUES {rows}"
+)
 
-def get_user_favorites_db(line_user_id: str):
-    """取得使用者收藏的名次列表（升冪排序）"""
+def insert_user_operation_logs(records):
+    """批次寫入操作日誌：records 為含 OPERATION_LOG_COLUMNS 各欄的 dict 列表，
+    以多列 INSERT 在同一個交易內完成，失敗時丟出例外"""
+    connection = get_database_connection()
+    if not connection:
+        raise RuntimeError("資料庫連接失敗")
     try:
-        connection = get_database_connection()
-        if not connection:
-            return []
-        if not ensure_user_favorites_table_exists(connection):
-            return []
-
         cursor = connection.cursor()
         try:
-            cursor.execute(
-                """
-                SELECT rank FROM user_favorites
-                WHERE line_user_id = %s
-                ORDER BY rank ASC
-                """,
-                (line_user_id,)
-            )
-            rows = cursor.fetchall()
+            connection.start_transaction()
+            row = "(" + ", ".join(["%s"] * len(OPERATION_LOG_COLUMNS)) + ")"
+            for i in range(0, len(records), OPERATION_LOG_WRITE_CHUNK):
+                chunk = records[i:i + OPERATION_LOG_WRITE_CHUNK]
+                params = [record.get(column) for record in chunk for column in OPERATION_LOG_COLUMNS]
+                cursor.execute(OPERATION_LOGS_INSERT_QUERY.format(rows=", ".join([row] * len(chunk))), params)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
         finally:
             cursor.close()
-            connection.close()
-
-        return [int(r[0]) for r in rows]
-    except Exception as e:
-        logger.error(f"取得收藏清單失敗: {e}")
-        return []
+    finally:
+        connection.close()
 
-def remove_user_favorite_db(line_user_id: str, rank: int) -> bool:
-    """移除使用者的單一收藏名次。"""
+def get_user_favorites_db(line_user_id: str):
+    """取得使用者收藏的名次列表（升冪排序）；連線或查詢失敗時丟出例外，不以空清單代替"""
+    connection = get_database_connection()
+    if not connection:
+        raise RuntimeError("資料庫連接失敗")
     try:
-        connection = get_database_connection()
-        if not connection:
-            return False
         if not ensure_user_favorites_table_exists(connection):
-            return False
-
+            raise RuntimeError("user_favorites 表無法使用")
         cursor = connection.cursor()
         try:
             cursor.execute(
-                "DELETE FROM user_favorites WHERE line_user_id = %s AND rank = %s",
-                (line_user_id, int(rank))
+                """
+                SELECT `rank` FROM user_favorites
+                WHERE line_user_id = %s
+                ORDER BY `rank` ASC
+                """,
+                (line_user_id,)
             )
-            affected = cursor.rowcount
+            rows = cursor.fetchall()
         finally:
             cursor.close()
-            connection.close()
+    finally:
+        connection.close()
 
-        return affected > 0
-    except Exception as e:
-        logger.error(f"移除收藏失敗: {e}")
-        return False
+    return [int(r[0]) for r in rows]
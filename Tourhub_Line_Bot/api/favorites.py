@@ -0,0 +1,151 @@
+"""
+收藏資料存取（排行榜名次收藏）
+- 收藏的讀寫都經過這裡：寫入交給 favorites_buffer 批次寫入，讀取經過每位使用者一份的有界快取
+- 快取內容為「資料庫 + 尚未寫入的變更」後的收藏集合；加入 / 移除時直接更新快取（write-through），
+  只有未命中或超過 FAVORITES_CACHE_TTL 秒時才讀資料庫
+- 命中率記錄在 favorites_cache 指標（hit / miss / expired）
+- 讀資料庫失敗時不回填快取（丟出例外），下次查看會重新讀取，不會把空清單快取 TTL 秒
+- 多個程序同時運作時，其他程序的變更最多延遲 TTL 秒才會看到
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from api import metrics
+from api import favorites_buffer
+
+logger = logging.getLogger(__name__)
+
+FAVORITES_CACHE_SIZE = int(os.environ.get('FAVORITES_CACHE_SIZE', '2048'))
+FAVORITES_CACHE_TTL = float(os.environ.get('FAVORITES_CACHE_TTL', '300'))
+
+
+class FavoritesCache:
+    """line_user_id → 收藏名次集合 的有界 LRU，項目超過 ttl 秒視為過期"""
+
+    def __init__(self, maxsize: int = FAVORITES_CACHE_SIZE, ttl: float = FAVORITES_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # line_user_id → (到期時間, frozenset)
+        # 每次寫入（含緩衝寫入資料庫）遞增；讀資料庫期間有寫入時不回填，避免蓋掉較新的內容
+        self.write_seq = 0
+
+    def get(self, line_user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(line_user_id)
+            if entry is not None and entry[0] <= now:
+                del self._entries[line_user_id]
+                label, ranks = 'expired', None
+            elif entry is not None:
+                self._entries.move_to_end(line_user_id)
+                label, ranks = 'hit', entry[1]
+            else:
+                label, ranks = 'miss', None
+        metrics.incr('favorites_cache', label=label)
+        return ranks
+
+    def fill(self, line_user_id, ranks, seq):
+        """以讀取開始時的 write_seq 回填；期間有寫入則放棄"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if seq != self.write_seq:
+                return
+            self._put(line_user_id, frozenset(ranks))
+
+    def apply(self, line_user_id, rank, added: bool):
+        """寫入時更新快取中的集合（未快取的使用者不需處理）"""
+        with self._lock:
+            self.write_seq += 1
+            entry = self._entries.get(line_user_id)
+            if entry is None:
+                return
+            ranks = entry[1] | {rank} if added else entry[1] - {rank}
+            self._put(line_user_id, ranks, expires_at=entry[0])
+
+    def _put(self, line_user_id, ranks, expires_at=None):
+        self._entries[line_user_id] = (expires_at or time.monotonic() + self.ttl, ranks)
+        self._entries.move_to_end(line_user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def bump(self):
+        """緩衝寫入資料庫後呼叫：之前開始的讀取可能同時錯過資料庫與 overlay，不回填"""
+        with self._lock:
+            self.write_seq += 1
+
+    def invalidate(self, line_user_id=None):
+        with self._lock:
+            self.write_seq += 1
+            if line_user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(line_user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# add / remove 的結果
+CHANGED = 'changed'        # 已加入 / 已移除
+UNCHANGED = 'unchanged'    # 原本就在 / 不在收藏內
+PENDING = 'pending'        # 寫入資料庫失敗，變更留在緩衝稍後重試
+
+_cache = FavoritesCache()
+favorites_buffer.on_flush(_cache.bump)
+
+
+def _load(line_user_id):
+    """快取中的收藏集合；未命中時讀資料庫，讀取失敗時丟出例外且不回填"""
+    ranks = _cache.get(line_user_id)
+    if ranks is None:
+        seq = _cache.write_seq
+        ranks = frozenset(favorites_buffer.get_favorites(line_user_id))
+        _cache.fill(line_user_id, ranks, seq)
+    return ranks
+
+
+def _contains(line_user_id, rank):
+    """rank 是否在收藏內；讀不到目前收藏時回傳 None（仍照常記下變更）"""
+    try:
+        return rank in _load(line_user_id)
+    except Exception as e:
+        logger.error(f"讀取收藏清單失敗: {e}")
+        return None
+
+
+def get_favorites(line_user_id):
+    """使用者收藏的名次列表（升冪）"""
+    return sorted(_load(line_user_id))
+
+
+def add(line_user_id, rank) -> str:
+    """加入收藏，回傳 CHANGED / UNCHANGED（原本就在收藏內）/ PENDING（寫入失敗，稍後重試）"""
+    rank = int(rank)
+    present = _contains(line_user_id, rank)
+    # 先更新快取：即使立即寫入失敗，變更仍留在緩衝中稍後重試
+    _cache.apply(line_user_id, rank, added=True)
+    if not favorites_buffer.record(line_user_id, rank, favorites_buffer.ADD):
+        return PENDING
+    return UNCHANGED if present else CHANGED
+
+
+def remove(line_user_id, rank) -> str:
+    """移除收藏，回傳 CHANGED / UNCHANGED（原本就不在收藏內）/ PENDING（寫入失敗，稍後重試）"""
+    rank = int(rank)
+    present = _contains(line_user_id, rank)
+    # 快取可能落後其他程序的寫入，不在快取中的名次也照樣刪除
+    _cache.apply(line_user_id, rank, added=False)
+    if not favorites_buffer.record(line_user_id, rank, favorites_buffer.REMOVE):
+        return PENDING
+    return UNCHANGED if present is False else CHANGED
+
+
+def invalidate(line_user_id=None):
+    """捨棄快取（例如其他來源直接修改了 user_favorites）"""
+    _cache.invalidate(line_user_id)
@@ -0,0 +1,256 @@
+"""
+收藏寫入緩衝（write-behind）
+- 加入 / 移除收藏先記在程序內，同一 (使用者, 名次) 的多次切換只保留最後一次
+- 背景執行緒每 FAVORITES_FLUSH_INTERVAL_MS 毫秒、或累積 FAVORITES_FLUSH_BATCH 筆時，
+  以多列 INSERT ... ON DUPLICATE KEY 與 DELETE ... IN 一次寫入（database.apply_user_favorite_changes）
+- 讀取時先取尚未寫入（含寫入中）的變更，再讀資料庫並套用，使用者一定看得到自己的操作
+  （先讀資料庫的話，兩者之間完成的寫入會同時不在兩邊）
+- 每次寫入結束（成功或失敗）通知 on_flush 註冊的回呼，讓讀取快取捨棄與寫入重疊的回填
+- 同步寫入失敗時不丟出例外：變更留在緩衝，由背景執行緒逐步拉長間隔重試，record() 回傳 False
+- 寫入失敗的變更放回緩衝等下次重試；程序結束時同步寫入，仍失敗則存到 FAVORITES_SPILL_PATH，
+  下次啟動時重新載入
+- 預設 FAVORITES_WRITE_BEHIND=false：每次操作立即以同一路徑同步寫入（serverless 程序回應後可能被凍結，
+  背景執行緒不一定有機會寫入）；只在長駐程序的部署設為 true
+"""
+
+import os
+import json
+import atexit
+import logging
+import tempfile
+import threading
+
+from api import metrics
+from api.lazy_import import lazy_callable
+
+logger = logging.getLogger(__name__)
+
+FAVORITES_WRITE_BEHIND = os.environ.get('FAVORITES_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+FAVORITES_FLUSH_INTERVAL_MS = int(os.environ.get('FAVORITES_FLUSH_INTERVAL_MS', '300'))
+FAVORITES_FLUSH_BATCH = int(os.environ.get('FAVORITES_FLUSH_BATCH', '50'))
+FAVORITES_SPILL_PATH = (
+    os.environ.get('FAVORITES_SPILL_PATH') or os.path.join(tempfile.gettempdir(), 'tourhub_favorites_spill.jsonl')
+)
+# 程序結束時的寫入重試次數
+FAVORITES_SHUTDOWN_ATTEMPTS = 3
+
+ADD = 'add'
+REMOVE = 'remove'
+
+
+class FavoritesBuffer:
+    """收藏變更緩衝：writer(adds, removes) 批次寫入，reader(line_user_id) 讀取資料庫中的名次列表"""
+
+    def __init__(self, writer, reader, interval_ms=FAVORITES_FLUSH_INTERVAL_MS,
+                 batch_size=FAVORITES_FLUSH_BATCH, write_behind=FAVORITES_WRITE_BEHIND,
+                 spill_path=FAVORITES_SPILL_PATH):
+        self._writer = writer
+        self._reader = reader
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.write_behind = write_behind
+        self.spill_path = spill_path
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}    # line_user_id → {名次: 操作}
+        self._inflight = {}   # 寫入中的變更，寫入完成前讀取仍需套用
+        self._size = 0
+        self._thread = None
+        self._flush_listeners = []
+        self._load_spill()
+
+    def __len__(self):
+        return self._size
+
+    # ---- 讀取 ----
+
+    def _overlay(self, line_user_id):
+        with self._lock:
+            changes = dict(self._inflight.get(line_user_id, ()))
+            changes.update(self._pending.get(line_user_id, ()))
+        return changes
+
+    def get_favorites(self, line_user_id):
+        """使用者收藏的名次列表（升冪），已套用尚未寫入的變更"""
+        # 先取變更再讀資料庫：讀取期間寫完的變更已在資料庫中，重複套用結果相同
+        changes = self._overlay(line_user_id)
+        ranks = set(self._reader(line_user_id))
+        for rank, op in changes.items():
+            if op == ADD:
+                ranks.add(rank)
+            else:
+                ranks.discard(rank)
+        return sorted(ranks)
+
+    # ---- 寫入 ----
+
+    def on_flush(self, func):
+        """註冊寫入結束後的回呼（寫入中的變更已離開 overlay）"""
+        self._flush_listeners.append(func)
+        return func
+
+    def record(self, line_user_id, rank, op) -> bool:
+        """記下一筆變更（不檢查目前是否已收藏）；同步寫入失敗、變更留在緩衝等待重試時回傳 False"""
+        rank = int(rank)
+        with self._lock:
+            ranks = self._pending.setdefault(line_user_id, {})
+            if rank not in ranks:
+                self._size += 1
+            ranks[rank] = op
+            size = self._size
+        metrics.incr('favorites_buffer', label=op)
+
+        if not self.write_behind:
+            try:
+                self.flush()
+                return True
+            except Exception as e:
+                # 請求路徑上不因寫入失敗而中斷，變更留在緩衝由背景執行緒重試
+                logger.error(f"寫入收藏失敗（待寫入 {self._size} 筆）: {e}")
+                self._ensure_thread()
+                return False
+        self._ensure_thread()
+        if size >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """寫入目前緩衝的所有變更，回傳寫入筆數；失敗時變更放回緩衝並丟出例外"""
+        with self._flush_lock:
+            with self._lock:
+                inflight, self._pending, self._size = self._pending, {}, 0
+                self._inflight = inflight
+            if not inflight:
+                return 0
+
+            adds = [(user_id, rank) for user_id, ranks in inflight.items() for rank, op in ranks.items() if op == ADD]
+            removes = [(user_id, rank) for user_id, ranks in inflight.items() for rank, op in ranks.items() if op == REMOVE]
+            try:
+                self._writer(adds, removes)
+            except Exception:
+                self._restore(inflight)
+                metrics.incr('favorites_flush', label='error')
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                for listener in self._flush_listeners:
+                    listener()
+
+        metrics.incr('favorites_flush', label='ok')
+        metrics.observe('favorites_flush_ops', len(adds) + len(removes))
+        return len(adds) + len(removes)
+
+    def _restore(self, changes):
+        # 放回緩衝；寫入期間又有新操作的名次以新操作為準
+        with self._lock:
+            for user_id, ranks in changes.items():
+                pending = self._pending.setdefault(user_id, {})
+                for rank, op in ranks.items():
+                    if rank not in pending:
+                        pending[rank] = op
+                        self._size += 1
+
+    # ---- 背景寫入 ----
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='favorites-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if not self._size:
+                continue
+            try:
+                self.flush()
+                delay = self.interval
+            except Exception as e:
+                # 資料庫暫時無法使用時逐步拉長間隔，最多 30 秒
+                delay = min(max(delay * 2, 1.0), 30.0)
+                logger.error(f"收藏寫入失敗，{delay:.1f} 秒後重試（待寫入 {self._size} 筆）: {e}")
+
+    # ---- 程序結束 ----
+
+    def close(self):
+        """同步寫入所有變更；多次失敗時存到 spill 檔，下次啟動時載入"""
+        for attempt in range(1, FAVORITES_SHUTDOWN_ATTEMPTS + 1):
+            if not self._size:
+                return
+            try:
+                self.flush()
+                return
+            except Exception as e:
+                logger.error(f"結束前寫入收藏失敗（第 {attempt} 次）: {e}")
+        self._spill()
+
+    def _spill(self):
+        with self._lock:
+            changes = [
+                {'user': user_id, 'rank': rank, 'op': op}
+                for user_id, ranks in self._pending.items() for rank, op in ranks.items()
+            ]
+        if not changes:
+            return
+        try:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for change in changes:
+                    f.write(json.dumps(change, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            logger.warning(f"⚠️ {len(changes)} 筆收藏變更已暫存至 {self.spill_path}")
+        except OSError as e:
+            logger.error(f"暫存收藏變更失敗，{len(changes)} 筆變更遺失: {e}")
+
+    def _load_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        try:
+            with open(self.spill_path, encoding='utf-8') as f:
+                changes = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"讀取暫存收藏變更失敗: {e}")
+            return
+        # 檔案依時間附加，後面的操作覆蓋前面的
+        for change in changes:
+            ranks = self._pending.setdefault(change['user'], {})
+            if change['rank'] not in ranks:
+                self._size += 1
+            ranks[change['rank']] = change['op']
+        if changes:
+            logger.info(f"📥 載入 {len(changes)} 筆暫存收藏變更")
+            if self.write_behind:
+                self._ensure_thread()
+                self._wakeup.set()
+
+
+_buffer = FavoritesBuffer(
+    writer=lazy_callable('api.database', 'apply_user_favorite_changes'),
+    reader=lazy_callable('api.database', 'get_user_favorites_db'),
+)
+atexit.register(_buffer.close)
+
+
+def on_flush(func):
+    return _buffer.on_flush(func)
+
+
+def record(line_user_id, rank, op) -> bool:
+    return _buffer.record(line_user_id, rank, op)
+
+
+def get_favorites(line_user_id):
+    return _buffer.get_favorites(line_user_id)
+
+
+def flush() -> int:
+    return _buffer.flush()
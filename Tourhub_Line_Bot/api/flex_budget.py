@@ -0,0 +1,214 @@
+"""
+Flex Message 大小控管模組
+- 壓縮：移除與 LINE 預設值相同的屬性、None 值，並把重複的 margin 合併成父層 spacing
+  （未知欄位由 line_sender.sanitize_flex 先行移除）
+- 估算：以實際 JSON 位元組數檢查 LINE 限制（bubble 30KB、carousel 50KB / 12 張、
+  altText 1500 字、每次回覆 5 則）
+- 超過限制時自動分頁：carousel 拆成多則訊息，過大的 bubble 依 body 內容拆成多張
+"""
+
+import os
+import json
+import logging
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# LINE Messaging API 限制（保守以 1000 位元組為 1KB）
+FLEX_BUBBLE_MAX_BYTES = int(os.environ.get('FLEX_BUBBLE_MAX_BYTES', '30000'))
+FLEX_CAROUSEL_MAX_BYTES = int(os.environ.get('FLEX_CAROUSEL_MAX_BYTES', '50000'))
+FLEX_CAROUSEL_MAX_BUBBLES = 12
+FLEX_ALT_TEXT_MAX_CHARS = 1500
+LINE_MAX_MESSAGES_PER_REPLY = 5
+
+# 與 LINE 預設值相同、可安全省略的屬性（只列不受父層影響的預設值）
+_DEFAULT_PROPERTIES = {
+    'bubble': {'size': 'mega', 'direction': 'ltr'},
+    'box': {'position': 'relative'},
+    'text': {'size': 'md', 'weight': 'regular', 'style': 'normal', 'decoration': 'none',
+             'wrap': False, 'gravity': 'top', 'position': 'relative'},
+    'button': {'style': 'link', 'height': 'md', 'gravity': 'top', 'position': 'relative'},
+    'image': {'size': 'md', 'aspectRatio': '1:1', 'aspectMode': 'fit', 'align': 'center',
+              'gravity': 'top', 'position': 'relative'},
+    'icon': {'size': 'md', 'aspectRatio': '1:1', 'position': 'relative'},
+    'span': {'size': 'md', 'weight': 'regular', 'style': 'normal', 'decoration': 'none'},
+}
+
+_EMPTY_DEFAULTS = {}
+# 子元件 flex 預設值依父層 box 的 layout 而定
+_CHILD_FLEX_DEFAULTS = {'horizontal': 1, 'baseline': 1, 'vertical': 0}
+
+
+def encode_json(obj) -> bytes:
+    """以最快的可用編碼器輸出緊湊 JSON 位元組"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def payload_size(obj) -> int:
+    return len(encode_json(obj))
+
+
+def _hoist_margins(box):
+    """box 內第一個元件沒有 margin、其餘元件 margin 都相同時，改用 box 的 spacing
+    （spacing 只作用在元件之間，效果與逐一設定 margin 相同）"""
+    contents = box.get('contents')
+    if 'spacing' in box or type(contents) is not list or len(contents) < 3:
+        return
+    first = contents[0]
+    if not isinstance(first, dict) or 'margin' in first:
+        return
+    margin = None
+    for child in contents[1:]:
+        # 凍結的共用子樹不可修改
+        if type(child) is not dict:
+            return
+        value = child.get('margin')
+        if value is None or (margin is not None and value != margin):
+            return
+        margin = value
+    box['spacing'] = margin
+    for child in contents[1:]:
+        del child['margin']
+
+
+def _drop_default_child_flex(box):
+    default = _CHILD_FLEX_DEFAULTS.get(box.get('layout'))
+    contents = box.get('contents')
+    if default is None or type(contents) is not list:
+        return
+    for child in contents:
+        if type(child) is dict and type(child.get('flex')) is int and child['flex'] == default:
+            del child['flex']
+
+
+def compact_flex(payload):
+    """就地壓縮 Flex payload，回傳同一物件（凍結的共用子樹已預先壓縮，直接略過）"""
+    stack = [payload]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        node = pop()
+        node_type = type(node)
+        if node_type is dict:
+            defaults = _DEFAULT_PROPERTIES.get(node.get('type'), _EMPTY_DEFAULTS)
+            for key in [k for k, v in node.items() if v is None or (k in defaults and defaults[k] == v)]:
+                del node[key]
+            if node.get('type') == 'box':
+                _drop_default_child_flex(node)
+                _hoist_margins(node)
+            for value in node.values():
+                if type(value) is dict or type(value) is list:
+                    push(value)
+        elif node_type is list:
+            for child in node:
+                if type(child) is dict or type(child) is list:
+                    push(child)
+    return payload
+
+
+def truncate_alt_text(alt_text: str) -> str:
+    if alt_text and len(alt_text) > FLEX_ALT_TEXT_MAX_CHARS:
+        return alt_text[:FLEX_ALT_TEXT_MAX_CHARS - 1] + '…'
+    return alt_text
+
+
+def split_bubble(bubble: dict) -> list:
+    """把過大的 bubble 依 body 內容拆成多張（header 每張保留，footer 只放最後一張）"""
+    body = bubble.get('body')
+    contents = body.get('contents') if isinstance(body, dict) else None
+    if not contents or len(contents) < 2:
+        logger.warning("bubble 超過大小限制且無法拆分")
+        return [bubble]
+
+    shell = {k: v for k, v in bubble.items() if k not in ('body', 'footer')}
+    base_size = payload_size(shell) + payload_size({k: v for k, v in body.items() if k != 'contents'})
+    footer_size = payload_size(bubble['footer']) if bubble.get('footer') else 0
+
+    pages = []
+    chunk = []
+    chunk_size = base_size
+    for item in contents:
+        item_size = payload_size(item) + 1
+        if chunk and chunk_size + item_size > FLEX_BUBBLE_MAX_BYTES - footer_size:
+            pages.append(chunk)
+            chunk = []
+            chunk_size = base_size
+        chunk.append(item)
+        chunk_size += item_size
+    pages.append(chunk)
+
+    bubbles = []
+    for index, chunk in enumerate(pages):
+        page = dict(shell)
+        page['body'] = dict(body, contents=chunk)
+        if index == len(pages) - 1 and bubble.get('footer'):
+            page['footer'] = bubble['footer']
+        bubbles.append(page)
+    return bubbles
+
+
+def _pack_carousels(bubbles: list) -> list:
+    """依張數與位元組上限把 bubble 分裝成多個 carousel"""
+    overhead = payload_size({'type': 'carousel', 'contents': []})
+    carousels = []
+    current = []
+    current_size = overhead
+    for bubble in bubbles:
+        size = payload_size(bubble) + 1
+        if current and (len(current) >= FLEX_CAROUSEL_MAX_BUBBLES or current_size + size > FLEX_CAROUSEL_MAX_BYTES):
+            carousels.append(current)
+            current = []
+            current_size = overhead
+        current.append(bubble)
+        current_size += size
+    if current:
+        carousels.append(current)
+    # 只有一張的頁面直接送 bubble
+    return [c[0] if len(c) == 1 else {'type': 'carousel', 'contents': c} for c in carousels]
+
+
+def prepare_flex_messages(alt_text: str, contents: dict, template: str = None) -> list:
+    """壓縮並檢查大小，回傳 [(alt_text, contents), ...]，超過限制時自動分成多則"""
+    template = template or alt_text
+    compact_flex(contents)
+    size = payload_size(contents)
+    metrics.observe('flex_payload_bytes', size, label=template)
+
+    if contents.get('type') == 'bubble':
+        if size <= FLEX_BUBBLE_MAX_BYTES:
+            return [(truncate_alt_text(alt_text), contents)]
+        bubbles = split_bubble(contents)
+    else:
+        bubbles = contents.get('contents') or []
+        if len(bubbles) <= FLEX_CAROUSEL_MAX_BUBBLES and size <= FLEX_CAROUSEL_MAX_BYTES:
+            return [(truncate_alt_text(alt_text), contents)]
+        expanded = []
+        for bubble in bubbles:
+            if payload_size(bubble) > FLEX_BUBBLE_MAX_BYTES:
+                expanded.extend(split_bubble(bubble))
+            else:
+                expanded.append(bubble)
+        bubbles = expanded
+
+    pages = [bubbles[0]] if len(bubbles) == 1 else _pack_carousels(bubbles)
+    if len(pages) > LINE_MAX_MESSAGES_PER_REPLY:
+        logger.warning(f"{template} 拆分後共 {len(pages)} 則，超過單次回覆上限，只送出前 {LINE_MAX_MESSAGES_PER_REPLY} 則")
+        metrics.incr('flex_pages_dropped', label=template, value=len(pages) - LINE_MAX_MESSAGES_PER_REPLY)
+        pages = pages[:LINE_MAX_MESSAGES_PER_REPLY]
+
+    metrics.incr('flex_split', label=template)
+    logger.info(f"✂️ {template} 超過 Flex 限制（{size} bytes），拆成 {len(pages)} 則")
+    if len(pages) == 1:
+        return [(truncate_alt_text(alt_text), pages[0])]
+    return [
+        (truncate_alt_text(f"{alt_text} ({index}/{len(pages)})"), page)
+        for index, page in enumerate(pages, 1)
+    ]
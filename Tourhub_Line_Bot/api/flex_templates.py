@@ -0,0 +1,355 @@
+"""
+宣告式 Flex 模板引擎
+- 模板以 dict / list 字面值宣告，動態位置放 Slot / Text / Each / Memo
+- 第一次產生時編譯：不含動態位置的子樹預先套用主題、清理欄位、壓縮後凍結共用，
+  每次呼叫只建立含動態欄位的節點
+- 以 @flex_template 註冊模板函式，create_simple_flex_message 依名稱查表；
+  cache=True 的模板（只依設定檔內容）整份凍結後，快取在該設定版本的衍生物件中
+"""
+
+import logging
+
+from api import config_store
+from api.theme import apply_modern_theme
+from api.flex_budget import compact_flex
+from api.line_sender import sanitize_node
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+# ---- 凍結的共用子樹 ----
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError("凍結的 Flex 子樹不可修改，請先 copy.deepcopy")
+
+
+class FrozenDict(dict):
+    """凍結的共用子樹：不可修改，copy.deepcopy 會得到可修改的一般 dict"""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """凍結的共用 list：不可修改，copy.deepcopy 會得到可修改的一般 list"""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def thaw(node):
+    """轉回可修改的一般 dict / list（深層複製）"""
+    if isinstance(node, dict):
+        return {k: thaw(v) for k, v in node.items()}
+    if isinstance(node, list):
+        return [thaw(v) for v in node]
+    return node
+
+
+def _copy_mutable(node):
+    # 複製一般 dict / list，凍結子樹維持共用
+    if type(node) is dict:
+        return {k: _copy_mutable(v) for k, v in node.items()}
+    if type(node) is list:
+        return [_copy_mutable(v) for v in node]
+    return node
+
+
+def _to_frozen(node):
+    if type(node) is dict:
+        return FrozenDict({k: _to_frozen(v) for k, v in node.items()})
+    if type(node) is list:
+        return FrozenList(_to_frozen(v) for v in node)
+    return node
+
+
+def is_frozen(node) -> bool:
+    return isinstance(node, (FrozenDict, FrozenList))
+
+
+def freeze(node, parent_key=None):
+    """套用主題、依 SDK 欄位清理並壓縮後凍結；node 需為含 type 的 Flex 節點
+    parent_key 為節點在父層所在的 key（主題規則會參考）"""
+    themed = apply_modern_theme(_copy_mutable(node), parent_key)
+    cleaned = sanitize_node(themed)
+    if cleaned is None:
+        raise ValueError(f"無法凍結未知類型的節點: {node.get('type') if isinstance(node, dict) else node!r}")
+    return _to_frozen(compact_flex(cleaned))
+
+
+def _freezable(node) -> bool:
+    if type(node) is dict:
+        return sanitize_node({'type': node.get('type')}) is not None
+    if type(node) is list:
+        return all(_freezable(v) or not isinstance(v, (dict, list)) for v in node)
+    return False
+
+
+def _freeze_static(node, parent_key):
+    """靜態子樹：可判斷類型的凍結共用，其餘（例如無 type 的樣式 dict）每次複製"""
+    if type(node) is list and _freezable(node):
+        return FrozenList(freeze(v, parent_key) if isinstance(v, dict) else v for v in node), False
+    if type(node) is dict and _freezable(node):
+        return freeze(node, parent_key), False
+    return node, isinstance(node, (dict, list))
+
+
+# ---- 動態位置 ----
+
+class Slot:
+    """以呼叫參數填入的值"""
+
+    def __init__(self, name, default=_MISSING):
+        self.name = name
+        self.default = default
+
+    def compile(self, parent_key):
+        name, default = self.name, self.default
+
+        def render(ctx):
+            value = ctx.get(name, default)
+            if value is _MISSING:
+                raise KeyError(f"模板缺少參數: {name}")
+            return value
+        return render
+
+
+class Text(Slot):
+    """以 str.format 組成的文字，例如 Text("🏆 第{rank}名")"""
+
+    def __init__(self, fmt):
+        super().__init__(fmt)
+
+    def compile(self, parent_key):
+        fmt = self.name
+        return lambda ctx: fmt.format_map(ctx)
+
+
+class Each:
+    """對參數中的每個元素套用子模板；放在 list 中時展開到該 list
+    元素為 dict 時其欄位可直接當參數使用，否則以 item 取用"""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+
+    def compile(self, parent_key):
+        name = self.name
+        item_render = _compile_render(self.spec, parent_key)
+
+        def render(ctx):
+            rendered = []
+            for item in ctx.get(name) or ():
+                item_ctx = dict(ctx, **item) if isinstance(item, dict) else dict(ctx, item=item)
+                rendered.append(item_render(item_ctx))
+            return rendered
+        return render
+
+
+class Memo:
+    """只依少數參數變化的子樹：每組參數值只產生一次並凍結共用
+    例如排行榜卡片的 header / footer 只依名次變化"""
+
+    def __init__(self, spec, *names, limit=256):
+        self.spec = spec
+        self.names = names
+        self.limit = limit
+
+    def compile(self, parent_key):
+        names, limit = self.names, self.limit
+        render = _compile_render(self.spec, parent_key)
+        cache = {}
+
+        def render_memo(ctx):
+            key = tuple(ctx.get(name) for name in names)
+            node = cache.get(key)
+            if node is None:
+                node = render({name: ctx.get(name) for name in names})
+                if isinstance(node, dict):
+                    node = freeze(node, parent_key)
+                if len(cache) >= limit:
+                    cache.clear()
+                cache[key] = node
+            return node
+        return render_memo
+
+
+_DYNAMIC_TYPES = (Slot, Each, Memo)
+
+
+def _has_dynamic(spec) -> bool:
+    if isinstance(spec, _DYNAMIC_TYPES):
+        return True
+    if isinstance(spec, dict):
+        return any(_has_dynamic(v) for v in spec.values())
+    if isinstance(spec, list):
+        return any(_has_dynamic(v) for v in spec)
+    return False
+
+
+def _compile_render(spec, parent_key):
+    """把模板宣告編譯成 render(ctx) 函式"""
+    if isinstance(spec, _DYNAMIC_TYPES):
+        return spec.compile(parent_key)
+
+    if not _has_dynamic(spec):
+        value, needs_copy = _freeze_static(spec, parent_key)
+        if needs_copy:
+            return lambda ctx: _copy_mutable(value)
+        return lambda ctx: value
+
+    if isinstance(spec, dict):
+        static_items = {}
+        copy_items = []
+        dynamic_items = []
+        for key, value in spec.items():
+            if _has_dynamic(value):
+                dynamic_items.append((key, _compile_render(value, key)))
+            else:
+                frozen, needs_copy = _freeze_static(value, key)
+                if needs_copy:
+                    copy_items.append((key, frozen))
+                else:
+                    static_items[key] = frozen
+
+        def render_dict(ctx):
+            node = dict(static_items)
+            for key, value in copy_items:
+                node[key] = _copy_mutable(value)
+            for key, render in dynamic_items:
+                node[key] = render(ctx)
+            return node
+        return render_dict
+
+    # list：Each 展開，其餘元素依序輸出
+    parts = []
+    for item in spec:
+        if isinstance(item, Each):
+            parts.append((True, item.compile(parent_key)))
+        elif _has_dynamic(item):
+            parts.append((False, _compile_render(item, parent_key)))
+        else:
+            frozen, needs_copy = _freeze_static(item, parent_key)
+            parts.append((False, (lambda ctx, v=frozen: _copy_mutable(v)) if needs_copy else (lambda ctx, v=frozen: v)))
+
+    def render_list(ctx):
+        node = []
+        for splice, render in parts:
+            if splice:
+                node.extend(render(ctx))
+            else:
+                node.append(render(ctx))
+        return node
+    return render_list
+
+
+class FlexTemplate:
+    """編譯後的模板（第一次產生時才編譯，避免冷啟動就載入 LINE SDK 的欄位定義）"""
+
+    def __init__(self, spec, parent_key=None):
+        self._spec = spec
+        self._parent_key = parent_key
+        self._render = None
+
+    def compile(self):
+        if self._render is None:
+            self._render = _compile_render(self._spec, self._parent_key)
+        return self._render
+
+    def render(self, ctx=None, **kwargs):
+        if kwargs:
+            ctx = dict(ctx or {}, **kwargs)
+        return (self._render or self.compile())(ctx or {})
+
+
+def compile_template(spec, parent_key=None) -> FlexTemplate:
+    return FlexTemplate(spec, parent_key)
+
+
+# ---- 模板註冊表 ----
+
+_TEMPLATE_CACHE_LIMIT = 256
+# 靜態模板快取是設定版本的衍生物件（見 api/config_store.py），與設定一起整份替換
+TEMPLATE_CACHE_ARTIFACT = 'static_templates'
+_templates = {}
+
+
+def flex_template(name: str, cache: bool = False):
+    """註冊模板函式；cache=True 表示輸出只依參數與設定檔決定，整份凍結後快取
+
+    cache=True 的模板函式會收到 config（產生時所用的設定版本），須從它讀取設定
+    """
+    def decorator(func):
+        _templates[name] = (func, cache)
+        return func
+    return decorator
+
+
+def get_template_names():
+    return list(_templates)
+
+
+def render_template(name: str, **kwargs):
+    """依名稱產生 Flex 內容，未註冊時回傳 None"""
+    entry = _templates.get(name)
+    if entry is None:
+        return None
+    func, cache = entry
+    if not cache:
+        return func(**kwargs)
+    return _render_cached(config_store.current(), name, func, kwargs)
+
+
+def _render_cached(snapshot, name, func, kwargs):
+    """以指定設定版本產生並寫入該版本的快取；舊版本的結果只會寫進已被替換的快取"""
+    template_cache = snapshot.artifacts.get(TEMPLATE_CACHE_ARTIFACT)
+    try:
+        key = (name, tuple(sorted(kwargs.items())))
+        result = template_cache.get(key, _MISSING) if template_cache is not None else _MISSING
+    except TypeError:
+        # 參數無法當作快取鍵時直接產生
+        return func(config=snapshot, **kwargs)
+    if result is _MISSING:
+        result = func(config=snapshot, **kwargs)
+        if type(result) is dict:
+            result = freeze(result)
+        if template_cache is not None:
+            if len(template_cache) >= _TEMPLATE_CACHE_LIMIT:
+                template_cache.clear()
+            template_cache[key] = result
+    return result
+
+
+def build_template_cache(snapshot, calls, preloaded=None) -> dict:
+    """為新的設定版本建立靜態模板快取：calls 為 (名稱, 參數) 清單，於替換前全部產生好
+
+    preloaded 為啟動快照中已凍結的內容（只適用於建立快照時的內建設定）
+    """
+    template_cache = dict(preloaded or {})
+    for name, kwargs in calls:
+        key = (name, tuple(sorted(kwargs.items())))
+        if key in template_cache or name not in _templates:
+            continue
+        result = _templates[name][0](config=snapshot, **kwargs)
+        template_cache[key] = freeze(result) if type(result) is dict else result
+    return template_cache
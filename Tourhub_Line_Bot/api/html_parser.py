@@ -0,0 +1,92 @@
+"""
+HTML 解析後端模組
+- 依安裝情況選用 selectolax / lxml，皆未安裝時回退 html.parser
+- 來源可指定只解析需要的子樹（SoupStrainer 或 selectolax CSS 預先擷取）
+- 解析結果一律為 BeautifulSoup 物件，既有的擷取邏輯不需改寫
+"""
+
+import os
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger(__name__)
+
+# auto / selectolax / lxml / html.parser
+HTML_PARSER_BACKEND = os.environ.get('HTML_PARSER_BACKEND', 'auto')
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as _SelectolaxParser
+    except ImportError:
+        _SelectolaxParser = None
+
+try:
+    import lxml  # noqa: F401
+    _HAS_LXML = True
+except ImportError:
+    _HAS_LXML = False
+
+_backend_override = None
+
+
+def available_backends():
+    """列出目前環境可用的解析後端（由快到慢）"""
+    backends = []
+    if _SelectolaxParser is not None:
+        backends.append('selectolax')
+    if _HAS_LXML:
+        backends.append('lxml')
+    backends.append('html.parser')
+    return backends
+
+
+def set_backend(name=None):
+    """強制指定解析後端（None 表示恢復設定值），供 benchmark 使用"""
+    global _backend_override
+    if name is not None and name not in available_backends():
+        raise ValueError(f"解析後端不可用: {name}")
+    _backend_override = name
+
+
+def resolve_backend() -> str:
+    """依覆寫值、環境變數與安裝情況決定解析後端"""
+    name = _backend_override or HTML_PARSER_BACKEND
+    backends = available_backends()
+    if name in backends:
+        return name
+    if name != 'auto':
+        logger.warning(f"解析後端 {name} 不可用，改用 {backends[0]}")
+    return backends[0]
+
+
+def _tree_builder(backend: str) -> str:
+    # selectolax 只負責擷取子樹，最終樹仍交給最快的 BeautifulSoup 建構器
+    if backend in ('selectolax', 'lxml') and _HAS_LXML:
+        return 'lxml'
+    return 'html.parser'
+
+
+def make_soup(content, parse_only=None, subtree_css: str = None) -> BeautifulSoup:
+    """解析 HTML 為 BeautifulSoup
+    - parse_only：只保留指定標籤（及其子孫）的子樹
+    - subtree_css：使用 selectolax 時先以 CSS 擷取子樹，再交給 BeautifulSoup
+      （選擇器結果不可互相巢狀，否則內容會重複）
+    """
+    backend = resolve_backend()
+    builder = _tree_builder(backend)
+
+    if backend == 'selectolax' and subtree_css:
+        tree = _SelectolaxParser(content)
+        fragment = ''.join(node.html or '' for node in tree.css(subtree_css))
+        return BeautifulSoup(fragment, builder)
+
+    if parse_only:
+        soup = BeautifulSoup(content, builder, parse_only=SoupStrainer(parse_only))
+        if soup.contents:
+            return soup
+        # 頁面結構與預期不同（例如沒有 body），退回完整解析
+        logger.info(f"子樹 {parse_only} 為空，改為完整解析")
+    return BeautifulSoup(content, builder)
@@ -0,0 +1,198 @@
+"""
+對外 HTTP 抓取模組
+- 共用 keep-alive Session（每個主機保留連線池）
+- 每個主機獨立的 token bucket 限流
+- ETag / Last-Modified 條件式請求，304 時直接重用快取的解析結果（空結果不快取，回傳副本）
+"""
+
+import os
+import copy
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 每個主機每秒可發出的請求數與可累積的突發量
+SCRAPER_RATE_PER_SEC = float(os.environ.get('SCRAPER_RATE_PER_SEC', '1.0'))
+SCRAPER_BURST = int(os.environ.get('SCRAPER_BURST', '3'))
+# 取不到 token 時最多等待秒數（有快取時不等待，直接回傳舊結果）
+SCRAPER_MAX_WAIT = float(os.environ.get('SCRAPER_MAX_WAIT', '5'))
+# 距離上次驗證未滿此秒數時，不發出請求直接使用快取
+SCRAPER_REVALIDATE_SECONDS = float(os.environ.get('SCRAPER_REVALIDATE_SECONDS', '30'))
+
+
+class RateLimitedError(Exception):
+    """主機限流中且沒有可用快取"""
+
+
+class TokenBucket:
+    """簡單的 token bucket 限流器"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def try_acquire(self) -> bool:
+        """立即嘗試取得一個 token"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, max_wait: float) -> bool:
+        """等待直到取得 token，超過 max_wait 秒則放棄"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class _CacheEntry:
+    __slots__ = ('etag', 'last_modified', 'content', 'validated_at', 'parsed')
+
+    def __init__(self):
+        self.etag = None
+        self.last_modified = None
+        self.content = None
+        self.validated_at = 0.0
+        self.parsed = {}
+
+
+_session = None
+_session_lock = threading.Lock()
+_buckets = {}
+_buckets_lock = threading.Lock()
+_cache = {}
+_cache_lock = threading.Lock()
+_stats = {'requests': 0, 'not_modified': 0, 'fresh_hits': 0, 'rate_limited': 0}
+
+
+def get_session() -> requests.Session:
+    """取得共用的 keep-alive Session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _get_bucket(host: str) -> TokenBucket:
+    bucket = _buckets.get(host)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(SCRAPER_RATE_PER_SEC, SCRAPER_BURST)
+                _buckets[host] = bucket
+    return bucket
+
+
+def _get_entry(url: str) -> _CacheEntry:
+    with _cache_lock:
+        entry = _cache.get(url)
+        if entry is None:
+            entry = _CacheEntry()
+            _cache[url] = entry
+        return entry
+
+
+def _parsed_from_cache(entry: _CacheEntry, parse, parse_key):
+    """從快取取得解析結果，尚未解析過則用快取的內容解析一次"""
+    with _cache_lock:
+        if parse_key in entry.parsed:
+            # 回傳副本，呼叫端修改結果不會影響快取
+            return copy.deepcopy(entry.parsed[parse_key])
+        content = entry.content
+    result = parse(content)
+    with _cache_lock:
+        # 空結果（解析失敗或找不到資料）不快取，下次重新解析
+        if entry.content is content and result:
+            entry.parsed[parse_key] = copy.deepcopy(result)
+    return result
+
+
+def fetch_parsed(url: str, parse, parse_key=None, headers: dict = None, timeout: float = 10):
+    """抓取網頁並回傳 parse(content) 的結果
+    - 同一主機依 token bucket 限流，限流中若有快取則直接回傳舊結果
+    - 帶上 If-None-Match / If-Modified-Since，304 時重用快取的解析結果
+    - HTTP 錯誤會拋出例外（與 raise_for_status 相同）
+    """
+    parse_key = parse_key or getattr(parse, '__name__', 'default')
+    entry = _get_entry(url)
+    has_cache = entry.content is not None
+
+    if has_cache and time.monotonic() - entry.validated_at < SCRAPER_REVALIDATE_SECONDS:
+        _stats['fresh_hits'] += 1
+        return _parsed_from_cache(entry, parse, parse_key)
+
+    bucket = _get_bucket(urlsplit(url).netloc)
+    if has_cache:
+        if not bucket.try_acquire():
+            _stats['rate_limited'] += 1
+            logger.info(f"主機限流中，使用快取結果: {url}")
+            return _parsed_from_cache(entry, parse, parse_key)
+    elif not bucket.acquire(SCRAPER_MAX_WAIT):
+        _stats['rate_limited'] += 1
+        raise RateLimitedError(f"主機限流中: {url}")
+
+    request_headers = dict(headers or {})
+    if has_cache:
+        if entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+
+    _stats['requests'] += 1
+    response = get_session().get(url, headers=request_headers, timeout=timeout)
+
+    if response.status_code == 304 and has_cache:
+        _stats['not_modified'] += 1
+        entry.validated_at = time.monotonic()
+        logger.info(f"內容未變更 (304)，重用解析結果: {url}")
+        return _parsed_from_cache(entry, parse, parse_key)
+
+    response.raise_for_status()
+    content = response.content
+    result = parse(content)
+
+    with _cache_lock:
+        entry.etag = response.headers.get('ETag')
+        entry.last_modified = response.headers.get('Last-Modified')
+        entry.content = content
+        entry.validated_at = time.monotonic()
+        entry.parsed = {parse_key: copy.deepcopy(result)} if result else {}
+    return result
+
+
+def get_http_stats() -> dict:
+    """回傳抓取統計（請求數、304 次數、快取命中、限流次數）"""
+    return dict(_stats)
@@ -1,6 +1,8 @@
 from flask import Flask, request, abort
 import os
+import hmac
 import logging
+import threading
 import re
 
 # 設定日誌
@@ -8,80 +10,21 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 全域 Flex Message 現代化主題系統
-THEME_PRIMARY_BLUE = "#2563EB"      # 現代藍色（主要按鈕/header）
-THEME_SECONDARY_BLUE = "#3B82F6"    # 次要藍色（hover狀態）
-THEME_LIGHT_BLUE_BG = "#EFF6FF"     # 淺藍背景（卡片背景）
-THEME_ACCENT_BLUE = "#1D4ED8"       # 強調藍色（重要元素）
-THEME_TEXT_PRIMARY = "#1F2937"      # 主要文字深灰藍
-THEME_TEXT_SECONDARY = "#6B7280"    # 次要文字
-THEME_TEXT_MUTED = "#9CA3AF"        # 靜音文字
-THEME_SUCCESS = "#10B981"           # 成功綠色
-THEME_WARNING = "#F59E0B"           # 警告橙色
-THEME_ERROR = "#EF4444"             # 錯誤紅色
-THEME_BORDER = "#E5E7EB"            # 邊框顏色
-
-def apply_modern_theme(payload):
-    """套用現代化主題到 Flex Message dict
-    - 統一的色彩系統
-    - 改善的視覺層次
-    - 更好的可讀性
-    """
-    if payload is None:
-        return payload
-
-    def _transform(node, parent_key=None):
-        if isinstance(node, dict):
-            # 統一替換舊的橘色系統
-            if node.get('backgroundColor') == '#FFA500':
-                node['backgroundColor'] = THEME_PRIMARY_BLUE
-            
-            # header 區塊統一使用主色調
-            if node.get('type') == 'box' and parent_key == 'header':
-                if node.get('backgroundColor') not in [THEME_PRIMARY_BLUE, THEME_ACCENT_BLUE]:
-                    node['backgroundColor'] = THEME_PRIMARY_BLUE
-
-            # 按鈕顏色優化
-            if node.get('type') == 'button':
-                style = node.get('style')
-                if style == 'primary':
-                    # 根據功能類型使用不同顏色
-                    current_color = node.get('color', '')
-                    if current_color in ['#FF6B6B', '#E74C3C']:  # 排行榜
-                        node['color'] = THEME_ERROR
-                    elif current_color in ['#4ECDC4', '#2ECC71']:  # 行程管理/成功
-                        node['color'] = THEME_SUCCESS
-                    elif current_color in ['#FFA500', '#F59E0B']:  # 置物櫃/警告
-                        node['color'] = THEME_WARNING
-                    elif current_color in ['#9B59B6', '#6C5CE7']:  # TourClock/功能說明
-                        node['color'] = THEME_ACCENT_BLUE
-                    else:
-                        node['color'] = THEME_PRIMARY_BLUE
-                elif style == 'secondary':
-                    node.setdefault('color', THEME_TEXT_SECONDARY)
-
-            # 文字顏色優化
-            if node.get('type') == 'text':
-                if parent_key == 'header':
-                    node['color'] = '#ffffff'
-                else:
-                    current = node.get('color')
-                    if current in (None, '#333333', '#222222', '#000000'):
-                        node['color'] = THEME_TEXT_PRIMARY
-                    elif current in ('#666666', '#777777', '#888888', '#555555'):
-                        node['color'] = THEME_TEXT_SECONDARY
-                    elif current == '#999999':
-                        node['color'] = THEME_TEXT_MUTED
-
-            # 遞迴處理子節點
-            for k, v in list(node.items()):
-                node[k] = _transform(v, parent_key=k)
-            return node
-        elif isinstance(node, list):
-            return [_transform(child, parent_key=parent_key) for child in node]
-        else:
-            return node
-
-    return _transform(payload)
+from api.theme import (
+    THEME_PRIMARY_BLUE,
+    THEME_SECONDARY_BLUE,
+    THEME_LIGHT_BLUE_BG,
+    THEME_ACCENT_BLUE,
+    THEME_TEXT_PRIMARY,
+    THEME_TEXT_SECONDARY,
+    THEME_TEXT_MUTED,
+    THEME_SUCCESS,
+    THEME_WARNING,
+    THEME_ERROR,
+    THEME_BORDER,
+    RANK_COLORS,
+    apply_modern_theme
+)
 
 # 加載環境變數
 try:
@@ -94,26 +37,30 @@ except Exception as e:
     logger.error(f"加載環境變數失敗: {e}")
 
 # 導入配置文件
-from api.config import (
-    MESSAGE_TEMPLATES,
-    KEYWORD_MAPPINGS
-)
-
-# 導入網頁爬蟲功能
-from api.web_scraper import (
-    scrape_leaderboard_data
-)
-
-# 導入分頁功能
-from api.pagination import (
-    create_paginated_leaderboard,
-    create_paginated_itinerary
-)
+# 關鍵字與訊息模板設定（可熱更新，見 api/config_store.py）
+from api import config_store
+
+# 網頁爬蟲、分頁與資料庫功能在第一次使用時才載入（requests / bs4 / mysql.connector）
+from api.lazy_import import lazy_callable
+
+get_leaderboard_data = lazy_callable('api.web_scraper', 'get_leaderboard_data')
+create_paginated_leaderboard = lazy_callable('api.pagination', 'create_paginated_leaderboard')
+create_paginated_itinerary = lazy_callable('api.pagination', 'create_paginated_itinerary')
+get_leaderboard_entries = lazy_callable('api.pagination', 'get_leaderboard_entries')
+create_leaderboard_summary = lazy_callable('api.pagination', 'create_leaderboard_summary')
+get_rankings_page = lazy_callable('api.pagination', 'get_rankings_page')
+encode_ranking_cursor = lazy_callable('api.pagination', 'encode_ranking_cursor')
+ranking_key = lazy_callable('api.pagination', 'ranking_key')
+get_trips_by_location = lazy_callable('api.database', 'get_trips_by_location')
 
 import importlib
 
 # 導入內容創建功能（若不存在則降級為無操作）
 class _NoopContentCreator:
+    # 沒有任何創建指令，過濾器會略過所有訊息
+    creation_prefixes = ()
+    creation_patterns = ()
+
     def parse_and_create(self, user_message, line_user_id):
         return None
 
@@ -122,96 +69,70 @@ try:
 except Exception:
     content_creator = _NoopContentCreator()
 
-# 導入資料庫功能（作為備用）
-try:
-    from api.database import (
-        get_trips_by_location
-    )
-except ImportError:
-    logger.warning("資料庫模組導入失敗，將只使用網頁爬蟲")
-
-# LINE Bot imports
-from linebot.v3 import WebhookHandler
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    ReplyMessageRequest,
-    PushMessageRequest,
-    FlexMessage,
-    FlexContainer
+# 明顯不是創建指令的訊息不進入 parse_and_create
+from api.creation_gate import build_creation_gate
+creation_gate = build_creation_gate(content_creator)
+
+# 背景刷新排程（排行榜、置物櫃、行程統計）
+from api import scheduler
+import api.refresh_jobs  # noqa: F401  註冊排程工作
+
+# 宣告式 Flex 模板
+from api.flex_templates import (
+    compile_template, flex_template, render_template, build_template_cache, TEMPLATE_CACHE_ARTIFACT,
+    Slot, Text, Each, Memo
 )
-from linebot.v3.webhooks import MessageEvent, TextMessageContent, PostbackEvent, LocationMessageContent
+
+# 訊息發送（SDK 或快速路徑，由 LINE_FAST_SEND 決定）
+from api.line_sender import reply_flex, push_flex, LineConfiguration, export_schemas, install_schemas
+from api import metrics
+from api.router import Router, HANDLED
+from api.routing_cache import KeywordMatcher, RoutingCache, normalize_message
+
+# 啟動快照：建置時預先算好的比對器、靜態卡片與 Flex 欄位白名單（過期時忽略）
+from api import startup_snapshot
+if startup_snapshot.load():
+    install_schemas(startup_snapshot.get('flex_schemas', {}))
 
 # 建立 Flask app
 app = Flask(__name__)
 
-# 收藏功能：優先寫入資料庫，失敗則回退記憶體
-USER_FAVORITES = {}
-
-def _get_user_favorites_memory(line_user_id):
-    favorites = USER_FAVORITES.get(line_user_id)
-    if favorites is None:
-        favorites = set()
-        USER_FAVORITES[line_user_id] = favorites
-    return favorites
+# 收藏功能：讀取經過每位使用者的快取，寫入批次寫入資料庫（見 api/favorites.py）
+from api import favorites
 
+# 回傳 favorites.CHANGED / UNCHANGED / PENDING，其他錯誤回傳 None
 def add_favorite(line_user_id, rank_int):
     try:
-        # 先嘗試存 DB
-        try:
-            from api.database import add_user_favorite_db
-            inserted = add_user_favorite_db(line_user_id, int(rank_int))
-            if inserted:
-                return True
-        except Exception:
-            pass
-
-        # 回退記憶體
-        favorites = _get_user_favorites_memory(line_user_id)
-        before_size = len(favorites)
-        favorites.add(int(rank_int))
-        return len(favorites) > before_size
-    except Exception:
-        return False
+        return favorites.add(line_user_id, int(rank_int))
+    except Exception as e:
+        logger.error(f"加入收藏失敗: {e}")
+        return None
 
 def remove_favorite(line_user_id, rank_int):
     try:
-        # 先嘗試 DB
-        try:
-            from api.database import remove_user_favorite_db
-            removed = remove_user_favorite_db(line_user_id, int(rank_int))
-            if removed:
-                return True
-        except Exception:
-            pass
-        # 回退記憶體
-        favorites = _get_user_favorites_memory(line_user_id)
-        if int(rank_int) in favorites:
-            favorites.remove(int(rank_int))
-            return True
-        return False
-    except Exception:
-        return False
+        return favorites.remove(line_user_id, int(rank_int))
+    except Exception as e:
+        logger.error(f"移除收藏失敗: {e}")
+        return None
+
+# 關鍵字比對器與路由快取依設定版本建立，設定熱更新時整份替換
+def _build_routing(snapshot):
+    matcher = startup_snapshot.get('keyword_matcher') if snapshot.version == 'builtin' else None
+    return matcher or KeywordMatcher(snapshot.keyword_mappings), RoutingCache()
 
-def get_message_template(user_message):
-    """根據用戶消息獲取對應的模板配置"""
-    # 按關鍵字長度排序，優先匹配更具體的關鍵字
-    all_mappings = []
 
-    for mapping_key, mapping in KEYWORD_MAPPINGS.items():
-        for keyword in mapping["keywords"]:
-            if keyword in user_message:
-                all_mappings.append((len(keyword), mapping, keyword))
-                logger.info(f"🔍 匹配到關鍵字: '{keyword}' (長度: {len(keyword)}) -> 模板: {mapping['template']}")
+config_store.register_builder('routing', _build_routing)
 
-    # 如果有匹配，返回最長的關鍵字對應的模板
-    if all_mappings:
-        all_mappings.sort(key=lambda x: x[0], reverse=True)  # 按長度降序排列
-        best_match = all_mappings[0]
-        logger.info(f"✅ 最佳匹配: '{best_match[2]}' (長度: {best_match[0]}) -> 模板: {best_match[1]['template']}")
-        return best_match[1]
+
+def get_message_template(user_message, matcher=None):
+    """根據用戶消息獲取對應的模板配置（優先匹配最長的關鍵字）"""
+    if matcher is None:
+        matcher = config_store.get_artifact('routing')[0]
+    matched = matcher.match(user_message)
+    if matched:
+        keyword, mapping = matched
+        logger.info(f"✅ 最佳匹配: '{keyword}' (長度: {len(keyword)}) -> 模板: {mapping['template']}")
+        return mapping
 
     logger.info("❌ 沒有匹配到任何關鍵字")
     return None
@@ -244,6 +165,14 @@ def parse_rank_request(user_message):
     except Exception:
         return None
 
+def _resolve_rank_route(user_message):
+    """第 n 名查詢的路由決定，不是時回傳 None"""
+    parsed = parse_rank_request(user_message)
+    if not parsed:
+        return None
+    template_key, rank = parsed
+    return ("rank", {"template": template_key, "rank": str(rank)})
+
 def create_optimized_flex_itinerary(data):
     """創建優化的 Flex Message 詳細行程"""
     try:
@@ -314,7 +243,7 @@ def create_optimized_flex_itinerary(data):
             ]
 
         # 添加行程長度提示
-        total_days = len(data.get("details", []))
+        total_days = data.get("detail_count", len(data.get("details", [])))
         if total_days > 6:
             itinerary_items.extend([
                 {
@@ -421,15 +350,6 @@ def create_optimized_flex_itinerary(data):
 ## 已移除未使用的 create_text_itinerary_response 函式
 
 
-
-
-
-
-
-
-
-
-
 def create_creation_response(creation_result):
     """創建內容創建結果的回應訊息"""
     if creation_result['type'] == 'success':
@@ -1042,6 +962,9 @@ def create_rebind_confirm():
         }
     }
 
+# 操作日誌：佇列化後由背景執行緒批次寫入 user_operation_logs（見 api/operation_log_sink.py）
+from api import operation_log_sink
+
 def execute_rebind(line_user_id):
     """執行重新綁定"""
     try:
@@ -1063,8 +986,8 @@ def execute_rebind(line_user_id):
             if user_manager.bind_website(user['id'], service):
                 success_count += 1
 
-        # 記錄重新綁定操作
-        user_manager.log_operation(
+        # 記錄重新綁定操作（放進佇列批次寫入，不等待資料庫；partial 以 failed 記錄並保留在操作數據中）
+        operation_log_sink.log(
             user['id'],
             'rebind_services',
             {'services': services, 'success_count': success_count},
@@ -1399,965 +1322,1100 @@ def create_new_quick_menu():
     }
 
 
+# ---- 快速回覆路由 ----
+
+quick_reply_routes = Router('quick_reply')
+
+_QUICK_REPLY_FEATURES = ('trip_management', 'tour_clock', 'locker', 'split_bill')
+
+
+@quick_reply_routes.route('leaderboard_list')
+def _quick_reply_leaderboard_list(params, line_user_id):
+    return create_simple_flex_message("leaderboard_list")
+
+
+@quick_reply_routes.route('leaderboard')
+def _quick_reply_leaderboard(params, line_user_id):
+    return create_simple_flex_message("leaderboard", rank=params.get('rank', '1'))
+
+
+@quick_reply_routes.route(*_QUICK_REPLY_FEATURES)
+def _quick_reply_feature(params, line_user_id):
+    return create_simple_flex_message("feature", feature_name=params.get('type'))
+
+
+@quick_reply_routes.route('my_favorites')
+def _quick_reply_my_favorites(params, line_user_id):
+    return create_simple_flex_message("my_favorites", line_user_id=line_user_id)
+
+
+@quick_reply_routes.route('help')
+def _quick_reply_help(params, line_user_id):
+    return create_simple_flex_message("feature_menu")
+
+
+@quick_reply_routes.route('quick_reply_menu')
+def _quick_reply_menu(params, line_user_id):
+    return create_new_quick_menu()
+
+
+@quick_reply_routes.default
+def _quick_reply_default(params, line_user_id):
+    return create_simple_flex_message("default")
+
+
 def handle_quick_reply(params, line_user_id):
     """處理快速回覆"""
     if params is None:
         params = {}
-    reply_type = params.get('type')
-    rank = params.get('rank', '1')
-    
-    if reply_type == 'leaderboard_list':
-        return create_simple_flex_message("leaderboard_list")
-    elif reply_type == 'leaderboard':
-        return create_simple_flex_message("leaderboard", rank=rank)
-    elif reply_type == 'trip_management':
-        return create_simple_flex_message("feature", feature_name="trip_management")
-    elif reply_type == 'tour_clock':
-        return create_simple_flex_message("feature", feature_name="tour_clock")
-    elif reply_type == 'locker':
-        return create_simple_flex_message("feature", feature_name="locker")
-    elif reply_type == 'split_bill':
-        return create_simple_flex_message("feature", feature_name="split_bill")
-    elif reply_type == 'my_favorites':
-        return create_simple_flex_message("my_favorites", line_user_id=line_user_id)
-    elif reply_type == 'help':
-        return create_simple_flex_message("feature_menu")
-    elif reply_type == 'quick_reply_menu':
-        return create_new_quick_menu()
-    else:
-        return create_simple_flex_message("default")
+    return quick_reply_routes.dispatch(params.get('type'), params, line_user_id)
+
+_TOP10_FOOTER_SPEC = {
+    "type": "box",
+    "layout": "vertical",
+    "contents": [
+        {"type": "button", "action": {"type": "postback", "label": "查看詳細行程 📋", "data": Text("action=leaderboard_page&rank={rank}&page=2")}, "style": "primary", "color": Slot("color"), "height": "sm"},
+        {"type": "button", "action": {"type": "postback", "label": "加入收藏 ❤️", "data": Text("action=favorite_add&rank={rank}")}, "style": "secondary", "height": "sm", "margin": "sm"}
+    ],
+    "paddingAll": "20px"
+}
+
+_TOP10_HEADER_SPEC = {
+    "type": "box",
+    "layout": "vertical",
+    "contents": [
+        {"type": "text", "text": Text("🏆 第{rank}名"), "weight": "bold", "size": "lg", "color": "#ffffff", "align": "center"}
+    ],
+    "backgroundColor": Slot("color"),
+    "paddingAll": "20px"
+}
+
+_TOP10_BUBBLE_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "kilo",
+    "header": Memo(_TOP10_HEADER_SPEC, "rank", "color"),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": Slot("title"), "weight": "bold", "size": "md", "color": "#333333", "wrap": True},
+            Each("destinations", {"type": "text", "text": Text("目的地：{item}"), "size": "sm", "color": "#555555", "margin": "md"}),
+            Each("durations", {"type": "text", "text": Text("行程天數：{item}"), "size": "sm", "color": "#555555"})
+        ],
+        "paddingAll": "20px"
+    },
+    "footer": Memo(_TOP10_FOOTER_SPEC, "rank", "color")
+})
+
+_TOP10_EMPTY_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "kilo",
+    "header": Memo(_TOP10_HEADER_SPEC, "rank", "color"),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": "無行程內容", "align": "center", "color": "#666666"}
+        ],
+        "paddingAll": "20px"
+    }
+})
+
+# 排行榜最後一張：接續瀏覽之後的名次（游標見 api/pagination.py）
+_RANKINGS_MORE_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "kilo",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": "還想看更多？", "weight": "bold", "size": "md", "color": "#333333", "align": "center"},
+            {"type": "text", "text": Text("從第{rank}名繼續瀏覽排行榜"), "size": "sm", "color": "#555555", "align": "center", "margin": "md", "wrap": True}
+        ],
+        "justifyContent": "center",
+        "paddingAll": "20px"
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "button", "action": {"type": "postback", "label": "更多排行 ➡️", "data": Text("action=rankings_more&c={cursor}")}, "style": "primary", "color": "#6C5CE7", "height": "sm"}
+        ],
+        "paddingAll": "20px"
+    }
+})
+
+def _ranking_bubble(rank, row):
+    def build_duration_days(row):
+        try:
+            if row.get('start_date') and row.get('end_date'):
+                days = (row['end_date'] - row['start_date']).days + 1
+                return f"{days}天{days-1}夜" if days and days > 1 else "1天"
+        except Exception:
+            return ""
+        return ""
+
+    destination = row.get('area') or ""
+    duration = build_duration_days(row)
+    return _TOP10_BUBBLE_TEMPLATE.render(
+        rank=rank,
+        color=RANK_COLORS.get(rank, "#6C5CE7"),
+        title=row.get('title') or f"第{rank}名行程",
+        destinations=[destination] if destination else [],
+        durations=[duration] if duration else []
+    )
+
+def create_top10_carousel(results):
+    """以 carousel 顯示排行榜前10名（results 為依名次排序的行程資料；超過 10 筆時附上「更多排行」）"""
+    bubbles = []
+    for rank in range(1, 11):
+        if rank - 1 < len(results):
+            bubbles.append(_ranking_bubble(rank, results[rank - 1]))
+        else:
+            bubbles.append(_TOP10_EMPTY_TEMPLATE.render(rank=rank, color=RANK_COLORS.get(rank, "#6C5CE7")))
+
+    if len(results) > 10:
+        cursor = encode_ranking_cursor(11, ranking_key(results[9]))
+        bubbles.append(_RANKINGS_MORE_TEMPLATE.render(rank=11, cursor=cursor))
+
+    return {"type": "carousel", "contents": bubbles}
+
+def create_rankings_page(token):
+    """「更多排行」：依游標顯示接下來的名次"""
+    try:
+        start_rank, rows, next_cursor = get_rankings_page(token)
+    except ValueError:
+        logger.warning(f"排行榜游標格式錯誤: {token}")
+        return None
+    except Exception as e:
+        logger.error(f"查詢更多排行失敗: {e}")
+        return None
+
+    if not rows:
+        return {
+            "type": "bubble",
+            "body": {
+                "type": "box",
+                "layout": "vertical",
+                "contents": [
+                    {"type": "text", "text": "已經是排行榜的最後一名了", "wrap": True, "align": "center", "color": "#555555"}
+                ],
+                "paddingAll": "20px"
+            }
+        }
+    bubbles = [_ranking_bubble(start_rank + offset, row) for offset, row in enumerate(rows)]
+    if next_cursor:
+        bubbles.append(_RANKINGS_MORE_TEMPLATE.render(rank=start_rank + len(rows), cursor=next_cursor))
+    return {"type": "carousel", "contents": bubbles}
 
 def create_simple_flex_message(template_type, **kwargs):
-    """創建簡單的 Flex Message"""
-    
-    if template_type == "feature":
-        feature_name = kwargs.get('feature_name')
-        if feature_name in MESSAGE_TEMPLATES["features"]:
-            template = MESSAGE_TEMPLATES["features"][feature_name]
-            
-            return {
-                "type": "bubble",
-                "size": "kilo",
-                "header": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": template["title"],
-                            "weight": "bold",
-                            "size": "lg",
-                            "color": "#ffffff",
-                            "align": "center"
-                        }
-                    ],
-                    "backgroundColor": template["color"],
-                    "paddingAll": "20px"
-                },
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": template["description"],
-                            "size": "md",
-                            "color": THEME_TEXT_PRIMARY,
-                            "align": "center",
-                            "margin": "md"
-                        }
-                    ],
-                    "paddingAll": "20px"
-                },
-                "footer": {
+    """創建簡單的 Flex Message（依模板名稱查表，未註冊或無內容時顯示快速選單）"""
+    result = render_template(template_type, **kwargs)
+    if result is None:
+        # 預設回應：直接顯示快速選單
+        return render_template("quick_reply_menu")
+    return result
+
+# ---- 靜態模板（只依設定檔內容，編譯一次、凍結共用） ----
+
+def _header_spec(title, color):
+    return {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": title, "weight": "bold", "size": "lg", "color": "#ffffff", "align": "center"}
+        ],
+        "backgroundColor": color,
+        "paddingAll": "20px"
+    }
+
+_FEATURE_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "kilo",
+    "header": _header_spec(Slot("title"), Slot("color")),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": Slot("description"), "size": "md", "color": THEME_TEXT_PRIMARY, "align": "center", "margin": "md"}
+        ],
+        "paddingAll": "20px"
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "button",
+                "action": {"type": "uri", "label": Slot("button_text"), "uri": Slot("url")},
+                "style": "primary",
+                "color": Slot("color"),
+                "height": "sm"
+            }
+        ],
+        "paddingAll": "20px"
+    }
+})
+
+_HELP_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "giga",
+    "header": _header_spec(Slot("title"), Slot("color")),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": Each("features", {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [
+                {"type": "text", "text": Slot("emoji"), "size": "lg", "flex": 0},
+                {
                     "type": "box",
                     "layout": "vertical",
                     "contents": [
-                        {
-                            "type": "button",
-                            "action": {
-                                "type": "uri",
-                                "label": template["button_text"],
-                                "uri": template["url"]
-                            },
-                            "style": "primary",
-                            "color": template["color"],
-                            "height": "sm"
-                        }
+                        {"type": "text", "text": Slot("name"), "weight": "bold", "size": "sm", "color": "#555555"},
+                        {"type": "text", "text": Slot("description"), "size": "xs", "color": "#888888", "wrap": True}
                     ],
-                    "paddingAll": "20px"
+                    "flex": 1,
+                    "marginStart": "md"
                 }
+            ],
+            "marginBottom": "md"
+        }),
+        "paddingAll": "20px"
+    }
+})
+
+# 功能選單按鈕（postback 資料對應 feature_details 設定）
+_FEATURE_MENU_BUTTONS = [
+    {"name": "🏆 排行榜", "data": "action=feature_detail&feature=leaderboard"},
+    {"name": "🗓️ 行程管理", "data": "action=feature_detail&feature=trip_management"},
+    {"name": "⏰ 集合", "data": "action=feature_detail&feature=tour_clock"},
+    {"name": "🛅 置物櫃查找", "data": "action=feature_detail&feature=locker"},
+    {"name": "💰 分帳工具", "data": "action=feature_detail&feature=split_bill"}
+]
+
+_FEATURE_MENU_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "kilo",
+    "header": _header_spec(Slot("title"), Slot("color")),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": Slot("description"), "size": "md", "color": "#555555", "align": "center", "wrap": True}
+        ],
+        "paddingAll": "20px"
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "button",
+                "action": {"type": "postback", "label": feature["name"], "data": feature["data"]},
+                "style": "secondary",
+                "height": "sm",
+                "margin": "sm"
+            }
+            for feature in _FEATURE_MENU_BUTTONS
+        ],
+        "paddingAll": "20px"
+    }
+})
+
+_FEATURE_DETAIL_TEMPLATE = compile_template({
+    "type": "bubble",
+    "size": "giga",
+    "header": _header_spec(Slot("title"), Slot("color")),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": Slot("description"), "size": "md", "color": "#555555", "wrap": True, "margin": "md"},
+            # 功能特點
+            {"type": "separator", "margin": "lg"},
+            {"type": "text", "text": "✨ 功能特點", "weight": "bold", "size": "sm", "color": "#333333", "margin": "lg"},
+            Each("details", {"type": "text", "text": Slot("item"), "size": "sm", "color": "#666666", "wrap": True, "margin": "sm"}),
+            # 使用步驟
+            {"type": "separator", "margin": "lg"},
+            {"type": "text", "text": "📋 使用方法", "weight": "bold", "size": "sm", "color": "#333333", "margin": "lg"},
+            Each("usage_steps", {"type": "text", "text": Slot("item"), "size": "sm", "color": "#666666", "wrap": True, "margin": "sm"})
+        ],
+        "paddingAll": "20px"
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "button",
+                "action": {"type": "uri", "label": Slot("button_text"), "uri": Slot("url")},
+                "style": "primary",
+                "color": Slot("color"),
+                "height": "sm"
+            },
+            {
+                "type": "button",
+                "action": {"type": "postback", "label": "🔙 返回功能選單", "data": "action=back_to_menu"},
+                "style": "secondary",
+                "height": "sm",
+                "margin": "sm"
             }
-    
-    elif template_type == "help":
-        template = MESSAGE_TEMPLATES["help"]
+        ],
+        "paddingAll": "20px"
+    }
+})
+
+_LOCKER_PROMPT_TEMPLATE = compile_template({
+    "type": "bubble",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": "請分享您目前位置，以尋找附近的置物櫃", "wrap": True, "align": "center", "color": "#555555"}
+        ],
+        "paddingAll": "20px"
+    }
+})
+
+@flex_template("feature", cache=True)
+def _template_feature(feature_name=None, config=None, **kwargs):
+    template = config.message_templates["features"].get(feature_name)
+    if template:
+        return _FEATURE_TEMPLATE.render(template)
+
+@flex_template("help", cache=True)
+def _template_help(config=None, **kwargs):
+    return _HELP_TEMPLATE.render(config.message_templates["help"])
+
+@flex_template("feature_menu", cache=True)
+def _template_feature_menu(config=None, **kwargs):
+    return _FEATURE_MENU_TEMPLATE.render(config.message_templates["feature_menu"])
+
+@flex_template("feature_detail", cache=True)
+def _template_feature_detail(feature_name=None, config=None, **kwargs):
+    template = config.message_templates["feature_details"].get(feature_name)
+    if template:
+        return _FEATURE_DETAIL_TEMPLATE.render(template)
+
+@flex_template("creation_help", cache=True)
+def _template_creation_help(**kwargs):
+    return create_creation_help()
+
+@flex_template("rebind_confirm", cache=True)
+def _template_rebind_confirm(**kwargs):
+    return create_rebind_confirm()
+
+@flex_template("quick_reply_menu", cache=True)
+def _template_quick_reply_menu(**kwargs):
+    return create_new_quick_menu()
+
+@flex_template("locker_nearby_prompt", cache=True)
+def _template_locker_nearby_prompt(**kwargs):
+    return _LOCKER_PROMPT_TEMPLATE.render()
+
+def _static_template_calls(snapshot):
+    """所有只依設定檔決定的卡片：(模板名稱, 參數)"""
+    calls = [(name, {}) for name in (
+        "help", "feature_menu", "creation_help", "rebind_confirm", "quick_reply_menu", "locker_nearby_prompt"
+    )]
+    calls += [("feature", {"feature_name": name}) for name in snapshot.message_templates.get("features", {})]
+    calls += [("feature_detail", {"feature_name": name}) for name in snapshot.message_templates.get("feature_details", {})]
+    return calls
+
+def _build_static_templates(snapshot):
+    # 內建設定沿用啟動快照（沒有快照時於第一次使用才產生，不拖慢冷啟動）；
+    # 熱更新的新版本在背景先全部產生好，隨設定一起替換
+    if snapshot.version == 'builtin':
+        return dict(startup_snapshot.get('static_templates') or {})
+    return build_template_cache(snapshot, _static_template_calls(snapshot))
+
+config_store.register_builder(TEMPLATE_CACHE_ARTIFACT, _build_static_templates)
+
+def build_startup_artifacts():
+    """啟動快照內容（以內建設定建立，由 scripts/build_snapshot.py 寫入）"""
+    snapshot = config_store.current()
+    return {
+        'keyword_matcher': config_store.get_artifact('routing')[0],
+        'flex_schemas': export_schemas(),
+        'static_templates': build_template_cache(
+            snapshot, _static_template_calls(snapshot), snapshot.artifacts[TEMPLATE_CACHE_ARTIFACT]
+        ),
+    }
+
+# ---- 動態模板（依排行榜、資料庫或使用者資料產生） ----
 
-        feature_contents = []
-        for feature in template["features"]:
-            feature_contents.append({
+@flex_template("leaderboard")
+def _template_leaderboard(**kwargs):
+    # 使用分頁系統顯示排行榜詳細資料
+    rank = kwargs.get('rank', '1')
+    page = kwargs.get('page', 1)
+
+    return create_paginated_leaderboard(int(rank), page)
+
+
+@flex_template("leaderboard_list")
+def _template_leaderboard_list(**kwargs):
+    # 排行榜列表模板 - 僅使用網站資料（背景快照，無模擬回退）
+    leaderboard_data = get_leaderboard_data()
+
+    # 創建排行榜項目
+    leaderboard_contents = []
+
+    # 根據排名順序顯示前5名
+    for rank in range(1, 6):
+        rank_str = str(rank)
+        if rank_str in leaderboard_data:
+            data = leaderboard_data[rank_str]
+
+            # 根據排名設定圖標
+            rank_icons = {1: "🥇", 2: "🥈", 3: "🥉", 4: "🏅", 5: "🎖️"}
+            icon = rank_icons.get(rank, "🏆")
+
+            leaderboard_contents.append({
                 "type": "box",
                 "layout": "horizontal",
                 "contents": [
-                    {"type": "text", "text": feature["emoji"], "size": "lg", "flex": 0},
                     {
                         "type": "box",
                         "layout": "vertical",
                         "contents": [
-                            {"type": "text", "text": feature["name"], "weight": "bold", "size": "sm", "color": "#555555"},
-                            {"type": "text", "text": feature["description"], "size": "xs", "color": "#888888", "wrap": True}
+                            {
+                                "type": "text",
+                                "text": f"{icon} 第{rank}名",
+                                "weight": "bold",
+                                "size": "sm",
+                                "color": data["color"]
+                            },
+                            {
+                                "type": "text",
+                                "text": data.get('title', data.get('destination', '未知行程')),
+                                "size": "xs",
+                                "color": THEME_TEXT_SECONDARY,
+                                "marginTop": "xs",
+                                "wrap": True
+                            },
+                            {
+                                "type": "text",
+                                "text": f"⏰ {data.get('duration', '未知天數')}",
+                                "size": "xs",
+                                "color": "#888888",
+                                "marginTop": "xs"
+                            }
                         ],
-                        "flex": 1,
-                        "marginStart": "md"
+                        "flex": 1
                     }
                 ],
-                "marginBottom": "md"
+                "paddingAll": "sm",
+                "backgroundColor": "#f8f9fa",
+                "cornerRadius": "md",
+                "marginBottom": "sm"
             })
 
+    return {
+        "type": "bubble",
+        "size": "giga",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "🏆 TourHub 排行榜",
+                    "weight": "bold",
+                    "size": "lg",
+                    "color": "#ffffff",
+                    "align": "center"
+                },
+                {
+                    "type": "text",
+                    "text": "熱門旅遊行程排名",
+                    "size": "sm",
+                    "color": "#ffffff",
+                    "align": "center",
+                    "margin": "sm"
+                }
+            ],
+            "backgroundColor": "#FF6B6B",
+            "paddingAll": "20px"
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": leaderboard_contents,
+            "paddingAll": "20px"
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "button",
+                    "action": {
+                        "type": "uri",
+                        "label": "查看完整排行榜",
+                        "uri": "https://tourhub-ashy.vercel.app/"
+                    },
+                    "style": "primary",
+                    "color": "#FF6B6B",
+                    "height": "sm"
+                }
+            ],
+            "paddingAll": "20px"
+        }
+    }
+
+
+@flex_template("leaderboard_top10")
+def _template_leaderboard_top10(**kwargs):
+    # 以 carousel 顯示前10名（來源：資料庫）
+    from api.database import get_ranked_trips
+    # 多取一筆判斷是否顯示「更多排行」
+    return create_top10_carousel(get_ranked_trips(11))
+
+
+@flex_template("my_favorites")
+def _template_my_favorites(**kwargs):
+    # 顯示使用者收藏的排行榜名次
+    line_user_id = kwargs.get('line_user_id')
+    ranks = []
+    if line_user_id:
+        try:
+            ranks = favorites.get_favorites(line_user_id)
+        except Exception as e:
+            logger.error(f"取得收藏清單失敗: {e}")
+            return {
+                "type": "bubble",
+                "body": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "暫時無法取得收藏清單，請稍後再試", "align": "center", "color": "#666666", "wrap": True}]}
+            }
+    if not ranks:
         return {
             "type": "bubble",
-            "size": "giga",
-            "header": {
+            "body": {
                 "type": "box",
                 "layout": "vertical",
                 "contents": [
-                    {
-                        "type": "text",
-                        "text": template["title"],
-                        "weight": "bold",
-                        "size": "lg",
-                        "color": "#ffffff",
-                        "align": "center"
-                    }
+                    {"type": "text", "text": "您尚未收藏任何行程名次", "align": "center", "color": "#666666", "wrap": True},
+                    {"type": "text", "text": "在排行榜卡片點『加入收藏』即可新增", "size": "xs", "align": "center", "color": "#888888", "margin": "md"}
                 ],
-                "backgroundColor": template["color"],
-                "paddingAll": "20px"
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": feature_contents,
                 "paddingAll": "20px"
             }
         }
 
-    elif template_type == "feature_menu":
-        template = MESSAGE_TEMPLATES["feature_menu"]
-
-        # 創建功能按鈕
-        feature_buttons = []
-        features = [
-            {"name": "🏆 排行榜", "data": "action=feature_detail&feature=leaderboard"},
-            {"name": "🗓️ 行程管理", "data": "action=feature_detail&feature=trip_management"},
-            {"name": "⏰ 集合", "data": "action=feature_detail&feature=tour_clock"},
-            {"name": "🛅 置物櫃查找", "data": "action=feature_detail&feature=locker"},
-            {"name": "💰 分帳工具", "data": "action=feature_detail&feature=split_bill"}
-        ]
-
-        for feature in features:
-            feature_buttons.append({
-                "type": "button",
-                "action": {
-                    "type": "postback",
-                    "label": feature["name"],
-                    "data": feature["data"]
-                },
-                "style": "secondary",
-                "height": "sm",
-                "margin": "sm"
-            })
+    # 將收藏的名次轉成 carousel 卡片（每張附移除收藏）；所有名次一次取得，不逐筆查詢
+    ranks = ranks[:10]
+    entries = get_leaderboard_entries(ranks)
+    bubbles = [create_leaderboard_summary(rank, entries[rank], favorited=True) for rank in ranks if rank in entries]
+    if not bubbles:
+        return {
+            "type": "bubble",
+            "body": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "暫無有效收藏可顯示", "align": "center", "color": "#666666"}]}
+        }
+    return {"type": "carousel", "contents": bubbles}
+
+
+@flex_template("leaderboard_details")
+def _template_leaderboard_details(**kwargs):
+    # 直接從資料庫獲取詳細行程
+    rank = kwargs.get('rank', '1')
+    rank_int = int(rank)
+
+    # 直接從資料庫查詢詳細行程
+    try:
+        from api.database import get_ranked_trip_details
+
+        # 指定名次的行程與前幾筆行程安排（一次查詢；名次與排行榜共用排序與快照）
+        trip_data, details, detail_count = get_ranked_trip_details(rank_int)
+        if not trip_data:
+            raise Exception(f"找不到第{rank_int}名的行程")
+
+        # 組織資料
+        rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
+        rank_colors = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
+
+        data = {
+            "trip_id": trip_data['trip_id'],
+            "rank": rank_int,
+            "rank_title": rank_titles.get(rank_int, f"🎖️ 第{rank_int}名"),
+            "title": trip_data['title'] or f"第{rank_int}名行程",
+            "color": rank_colors.get(rank_int, "#9B59B6"),
+            "area": trip_data['area'] or "未知地區",
+            "details": details,
+            "detail_count": detail_count
+        }
+
+    except Exception as e:
+        logger.error(f"資料庫查詢失敗: {e}")
+        data = None
 
+    if not data:
+        # 如果沒有詳細行程，顯示提示訊息
+        rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
         return {
             "type": "bubble",
-            "size": "kilo",
-            "header": {
+            "body": {
                 "type": "box",
                 "layout": "vertical",
                 "contents": [
                     {
                         "type": "text",
-                        "text": template["title"],
-                        "weight": "bold",
-                        "size": "lg",
-                        "color": "#ffffff",
+                        "text": f"抱歉，{rank_titles.get(rank_int, f'第{rank_int}名')}的詳細行程安排暫時無法提供。",
+                        "wrap": True,
+                        "color": THEME_TEXT_SECONDARY,
                         "align": "center"
                     }
                 ],
-                "backgroundColor": template["color"],
                 "paddingAll": "20px"
-            },
+            }
+        }
+
+    # 格式化資料庫的詳細行程資料
+    def format_database_itinerary(details):
+        """格式化資料庫的行程詳細資料"""
+        if not details:
+            return "暫無詳細行程安排"
+
+        formatted_lines = []
+
+        for detail in details:
+            # 處理日期
+            if detail['date']:
+                date_obj = detail['date']
+                weekdays = ['一', '二', '三', '四', '五', '六', '日']
+                weekday = weekdays[date_obj.weekday()]
+                date_str = f"📅 {date_obj.month}/{date_obj.day} ({weekday})"
+                formatted_lines.append(date_str)
+
+            # 處理時間和地點
+            time_str = ""
+            if detail['start_time'] and detail['end_time']:
+                start_time = str(detail['start_time'])
+                end_time = str(detail['end_time'])
+
+                # 如果是 timedelta 格式，轉換為時間格式
+                if ':' in start_time and len(start_time) > 8:
+                    start_time = start_time[:8]  # 取 HH:MM:SS
+                if ':' in end_time and len(end_time) > 8:
+                    end_time = end_time[:8]
+
+                time_str = f"🕐 {start_time} - {end_time}"
+            elif detail['start_time']:
+                start_time = str(detail['start_time'])
+                if ':' in start_time and len(start_time) > 8:
+                    start_time = start_time[:8]
+                time_str = f"🕐 {start_time}"
+
+            # 地點
+            location = detail['location'] or "未知地點"
+            location_str = f"📍 {location}"
+
+            # 添加時間和地點
+            if time_str:
+                formatted_lines.append(f"{time_str} {location}")
+            else:
+                formatted_lines.append(location_str)
+
+            # 添加空行分隔
+            formatted_lines.append("")
+
+        # 移除最後的空行
+        if formatted_lines and formatted_lines[-1] == "":
+            formatted_lines.pop()
+
+        # 限制行數，避免內容過長
+        if len(formatted_lines) > 25:
+            formatted_lines = formatted_lines[:25]
+            formatted_lines.append("...")
+            formatted_lines.append("💡 完整行程請查看 TourHub 網站")
+
+        return '\n'.join(formatted_lines)
+
+    # 創建優化的 Flex Message 結構
+    return create_optimized_flex_itinerary(data)
+
+
+@flex_template("location_trips")
+def _template_location_trips(**kwargs):
+    # 地區行程查詢模板 - 從資料庫獲取資料
+    location = kwargs.get('location', '未知地區')
+
+    # 從資料庫獲取地區行程資料
+    trips = get_trips_by_location(location)
+
+    # 若無資料，回傳提示訊息
+    if not trips:
+        return {
+            "type": "bubble",
             "body": {
                 "type": "box",
                 "layout": "vertical",
                 "contents": [
                     {
                         "type": "text",
-                        "text": template["description"],
-                        "size": "md",
-                        "color": "#555555",
-                        "align": "center",
-                        "wrap": True
+                        "text": f"抱歉，暫無 {location} 的行程資料",
+                        "wrap": True,
+                        "color": THEME_TEXT_SECONDARY,
+                        "align": "center"
                     }
                 ],
                 "paddingAll": "20px"
-            },
-            "footer": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": feature_buttons,
-                "paddingAll": "20px"
             }
         }
 
-    elif template_type == "feature_detail":
-        feature_name = kwargs.get('feature_name')
-        if feature_name in MESSAGE_TEMPLATES["feature_details"]:
-            template = MESSAGE_TEMPLATES["feature_details"][feature_name]
-
-            # 創建功能詳情內容
-            detail_contents = []
-
-            # 添加描述
-            detail_contents.append({
-                "type": "text",
-                "text": template["description"],
-                "size": "md",
-                "color": "#555555",
-                "wrap": True,
-                "margin": "md"
-            })
-
-            # 添加功能特點
-            detail_contents.append({
-                "type": "separator",
-                "margin": "lg"
-            })
-            detail_contents.append({
-                "type": "text",
-                "text": "✨ 功能特點",
-                "weight": "bold",
-                "size": "sm",
-                "color": "#333333",
-                "margin": "lg"
-            })
-
-            for detail in template["details"]:
-                detail_contents.append({
-                    "type": "text",
-                    "text": detail,
-                    "size": "sm",
-                    "color": "#666666",
-                    "wrap": True,
-                    "margin": "sm"
-                })
-
-            # 添加使用步驟
-            detail_contents.append({
-                "type": "separator",
-                "margin": "lg"
-            })
-            detail_contents.append({
-                "type": "text",
-                "text": "📋 使用方法",
-                "weight": "bold",
-                "size": "sm",
-                "color": "#333333",
-                "margin": "lg"
-            })
-
-            for step in template["usage_steps"]:
-                detail_contents.append({
-                    "type": "text",
-                    "text": step,
-                    "size": "sm",
-                    "color": "#666666",
-                    "wrap": True,
-                    "margin": "sm"
-                })
-
-            # 創建按鈕
-            footer_buttons = [
-                {
-                    "type": "button",
-                    "action": {
-                        "type": "uri",
-                        "label": template["button_text"],
-                        "uri": template["url"]
-                    },
-                    "style": "primary",
-                    "color": template["color"],
-                    "height": "sm"
-                },
+    # 創建行程內容
+    trip_contents = []
+    for trip in trips:
+        trip_contents.append({
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [
                 {
-                    "type": "button",
-                    "action": {
-                        "type": "postback",
-                        "label": "🔙 返回功能選單",
-                        "data": "action=back_to_menu"
-                    },
-                    "style": "secondary",
-                    "height": "sm",
-                    "margin": "sm"
-                }
-            ]
-
-            return {
-                "type": "bubble",
-                "size": "giga",
-                "header": {
                     "type": "box",
                     "layout": "vertical",
                     "contents": [
                         {
                             "type": "text",
-                            "text": template["title"],
+                            "text": trip["title"],
                             "weight": "bold",
-                            "size": "lg",
-                            "color": "#ffffff",
-                            "align": "center"
+                            "size": "sm",
+                            "color": "#555555"
+                        },
+                        {
+                            "type": "text",
+                            "text": f"⏰ {trip['duration']}",
+                            "size": "xs",
+                            "color": "#888888",
+                            "marginTop": "sm"
+                        },
+                        {
+                            "type": "text",
+                            "text": f"📍 {trip['highlights']}",
+                            "size": "xs",
+                            "color": "#888888",
+                            "wrap": True,
+                            "marginTop": "sm"
                         }
                     ],
-                    "backgroundColor": template["color"],
-                    "paddingAll": "20px"
-                },
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": detail_contents,
-                    "paddingAll": "20px"
+                    "flex": 1
+                }
+            ],
+            "marginBottom": "md",
+            "paddingAll": "sm",
+            "backgroundColor": "#f8f9fa",
+            "cornerRadius": "md"
+        })
+
+    return {
+        "type": "bubble",
+        "size": "giga",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": f"🗺️ {location} 行程推薦",
+                    "weight": "bold",
+                    "size": "lg",
+                    "color": "#ffffff",
+                    "align": "center"
                 },
-                "footer": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": footer_buttons,
-                    "paddingAll": "20px"
+                {
+                    "type": "text",
+                    "text": "為您精選的熱門行程",
+                    "size": "sm",
+                    "color": "#ffffff",
+                    "align": "center",
+                    "margin": "sm"
                 }
-            }
+            ],
+            "backgroundColor": "#9B59B6",
+            "paddingAll": "20px"
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": trip_contents,
+            "paddingAll": "20px"
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "💡 更多行程請訪問我們的網站",
+                    "size": "xs",
+                    "color": "#666666",
+                    "align": "center",
+                    "wrap": True
+                }
+            ],
+            "paddingAll": "20px"
+        }
+    }
 
+# 環境變數檢查
+CHANNEL_ACCESS_TOKEN = os.environ.get('CHANNEL_ACCESS_TOKEN')
+CHANNEL_SECRET = os.environ.get('CHANNEL_SECRET')
 
+if CHANNEL_ACCESS_TOKEN and CHANNEL_SECRET:
+    configuration = LineConfiguration(CHANNEL_ACCESS_TOKEN)
+    logger.info("LINE Bot 設定成功")
+else:
+    configuration = None
+    logger.warning("LINE Bot 環境變數未設定")
 
-    elif template_type == "creation_help":
-        return create_creation_help()
+# Webhook handler 在第一次收到 callback 時才建立（載入 LINE SDK 的 webhook 模型）
+_line_handler = None
+_line_handler_lock = threading.Lock()
 
 
-    elif template_type == "rebind_confirm":
-        return create_rebind_confirm()
+def get_line_handler():
+    global _line_handler
+    if _line_handler is None and configuration is not None:
+        with _line_handler_lock:
+            if _line_handler is None:
+                from linebot.v3 import WebhookHandler
+                from linebot.v3.webhooks import MessageEvent, TextMessageContent, PostbackEvent, LocationMessageContent
 
-    elif template_type == "quick_reply_menu":
-        return create_new_quick_menu()
+                handler = WebhookHandler(CHANNEL_SECRET)
+                handler.add(MessageEvent, message=TextMessageContent)(handle_message)
+                handler.add(MessageEvent, message=LocationMessageContent)(handle_location)
+                handler.add(PostbackEvent)(handle_postback)
+                _line_handler = handler
+    return _line_handler
 
-    elif template_type == "leaderboard":
-        # 使用分頁系統顯示排行榜詳細資料
-        rank = kwargs.get('rank', '1')
-        page = kwargs.get('page', 1)
+# 健康檢查 API
+@app.route('/api/health')
+def health():
+    return {
+        "status": "running",
+        "bot_configured": configuration is not None
+    }
 
-        return create_paginated_leaderboard(int(rank), page)
+# 排程工作 API（Vercel cron 會帶 Authorization: Bearer $CRON_SECRET）
+CRON_SECRET = os.environ.get('CRON_SECRET')
 
-    elif template_type == "leaderboard_list":
-        # 排行榜列表模板 - 僅從網站抓取資料（無模擬回退）
-        leaderboard_data = scrape_leaderboard_data()
+def _is_cron_authorized():
+    if not CRON_SECRET:
+        return False
+    auth = request.headers.get('Authorization', '')
+    return hmac.compare_digest(auth.encode(), f"Bearer {CRON_SECRET}".encode())
+
+@app.route('/api/jobs')
+def jobs_status():
+    if not _is_cron_authorized():
+        return {"error": "unauthorized"}, 401
+    return {"jobs": scheduler.get_job_status()}
+
+@app.route('/api/jobs/<name>/run', methods=['GET', 'POST'])
+def run_scheduled_job(name):
+    if not _is_cron_authorized():
+        return {"error": "unauthorized"}, 401
+    try:
+        result = scheduler.run_job(name)
+    except KeyError:
+        return {"error": f"unknown job: {name}"}, 404
+    logger.info(f"⏱️ 排程工作 {name}: {result['status']}")
+    status_code = 500 if result['status'] == 'failed' else 200
+    return result, status_code
 
-        # 創建排行榜項目
-        leaderboard_contents = []
+# 程序內指標（Flex 大小等），與排程 API 使用相同驗證
+@app.route('/api/metrics')
+def metrics_snapshot():
+    if not _is_cron_authorized():
+        return {"error": "unauthorized"}, 401
+    return metrics.snapshot()
 
-        # 根據排名順序顯示前5名
-        for rank in range(1, 6):
-            rank_str = str(rank)
-            if rank_str in leaderboard_data:
-                data = leaderboard_data[rank_str]
+# ---- 文字訊息路由（依關鍵字匹配到的模板名稱） ----
 
-                # 根據排名設定圖標
-                rank_icons = {1: "🥇", 2: "🥈", 3: "🥉", 4: "🏅", 5: "🎖️"}
-                icon = rank_icons.get(rank, "🏆")
+message_routes = Router('message')
 
-                leaderboard_contents.append({
-                    "type": "box",
-                    "layout": "horizontal",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "vertical",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": f"{icon} 第{rank}名",
-                                    "weight": "bold",
-                                    "size": "sm",
-                                    "color": data["color"]
-                                },
-                                {
-                                    "type": "text",
-                                    "text": data.get('title', data.get('destination', '未知行程')),
-                                    "size": "xs",
-                                    "color": THEME_TEXT_SECONDARY,
-                                    "marginTop": "xs",
-                                    "wrap": True
-                                },
-                                {
-                                    "type": "text",
-                                    "text": f"⏰ {data.get('duration', '未知天數')}",
-                                    "size": "xs",
-                                    "color": "#888888",
-                                    "marginTop": "xs"
-                                }
-                            ],
-                            "flex": 1
-                        }
-                    ],
-                    "paddingAll": "sm",
-                    "backgroundColor": "#f8f9fa",
-                    "cornerRadius": "md",
-                    "marginBottom": "sm"
-                })
 
-        return {
-            "type": "bubble",
-            "size": "giga",
-            "header": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "🏆 TourHub 排行榜",
-                        "weight": "bold",
-                        "size": "lg",
-                        "color": "#ffffff",
-                        "align": "center"
-                    },
-                    {
-                        "type": "text",
-                        "text": "熱門旅遊行程排名",
-                        "size": "sm",
-                        "color": "#ffffff",
-                        "align": "center",
-                        "margin": "sm"
-                    }
-                ],
-                "backgroundColor": "#FF6B6B",
-                "paddingAll": "20px"
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": leaderboard_contents,
-                "paddingAll": "20px"
-            },
-            "footer": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "button",
-                        "action": {
-                            "type": "uri",
-                            "label": "查看完整排行榜",
-                            "uri": "https://tourhub-ashy.vercel.app/"
-                        },
-                        "style": "primary",
-                        "color": "#FF6B6B",
-                        "height": "sm"
-                    }
-                ],
-                "paddingAll": "20px"
-            }
-        }
+@message_routes.route('feature', 'feature_detail')
+def _route_feature(template_config, line_user_id):
+    return create_simple_flex_message(template_config["template"], feature_name=template_config["feature_name"])
 
-    elif template_type == "leaderboard_top10":
-        # 以 carousel 顯示前10名（來源：資料庫）
-        rank_colors = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
-        try:
-            from api.database import get_database_connection
-            connection = get_database_connection()
-            results = []
-            if connection:
-                cursor = connection.cursor(dictionary=True)
-                leaderboard_query = """
-                SELECT
-                    t.trip_id,
-                    t.title,
-                    t.area,
-                    t.start_date,
-                    t.end_date
-                FROM line_trips t
-                LEFT JOIN trip_stats ts ON t.trip_id = ts.trip_id
-                WHERE t.trip_id IS NOT NULL
-                ORDER BY ts.popularity_score DESC, ts.favorite_count DESC, ts.share_count DESC
-                LIMIT 10
-                """
-                cursor.execute(leaderboard_query)
-                results = cursor.fetchall() or []
-                cursor.close()
-                connection.close()
-        except Exception as e:
-            logger.error(f"查詢 Top10 失敗: {e}")
-            results = []
-
-        def build_duration_days(row):
-            try:
-                if row.get('start_date') and row.get('end_date'):
-                    days = (row['end_date'] - row['start_date']).days + 1
-                    return f"{days}天{days-1}夜" if days and days > 1 else "1天"
-            except Exception:
-                return ""
-            return ""
 
-        bubbles = []
-        for rank in range(1, 11):
-            idx = rank - 1
-            if idx < len(results):
-                row = results[idx]
-                color = rank_colors.get(rank, "#6C5CE7")
-                title = row.get('title') or f"第{rank}名行程"
-                destination = row.get('area') or ""
-                duration = build_duration_days(row)
-
-                body_contents = [
-                    {"type": "text", "text": title, "weight": "bold", "size": "md", "color": "#333333", "wrap": True}
-                ]
-                if destination:
-                    body_contents.append({"type": "text", "text": f"目的地：{destination}", "size": "sm", "color": "#555555", "margin": "md"})
-                if duration:
-                    body_contents.append({"type": "text", "text": f"行程天數：{duration}", "size": "sm", "color": "#555555"})
-
-                footer_buttons = [
-                    {"type": "button", "action": {"type": "postback", "label": "查看詳細行程 📋", "data": f"action=leaderboard_page&rank={rank}&page=2"}, "style": "primary", "color": color, "height": "sm"},
-                    {"type": "button", "action": {"type": "postback", "label": "加入收藏 ❤️", "data": f"action=favorite_add&rank={rank}"}, "style": "secondary", "height": "sm", "margin": "sm"}
-                ]
-
-                bubbles.append({
-                    "type": "bubble",
-                    "size": "kilo",
-                    "header": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {"type": "text", "text": f"🏆 第{rank}名", "weight": "bold", "size": "lg", "color": "#ffffff", "align": "center"}
-                        ],
-                        "backgroundColor": color,
-                        "paddingAll": "20px"
-                    },
-                    "body": {"type": "box", "layout": "vertical", "contents": body_contents, "paddingAll": "20px"},
-                    "footer": {"type": "box", "layout": "vertical", "contents": footer_buttons, "paddingAll": "20px"}
-                })
-            else:
-                color = rank_colors.get(rank, "#6C5CE7")
-                bubbles.append({
-                    "type": "bubble",
-                    "size": "kilo",
-                    "header": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {"type": "text", "text": f"🏆 第{rank}名", "weight": "bold", "size": "lg", "color": "#ffffff", "align": "center"}
-                        ],
-                        "backgroundColor": color,
-                        "paddingAll": "20px"
-                    },
-                    "body": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {"type": "text", "text": "無行程內容", "align": "center", "color": "#666666"}
-                        ],
-                        "paddingAll": "20px"
-                    }
-                })
-
-        return {"type": "carousel", "contents": bubbles}
-
-    elif template_type == "my_favorites":
-        # 顯示使用者收藏的排行榜名次
-        line_user_id = kwargs.get('line_user_id')
-        favorites = []
-        if line_user_id:
-            # 先試 DB，再回退記憶體
-            try:
-                from api.database import get_user_favorites_db
-                favorites = get_user_favorites_db(line_user_id)
-                if not favorites:
-                    favorites = sorted(list(_get_user_favorites_memory(line_user_id)))
-            except Exception:
-                favorites = sorted(list(_get_user_favorites_memory(line_user_id)))
-        if not favorites:
-            return {
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {"type": "text", "text": "您尚未收藏任何行程名次", "align": "center", "color": "#666666", "wrap": True},
-                        {"type": "text", "text": "在排行榜卡片點『加入收藏』即可新增", "size": "xs", "align": "center", "color": "#888888", "margin": "md"}
-                    ],
-                    "paddingAll": "20px"
-                }
-            }
+@message_routes.route('leaderboard', 'leaderboard_details')
+def _route_leaderboard(template_config, line_user_id):
+    logger.info(f"🔧 創建 {template_config['template']} Flex Message, rank: {template_config['rank']}")
+    flex_message = create_simple_flex_message(template_config["template"], rank=template_config["rank"])
+    logger.info(f"🔧 {template_config['template']} Flex Message 創建結果: {bool(flex_message)}")
+    return flex_message
 
-        # 將收藏的名次轉成 carousel 卡片（每張附移除收藏）
-        bubbles = []
-        for rank in favorites[:10]:
-            sub = create_simple_flex_message("leaderboard", rank=str(rank))
-            if sub and sub.get('type') == 'bubble':
-                # 附加一個移除收藏按鈕
-                sub = dict(sub)  # 淺拷貝
-                footer = sub.get('footer') or {"type": "box", "layout": "vertical", "contents": [], "paddingAll": "20px"}
-                contents = footer.get('contents', [])
-                # 在「我的收藏」清單中，不顯示「加入收藏」按鈕
-                filtered_contents = []
-                for c in contents:
-                    try:
-                        action = c.get('action', {})
-                        data = action.get('data', '') if isinstance(action, dict) else ''
-                        if isinstance(c, dict) and isinstance(action, dict) and isinstance(data, str):
-                            if 'action=favorite_add' in data:
-                                continue
-                    except Exception:
-                        pass
-                    filtered_contents.append(c)
-                contents = filtered_contents
-                contents.append({
-                    "type": "button",
-                    "action": {"type": "postback", "label": "移除收藏 🗑️", "data": f"action=favorite_remove&rank={rank}"},
-                    "style": "secondary",
-                    "height": "sm",
-                    "margin": "sm"
-                })
-                footer['contents'] = contents
-                sub['footer'] = footer
-                bubbles.append(sub)
-        if not bubbles:
-            return {
-                "type": "bubble",
-                "body": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "暫無有效收藏可顯示", "align": "center", "color": "#666666"}]}
-            }
-        return {"type": "carousel", "contents": bubbles}
 
-    elif template_type == "locker_nearby_prompt":
-        return {
-            "type": "bubble",
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {"type": "text", "text": "請分享您目前位置，以尋找附近的置物櫃", "wrap": True, "align": "center", "color": "#555555"}
-                ],
-                "paddingAll": "20px"
-            }
+@message_routes.route('location_trips')
+def _route_location_trips(template_config, line_user_id):
+    return create_simple_flex_message("location_trips", location=template_config["location"])
+
+
+@message_routes.route('tour_clock')
+def _route_tour_clock(template_config, line_user_id):
+    # TourClock 使用 feature 模板
+    return create_simple_flex_message("feature", feature_name="tour_clock")
+
+
+@message_routes.route('user_account', 'binding_status', 'my_favorites')
+def _route_user_template(template_config, line_user_id):
+    return create_simple_flex_message(template_config["template"], line_user_id=line_user_id)
+
+
+@message_routes.route('leaderboard_list', 'help', 'feature_menu', 'creation_help', 'rebind_confirm',
+                      'leaderboard_top10', 'locker_nearby_prompt', 'quick_reply_menu')
+def _route_static_template(template_config, line_user_id):
+    return create_simple_flex_message(template_config["template"])
+
+
+@message_routes.default
+def _route_default(template_config, line_user_id):
+    return create_simple_flex_message("default")
+
+
+# ---- Postback 路由（依 action） ----
+
+postback_routes = Router('postback')
+
+
+def _favorite_notice(notice):
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": notice, "wrap": True, "align": "center", "color": "#555555"},
+                {"type": "separator", "margin": "lg"},
+                {"type": "text", "text": "輸入『我的收藏』查看清單", "size": "xs", "align": "center", "color": "#888888", "margin": "md"}
+            ],
+            "paddingAll": "20px"
         }
+    }
 
-    elif template_type == "leaderboard_details":
-        # 直接從資料庫獲取詳細行程
-        rank = kwargs.get('rank', '1')
-        rank_int = int(rank)
 
-        # 直接從資料庫查詢詳細行程
-        try:
-            from api.database import get_database_connection
-            connection = get_database_connection()
-            if not connection:
-                raise Exception("資料庫連接失敗")
-
-            cursor = connection.cursor(dictionary=True)
-
-            # 查詢排行榜中指定排名的行程
-            leaderboard_query = """
-            SELECT
-                t.trip_id,
-                t.title,
-                t.area,
-                t.start_date,
-                t.end_date
-            FROM line_trips t
-            LEFT JOIN trip_stats ts ON t.trip_id = ts.trip_id
-            WHERE t.trip_id IS NOT NULL
-            ORDER BY ts.popularity_score DESC, ts.favorite_count DESC, ts.share_count DESC
-            LIMIT %s, 1
-            """
-
-            cursor.execute(leaderboard_query, (rank_int - 1,))
-            trip_data = cursor.fetchone()
-
-            if not trip_data:
-                cursor.close()
-                connection.close()
-                raise Exception(f"找不到第{rank_int}名的行程")
-
-            trip_id = trip_data['trip_id']
-
-            # 查詢詳細行程安排
-            details_query = """
-            SELECT
-                location,
-                date,
-                start_time,
-                end_time,
-                description
-            FROM line_trip_details
-            WHERE trip_id = %s
-            ORDER BY date, start_time
-            """
-
-            cursor.execute(details_query, (trip_id,))
-            details = cursor.fetchall()
-
-            cursor.close()
-            connection.close()
-
-            # 組織資料
-            rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
-            rank_colors = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
-
-            data = {
-                "trip_id": trip_data['trip_id'],
-                "rank": rank_int,
-                "rank_title": rank_titles.get(rank_int, f"🎖️ 第{rank_int}名"),
-                "title": trip_data['title'] or f"第{rank_int}名行程",
-                "color": rank_colors.get(rank_int, "#9B59B6"),
-                "area": trip_data['area'] or "未知地區",
-                "details": details
-            }
+@postback_routes.route('leaderboard_page')
+def _postback_leaderboard_page(params, line_user_id):
+    # 排行榜分頁
+    return create_paginated_leaderboard(int(params['rank']), int(params.get('page', '1')))
 
-        except Exception as e:
-            logger.error(f"資料庫查詢失敗: {e}")
-            data = None
 
-        if not data:
-            # 如果沒有詳細行程，顯示提示訊息
-            rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
-            return {
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": f"抱歉，{rank_titles.get(rank_int, f'第{rank_int}名')}的詳細行程安排暫時無法提供。",
-                            "wrap": True,
-                            "color": THEME_TEXT_SECONDARY,
-                            "align": "center"
-                        }
-                    ],
-                    "paddingAll": "20px"
-                }
-            }
+@postback_routes.route('rankings_more')
+def _postback_rankings_more(params, line_user_id):
+    # 排行榜第 11 名之後的分頁
+    return create_rankings_page(params.get('c'))
 
-        # 格式化資料庫的詳細行程資料
-        def format_database_itinerary(details):
-            """格式化資料庫的行程詳細資料"""
-            if not details:
-                return "暫無詳細行程安排"
 
-            formatted_lines = []
+@postback_routes.route('itinerary_page')
+def _postback_itinerary_page(params, line_user_id):
+    # 詳細行程分頁
+    return create_paginated_itinerary(int(params['rank']), int(params.get('page', '1')))
 
-            for detail in details:
-                # 處理日期
-                if detail['date']:
-                    date_obj = detail['date']
-                    weekdays = ['一', '二', '三', '四', '五', '六', '日']
-                    weekday = weekdays[date_obj.weekday()]
-                    date_str = f"📅 {date_obj.month}/{date_obj.day} ({weekday})"
-                    formatted_lines.append(date_str)
 
-                # 處理時間和地點
-                time_str = ""
-                if detail['start_time'] and detail['end_time']:
-                    start_time = str(detail['start_time'])
-                    end_time = str(detail['end_time'])
-
-                    # 如果是 timedelta 格式，轉換為時間格式
-                    if ':' in start_time and len(start_time) > 8:
-                        start_time = start_time[:8]  # 取 HH:MM:SS
-                    if ':' in end_time and len(end_time) > 8:
-                        end_time = end_time[:8]
-
-                    time_str = f"🕐 {start_time} - {end_time}"
-                elif detail['start_time']:
-                    start_time = str(detail['start_time'])
-                    if ':' in start_time and len(start_time) > 8:
-                        start_time = start_time[:8]
-                    time_str = f"🕐 {start_time}"
-
-                # 地點
-                location = detail['location'] or "未知地點"
-                location_str = f"📍 {location}"
+@postback_routes.route('feature_detail')
+def _postback_feature_detail(params, line_user_id):
+    # 功能詳細介紹
+    feature = params.get('feature')
+    if not feature:
+        return None
+    logger.info(f"🔧 創建功能詳細介紹: {feature}")
+    return create_simple_flex_message("feature_detail", feature_name=feature)
 
-                # 添加時間和地點
-                if time_str:
-                    formatted_lines.append(f"{time_str} {location}")
-                else:
-                    formatted_lines.append(location_str)
 
-                # 添加空行分隔
-                formatted_lines.append("")
+@postback_routes.route('back_to_menu')
+def _postback_back_to_menu(params, line_user_id):
+    return create_simple_flex_message("feature_menu")
 
-            # 移除最後的空行
-            if formatted_lines and formatted_lines[-1] == "":
-                formatted_lines.pop()
 
-            # 限制行數，避免內容過長
-            if len(formatted_lines) > 25:
-                formatted_lines = formatted_lines[:25]
-                formatted_lines.append("...")
-                formatted_lines.append("💡 完整行程請查看 TourHub 網站")
+@postback_routes.route('binding_status')
+def _postback_binding_status(params, line_user_id):
+    return create_simple_flex_message("binding_status", line_user_id=line_user_id)
 
-            return '\n'.join(formatted_lines)
 
-        # 創建優化的 Flex Message 結構
-        return create_optimized_flex_itinerary(data)
+@postback_routes.route('rebind_confirm')
+def _postback_rebind_confirm(params, line_user_id):
+    return create_simple_flex_message("rebind_confirm")
 
-    elif template_type == "location_trips":
-        # 地區行程查詢模板 - 從資料庫獲取資料
-        location = kwargs.get('location', '未知地區')
 
-        # 從資料庫獲取地區行程資料
-        trips = get_trips_by_location(location)
+@postback_routes.route('rebind_execute', 'rebind_all')
+def _postback_rebind_execute(params, line_user_id):
+    return execute_rebind(line_user_id)
 
-        # 若無資料，回傳提示訊息
-        if not trips:
-            return {
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": f"抱歉，暫無 {location} 的行程資料",
-                            "wrap": True,
-                            "color": THEME_TEXT_SECONDARY,
-                            "align": "center"
-                        }
-                    ],
-                    "paddingAll": "20px"
-                }
-            }
 
-        # 創建行程內容
-        trip_contents = []
-        for trip in trips:
-            trip_contents.append({
-                "type": "box",
-                "layout": "horizontal",
-                "contents": [
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "text": trip["title"],
-                                "weight": "bold",
-                                "size": "sm",
-                                "color": "#555555"
-                            },
-                            {
-                                "type": "text",
-                                "text": f"⏰ {trip['duration']}",
-                                "size": "xs",
-                                "color": "#888888",
-                                "marginTop": "sm"
-                            },
-                            {
-                                "type": "text",
-                                "text": f"📍 {trip['highlights']}",
-                                "size": "xs",
-                                "color": "#888888",
-                                "wrap": True,
-                                "marginTop": "sm"
-                            }
-                        ],
-                        "flex": 1
-                    }
-                ],
-                "marginBottom": "md",
-                "paddingAll": "sm",
-                "backgroundColor": "#f8f9fa",
-                "cornerRadius": "md"
-            })
+@postback_routes.route('locker_next')
+def _postback_locker_next(params, line_user_id):
+    # 置物櫃分頁：以 push 送出新的置物櫃卡片
+    try:
+        from api.locker_service import build_locker_with_pagination
+        current_index = int(params.get('index', 0))
+        logger.info(f"🔧 置物櫃分頁: index={current_index}, user={line_user_id}")
+
+        flex_message = build_locker_with_pagination(line_user_id, current_index)
+        push_flex(configuration, line_user_id, "附近置物櫃", apply_modern_theme(flex_message), template="locker_next")
+        logger.info("✅ 置物櫃分頁更新成功")
+        return HANDLED
+    except Exception as e:
+        logger.error(f"❌ 置物櫃分頁處理失敗: {e}")
+        return create_simple_flex_message("default")
 
-        return {
-            "type": "bubble",
-            "size": "giga",
-            "header": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": f"🗺️ {location} 行程推薦",
-                        "weight": "bold",
-                        "size": "lg",
-                        "color": "#ffffff",
-                        "align": "center"
-                    },
-                    {
-                        "type": "text",
-                        "text": "為您精選的熱門行程",
-                        "size": "sm",
-                        "color": "#ffffff",
-                        "align": "center",
-                        "margin": "sm"
-                    }
-                ],
-                "backgroundColor": "#9B59B6",
-                "paddingAll": "20px"
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": trip_contents,
-                "paddingAll": "20px"
-            },
-            "footer": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "💡 更多行程請訪問我們的網站",
-                        "size": "xs",
-                        "color": "#666666",
-                        "align": "center",
-                        "wrap": True
-                    }
-                ],
-                "paddingAll": "20px"
-            }
-        }
 
-    # 預設回應：直接顯示快速選單
-    return create_new_quick_menu()
+@postback_routes.route('favorite_add')
+def _postback_favorite_add(params, line_user_id):
+    # 加入收藏（排行榜名次）
+    rank = params['rank']
+    try:
+        status = add_favorite(line_user_id, int(rank))
+    except Exception:
+        status = None
+    if status == favorites.CHANGED:
+        notice = f"已加入收藏：第{rank}名"
+    elif status == favorites.UNCHANGED:
+        notice = f"已在收藏：第{rank}名"
+    elif status == favorites.PENDING:
+        notice = f"收藏暫時無法儲存，稍後自動重試：第{rank}名"
+    else:
+        notice = "加入收藏失敗"
+    return _favorite_notice(notice)
 
-# 環境變數檢查
-CHANNEL_ACCESS_TOKEN = os.environ.get('CHANNEL_ACCESS_TOKEN')
-CHANNEL_SECRET = os.environ.get('CHANNEL_SECRET')
 
-if CHANNEL_ACCESS_TOKEN and CHANNEL_SECRET:
-    configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
-    line_handler = WebhookHandler(CHANNEL_SECRET)
-    logger.info("LINE Bot 設定成功")
-else:
-    configuration = None
-    line_handler = None
-    logger.warning("LINE Bot 環境變數未設定")
+@postback_routes.route('favorite_remove')
+def _postback_favorite_remove(params, line_user_id):
+    # 取消收藏
+    rank = params['rank']
+    try:
+        status = remove_favorite(line_user_id, int(rank))
+    except Exception:
+        status = None
+    if status == favorites.CHANGED:
+        notice = f"已移除收藏：第{rank}名"
+    elif status == favorites.UNCHANGED:
+        notice = f"收藏內沒有：第{rank}名"
+    elif status == favorites.PENDING:
+        notice = f"取消收藏暫時無法儲存，稍後自動重試：第{rank}名"
+    else:
+        notice = "移除收藏失敗"
+    return _favorite_notice(notice)
+
+
+@postback_routes.route('quick_reply')
+def _postback_quick_reply(params, line_user_id):
+    logger.info(f"🔧 處理快速回覆: {params}")
+    return handle_quick_reply(params, line_user_id)
 
-# 健康檢查 API
-@app.route('/api/health')
-def health():
-    return {
-        "status": "running",
-        "bot_configured": configuration is not None
-    }
 
 # LINE Bot callback
 @app.route('/callback', methods=['POST'])
 def callback():
     logger.info("📥 收到 callback 請求")
 
+    line_handler = get_line_handler()
     if not line_handler:
         logger.error("❌ Line handler 未設定")
         return "Bot not configured", 500
 
+    from linebot.v3.exceptions import InvalidSignatureError
+
     try:
         signature = request.headers.get('X-Line-Signature')
         if not signature:
@@ -2367,6 +2425,9 @@ def callback():
         body = request.get_data(as_text=True)
         logger.info(f"📥 收到請求 body 長度: {len(body)}")
 
+        # 設定有新版本時在背景載入，本次請求沿用目前版本
+        config_store.poll()
+
         line_handler.handle(body, signature)
         logger.info("✅ Callback 處理完成")
         return 'OK'
@@ -2380,374 +2441,155 @@ def callback():
         logger.error(f"❌ 錯誤詳情: {traceback.format_exc()}")
         return "Internal error", 500
 
-# 訊息處理
-if line_handler:
-    @line_handler.add(MessageEvent, message=TextMessageContent)
-    def handle_message(event):
-        try:
-            user_message = event.message.text
-            logger.info(f"🔍 收到訊息: '{user_message}'")
-            logger.info(f"🔍 訊息長度: {len(user_message)}")
-            logger.info(f"🔍 訊息類型: {type(user_message)}")
+# 訊息處理（由 get_line_handler 註冊到 webhook handler）
+def handle_message(event):
+    try:
+        user_message = event.message.text
+        logger.info(f"🔍 收到訊息: '{user_message}'")
+        logger.info(f"🔍 訊息長度: {len(user_message)}")
+        logger.info(f"🔍 訊息類型: {type(user_message)}")
+
+        # 獲取用戶 ID
+        line_user_id = event.source.user_id if hasattr(event.source, 'user_id') else 'unknown'
+
+        # 路由決定（第 n 名查詢 / 關鍵字模板）只依訊息文字，重複的訊息直接查快取；
+        # 可能是內容創建指令的訊息會寫入資料，每次都要解析，不讀也不寫快取
+        matcher, routing_cache = config_store.get_artifact('routing')
+        cache_key = normalize_message(user_message)
+        creation_candidate = creation_gate.allows(user_message)
+        route = None if creation_candidate else routing_cache.get(cache_key)
+        if route is None:
+            route = _resolve_rank_route(user_message)
+            if route is None:
+                creation_result = None
+                if creation_candidate:
+                    creation_result = content_creator.parse_and_create(user_message, line_user_id)
+                if creation_result:
+                    response_message = create_creation_response(creation_result)
+
+                    reply_flex(configuration, event.reply_token, "內容創建結果", apply_modern_theme(response_message), template="creation_response")
+                    logger.info("✅ 內容創建結果發送成功")
+                    return
 
-            # 獲取用戶 ID
-            line_user_id = event.source.user_id if hasattr(event.source, 'user_id') else 'unknown'
+                template_config = get_message_template(user_message, matcher)
+                route = ("template", template_config)
+            if not creation_candidate:
+                routing_cache.put(cache_key, route)
 
-            # 先檢查是否為第 n 名的快速查詢
-            parsed = parse_rank_request(user_message)
-            if parsed:
-                template_key, rank = parsed
-                if template_key == "leaderboard":
-                    flex_message = create_simple_flex_message("leaderboard", rank=str(rank))
-                else:
-                    flex_message = create_simple_flex_message("leaderboard_details", rank=str(rank))
-
-                with ApiClient(configuration) as api_client:
-                    line_bot_api = MessagingApi(api_client)
-                    themed = apply_modern_theme(flex_message)
-                    line_bot_api.reply_message_with_http_info(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[FlexMessage(alt_text="TourHub 排行榜", contents=FlexContainer.from_dict(themed))]
-                        )
-                    )
-                return
-
-            # 再檢查是否為內容創建指令
-            creation_result = content_creator.parse_and_create(user_message, line_user_id)
-            if creation_result:
-                response_message = create_creation_response(creation_result)
-
-                with ApiClient(configuration) as api_client:
-                    line_bot_api = MessagingApi(api_client)
-                    themed = apply_modern_theme(response_message)
-                    line_bot_api.reply_message_with_http_info(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[FlexMessage(alt_text="內容創建結果", contents=FlexContainer.from_dict(themed))]
-                        )
-                    )
-                    logger.info("✅ 內容創建結果發送成功")
-                return
-
-
-
-            # 檢查模板匹配
-            template_config = get_message_template(user_message)
-            logger.info(f"🔍 關鍵字匹配結果: {template_config}")
-
-            if template_config:
-                logger.info(f"✅ 匹配到模板: {template_config['template']}, rank: {template_config.get('rank', 'N/A')}")
-
-                # 創建 Flex Message
-                if template_config["template"] == "feature":
-                    flex_message = create_simple_flex_message(
-                        "feature",
-                        feature_name=template_config["feature_name"]
-                    )
-                elif template_config["template"] == "leaderboard":
-                    logger.info(f"🔧 創建 leaderboard Flex Message, rank: {template_config['rank']}")
-                    flex_message = create_simple_flex_message(
-                        "leaderboard",
-                        rank=template_config["rank"]
-                    )
-                    logger.info(f"🔧 leaderboard Flex Message 創建結果: {bool(flex_message)}")
-                elif template_config["template"] == "leaderboard_list":
-                    logger.info(f"🔧 創建 leaderboard_list Flex Message")
-                    flex_message = create_simple_flex_message("leaderboard_list")
-                    logger.info(f"🔧 leaderboard_list Flex Message 創建結果: {bool(flex_message)}")
-                elif template_config["template"] == "leaderboard_details":
-                    logger.info(f"🔧 創建 leaderboard_details 優化 Flex Message, rank: {template_config['rank']}")
-                    flex_message = create_simple_flex_message(
-                        "leaderboard_details",
-                        rank=template_config["rank"]
-                    )
-                    logger.info(f"🔧 leaderboard_details Flex Message 創建結果: {bool(flex_message)}")
-                elif template_config["template"] == "location_trips":
-                    flex_message = create_simple_flex_message(
-                        "location_trips",
-                        location=template_config["location"]
-                    )
-                elif template_config["template"] == "help":
-                    flex_message = create_simple_flex_message("help")
-                elif template_config["template"] == "feature_menu":
-                    flex_message = create_simple_flex_message("feature_menu")
-                elif template_config["template"] == "feature_detail":
-                    flex_message = create_simple_flex_message(
-                        "feature_detail",
-                        feature_name=template_config["feature_name"]
-                    )
-                elif template_config["template"] == "tour_clock":
-                    # TourClock 使用 feature 模板
-                    flex_message = create_simple_flex_message(
-                        "feature",
-                        feature_name="tour_clock"
-                    )
-
-                elif template_config["template"] == "creation_help":
-                    flex_message = create_simple_flex_message("creation_help")
-                elif template_config["template"] == "user_account":
-                    flex_message = create_simple_flex_message("user_account", line_user_id=line_user_id)
-                elif template_config["template"] == "binding_status":
-                    flex_message = create_simple_flex_message("binding_status", line_user_id=line_user_id)
-                elif template_config["template"] == "rebind_confirm":
-                    flex_message = create_simple_flex_message("rebind_confirm")
-                elif template_config["template"] == "my_favorites":
-                    flex_message = create_simple_flex_message("my_favorites", line_user_id=line_user_id)
-                elif template_config["template"] == "leaderboard_top10":
-                    flex_message = create_simple_flex_message("leaderboard_top10")
-                elif template_config["template"] == "locker_nearby_prompt":
-                    flex_message = create_simple_flex_message("locker_nearby_prompt")
-                elif template_config["template"] == "quick_reply_menu":
-                    logger.info("🔧 創建快速選單")
-                    flex_message = create_simple_flex_message("quick_reply_menu")
-                    logger.info(f"🔧 快速選單創建結果: {bool(flex_message)}")
-                else:
-                    # 預設回應
-                    flex_message = create_simple_flex_message("default")
-            else:
-                logger.info("❌ 沒有匹配的模板，使用預設回應")
-                flex_message = create_simple_flex_message("default")
-
-            # 發送消息（統一套用藍白主題）
-            logger.info(f"📤 準備發送訊息，Flex Message 存在: {bool(flex_message)}")
-            if flex_message:
-                logger.info(f"📤 Flex Message 類型: {flex_message.get('type', 'N/A')}")
-
-            with ApiClient(configuration) as api_client:
-                line_bot_api = MessagingApi(api_client)
-                themed = apply_modern_theme(flex_message)
-                line_bot_api.reply_message_with_http_info(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[FlexMessage(alt_text="TourHub Bot", contents=FlexContainer.from_dict(themed))]
-                    )
-                )
-                logger.info("✅ 訊息發送成功")
-                
-        except Exception as e:
-            logger.error(f"❌ 處理訊息錯誤: {str(e)}")
-            import traceback
-            logger.error(f"❌ 錯誤詳情: {traceback.format_exc()}")
-
-            # 嘗試發送錯誤訊息給用戶
-            try:
-                error_message = create_simple_flex_message("default")
-                with ApiClient(configuration) as api_client:
-                    line_bot_api = MessagingApi(api_client)
-                    line_bot_api.reply_message_with_http_info(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[FlexMessage(alt_text="TourHub Bot Error", contents=FlexContainer.from_dict(error_message))]
-                        )
-                    )
-                    logger.info("🔧 錯誤回應發送成功")
-            except Exception as send_error:
-                logger.error(f"❌ 發送錯誤回應也失敗: {send_error}")
-
-    # 位置訊息處理（附近置物櫃）
-    @line_handler.add(MessageEvent, message=LocationMessageContent)
-    def handle_location(event):
-        try:
-            latitude = getattr(event.message, 'latitude', None)
-            longitude = getattr(event.message, 'longitude', None)
-            logger.info(f"📍 收到位置: lat={latitude}, lng={longitude}")
-
-            # 使用 locker_service 查詢真實資料
-            try:
-                from api.locker_service import get_station_specific_lockers, build_lockers_carousel, store_user_locker_session
-                lockers = get_station_specific_lockers(latitude, longitude)
-                # 存儲用戶會話數據
-                line_user_id = event.source.user_id if hasattr(event.source, 'user_id') else 'unknown'
-                store_user_locker_session(line_user_id, lockers, user_lat=latitude, user_lng=longitude)
-                # 顯示第一個置物櫃
-                flex_message = build_lockers_carousel(lockers, 0, latitude, longitude)
-            except Exception as e:
-                logger.error(f"locker_service 失敗，改回 mock: {e}")
-                # 最後回退：一張提示卡
-                flex_message = {
-                    "type": "bubble",
-                    "body": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "暫時無法取得附近置物櫃，稍後再試", "align": "center", "color": "#666666"}], "paddingAll": "20px"}
-                }
+        route_kind, template_config = route
+        if route_kind == "rank":
+            # 第 n 名的快速查詢
+            flex_message = message_routes.dispatch(template_config["template"], template_config, line_user_id)
+            reply_flex(configuration, event.reply_token, "TourHub 排行榜", apply_modern_theme(flex_message), template=template_config["template"])
+            return
 
-            with ApiClient(configuration) as api_client:
-                line_bot_api = MessagingApi(api_client)
-                themed = apply_modern_theme(flex_message)
-                response = line_bot_api.reply_message_with_http_info(
-                    ReplyMessageRequest(
-                        reply_token=event.reply_token,
-                        messages=[FlexMessage(alt_text="附近置物櫃", contents=FlexContainer.from_dict(themed))]
-                    )
-                )
-                # 獲取消息ID並更新會話
-                if hasattr(response, 'headers') and 'x-line-request-id' in response.headers:
-                    message_id = response.headers['x-line-request-id']
-                    from api.locker_service import store_user_locker_session
-                    store_user_locker_session(line_user_id, lockers, message_id)
-                logger.info("✅ 附近置物櫃回覆成功")
-        except Exception as e:
-            logger.error(f"❌ 處理位置訊息錯誤: {str(e)}")
+        logger.info(f"🔍 關鍵字匹配結果: {template_config}")
+
+        if template_config:
+            logger.info(f"✅ 匹配到模板: {template_config['template']}, rank: {template_config.get('rank', 'N/A')}")
+
+            flex_message = message_routes.dispatch(template_config["template"], template_config, line_user_id)
+        else:
+            logger.info("❌ 沒有匹配的模板，使用預設回應")
+            flex_message = create_simple_flex_message("default")
+
+        # 發送消息（統一套用藍白主題）
+        logger.info(f"📤 準備發送訊息，Flex Message 存在: {bool(flex_message)}")
+        if flex_message:
+            logger.info(f"📤 Flex Message 類型: {flex_message.get('type', 'N/A')}")
+
+        template_name = template_config["template"] if template_config else "default"
+        reply_flex(configuration, event.reply_token, "TourHub Bot", apply_modern_theme(flex_message), template=template_name)
+        logger.info("✅ 訊息發送成功")
+            
+    except Exception as e:
+        logger.error(f"❌ 處理訊息錯誤: {str(e)}")
+        import traceback
+        logger.error(f"❌ 錯誤詳情: {traceback.format_exc()}")
 
-    # Postback 事件處理（分頁按鈕／收藏）
-    @line_handler.add(PostbackEvent)
-    def handle_postback(event):
+        # 嘗試發送錯誤訊息給用戶
         try:
-            postback_data = event.postback.data
-            logger.info(f"🔍 收到 postback: {postback_data}")
+            error_message = create_simple_flex_message("default")
+            reply_flex(configuration, event.reply_token, "TourHub Bot Error", error_message, template="error")
+            logger.info("🔧 錯誤回應發送成功")
+        except Exception as send_error:
+            logger.error(f"❌ 發送錯誤回應也失敗: {send_error}")
+
+# 位置訊息處理（附近置物櫃）
+def handle_location(event):
+    try:
+        latitude = getattr(event.message, 'latitude', None)
+        longitude = getattr(event.message, 'longitude', None)
+        logger.info(f"📍 收到位置: lat={latitude}, lng={longitude}")
 
-            # 獲取用戶 ID
+        # 使用 locker_service 查詢真實資料
+        try:
+            from api.locker_service import get_station_specific_lockers, build_lockers_carousel, store_user_locker_session
+            lockers = get_station_specific_lockers(latitude, longitude)
+            # 存儲用戶會話數據
             line_user_id = event.source.user_id if hasattr(event.source, 'user_id') else 'unknown'
+            store_user_locker_session(line_user_id, lockers, user_lat=latitude, user_lng=longitude)
+            # 顯示第一個置物櫃
+            flex_message = build_lockers_carousel(lockers, 0, latitude, longitude)
+        except Exception as e:
+            logger.error(f"locker_service 失敗，改回 mock: {e}")
+            # 最後回退：一張提示卡
+            flex_message = {
+                "type": "bubble",
+                "body": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "暫時無法取得附近置物櫃，稍後再試", "align": "center", "color": "#666666"}], "paddingAll": "20px"}
+            }
 
-            # 解析 postback 資料
-            params = {}
-            for param in postback_data.split('&'):
-                if '=' in param:
-                    key, value = param.split('=', 1)
-                    params[key] = value
-
-            action = params.get('action')
-            rank = params.get('rank', '1')
-            page = int(params.get('page', '1'))
-
-            logger.info(f"🔧 Postback 參數: action={action}, rank={rank}, page={page}, user={line_user_id}")
-
-            flex_message = None
-
-            if action == 'leaderboard_page':
-                # 排行榜分頁
-                flex_message = create_paginated_leaderboard(int(rank), page)
-            elif action == 'itinerary_page':
-                # 詳細行程分頁
-                flex_message = create_paginated_itinerary(int(rank), page)
-            elif action == 'feature_detail':
-                # 功能詳細介紹
-                feature = params.get('feature')
-                if feature:
-                    logger.info(f"🔧 創建功能詳細介紹: {feature}")
-                    flex_message = create_simple_flex_message(
-                        "feature_detail",
-                        feature_name=feature
-                    )
-            elif action == 'back_to_menu':
-                # 返回功能選單
-                logger.info(f"🔧 返回功能選單")
-                flex_message = create_simple_flex_message("feature_menu")
-            elif action == 'binding_status':
-                # 查看綁定狀態
-                logger.info(f"🔧 查看綁定狀態")
-                flex_message = create_simple_flex_message("binding_status", line_user_id=line_user_id)
-            elif action == 'rebind_confirm':
-                # 重新綁定確認
-                logger.info(f"🔧 重新綁定確認")
-                flex_message = create_simple_flex_message("rebind_confirm")
-            elif action == 'rebind_execute' or action == 'rebind_all':
-                # 執行重新綁定
-                logger.info(f"🔧 執行重新綁定")
-                flex_message = execute_rebind(line_user_id)
-            elif action == 'locker_next':
-                # 置物櫃分頁處理 - 使用push_message更新現有消息
-                try:
-                    from api.locker_service import build_locker_with_pagination, get_user_message_id
-                    current_index = int(params.get('index', 0))
-                    logger.info(f"🔧 置物櫃分頁: index={current_index}, user={line_user_id}")
-                    
-                    # 構建新的Flex Message
-                    flex_message = build_locker_with_pagination(line_user_id, current_index)
-                    
-                    # 使用push_message更新現有消息
-                    with ApiClient(configuration) as api_client:
-                        line_bot_api = MessagingApi(api_client)
-                        
-                        # 發送新的Flex Message來替換舊的
-                        themed = apply_modern_theme(flex_message)
-                        line_bot_api.push_message_with_http_info(
-                            PushMessageRequest(
-                                to=line_user_id,
-                                messages=[FlexMessage(alt_text="附近置物櫃", contents=FlexContainer.from_dict(themed))]
-                            )
-                        )
-                        logger.info("✅ 置物櫃分頁更新成功")
-                    
-                    # 不返回flex_message，因為已經直接發送了
-                    return
-                    
-                except Exception as e:
-                    logger.error(f"❌ 置物櫃分頁處理失敗: {e}")
-                    flex_message = create_simple_flex_message("default")
-            elif action == 'favorite_add':
-                # 加入收藏（排行榜名次）
-                try:
-                    added = add_favorite(line_user_id, int(rank))
-                    if added:
-                        notice = f"已加入收藏：第{rank}名"
-                    else:
-                        notice = f"已在收藏：第{rank}名"
-                except Exception:
-                    notice = "加入收藏失敗"
-
-                # 回傳簡短通知卡
-                flex_message = {
-                    "type": "bubble",
-                    "body": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {"type": "text", "text": notice, "wrap": True, "align": "center", "color": "#555555"},
-                            {"type": "separator", "margin": "lg"},
-                            {"type": "text", "text": "輸入『我的收藏』查看清單", "size": "xs", "align": "center", "color": "#888888", "margin": "md"}
-                        ],
-                        "paddingAll": "20px"
-                    }
-                }
-            elif action == 'favorite_remove':
-                # 取消收藏
-                try:
-                    removed = remove_favorite(line_user_id, int(rank))
-                    if removed:
-                        notice = f"已移除收藏：第{rank}名"
-                    else:
-                        notice = f"收藏內沒有：第{rank}名"
-                except Exception:
-                    notice = "移除收藏失敗"
-
-                flex_message = {
-                    "type": "bubble",
-                    "body": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {"type": "text", "text": notice, "wrap": True, "align": "center", "color": "#555555"},
-                            {"type": "separator", "margin": "lg"},
-                            {"type": "text", "text": "輸入『我的收藏』查看清單", "size": "xs", "align": "center", "color": "#888888", "margin": "md"}
-                        ],
-                        "paddingAll": "20px"
-                    }
-                }
-            elif action == 'quick_reply':
-                # 快速回覆處理
-                logger.info(f"🔧 處理快速回覆: {params}")
-                flex_message = handle_quick_reply(params, line_user_id)
-
-
-            if flex_message:
-                logger.info(f"📤 準備發送分頁回應")
-                with ApiClient(configuration) as api_client:
-                    line_bot_api = MessagingApi(api_client)
-                    themed = apply_modern_theme(flex_message)
-                    line_bot_api.reply_message_with_http_info(
-                        ReplyMessageRequest(
-                            reply_token=event.reply_token,
-                            messages=[FlexMessage(alt_text="TourHub Bot", contents=FlexContainer.from_dict(themed))]
-                        )
-                    )
-                    logger.info("✅ 分頁回應發送成功")
-            else:
-                logger.error("❌ 無法創建分頁回應")
+        response = reply_flex(configuration, event.reply_token, "附近置物櫃", apply_modern_theme(flex_message), template="locker_nearby")
+        # 獲取消息ID並更新會話
+        if hasattr(response, 'headers') and 'x-line-request-id' in response.headers:
+            message_id = response.headers['x-line-request-id']
+            from api.locker_service import store_user_locker_session
+            store_user_locker_session(line_user_id, lockers, message_id)
+        logger.info("✅ 附近置物櫃回覆成功")
+    except Exception as e:
+        logger.error(f"❌ 處理位置訊息錯誤: {str(e)}")
 
-        except Exception as e:
-            logger.error(f"❌ 處理 postback 錯誤: {str(e)}")
-            import traceback
-            logger.error(f"❌ 錯誤詳情: {traceback.format_exc()}")
+# Postback 事件處理（分頁按鈕／收藏）
+def handle_postback(event):
+    try:
+        postback_data = event.postback.data
+        logger.info(f"🔍 收到 postback: {postback_data}")
+
+        # 獲取用戶 ID
+        line_user_id = event.source.user_id if hasattr(event.source, 'user_id') else 'unknown'
+
+        # 解析 postback 資料
+        params = {}
+        for param in postback_data.split('&'):
+            if '=' in param:
+                key, value = param.split('=', 1)
+                params[key] = value
+
+        action = params.get('action')
+        rank = params.get('rank', '1')
+        page = int(params.get('page', '1'))
+
+        logger.info(f"🔧 Postback 參數: action={action}, rank={rank}, page={page}, user={line_user_id}")
+
+        params['rank'] = rank
+        flex_message = postback_routes.dispatch(action, params, line_user_id)
+        if flex_message is HANDLED:
+            return
+
+        if flex_message:
+            logger.info(f"📤 準備發送分頁回應")
+            reply_flex(configuration, event.reply_token, "TourHub Bot", apply_modern_theme(flex_message), template=f"postback:{action}")
+            logger.info("✅ 分頁回應發送成功")
+        else:
+            logger.error("❌ 無法創建分頁回應")
+
+    except Exception as e:
+        logger.error(f"❌ 處理 postback 錯誤: {str(e)}")
+        import traceback
+        logger.error(f"❌ 錯誤詳情: {traceback.format_exc()}")
 
 if __name__ == "__main__":
+    # 本機長駐時由背景執行緒依間隔刷新（避免 reloader 子程序重複啟動）
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start_background_scheduler()
     app.run(debug=True, port=5000)
@@ -0,0 +1,69 @@
+"""
+延遲載入工具
+- 冷啟動時不載入用不到的重量級相依（LINE SDK、requests / bs4、mysql.connector）
+- lazy_module：第一次存取屬性時才 import 模組
+- lazy_callable：第一次呼叫時才 import 並取得函式（例如註冊排程工作）
+- 第一次載入耗時記錄在 lazy_import_ms 指標
+"""
+
+import sys
+import time
+import logging
+import importlib
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _import(name: str):
+    # 已載入時直接取用，不計時
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = round((time.perf_counter() - start) * 1000, 3)
+    metrics.observe('lazy_import_ms', elapsed, label=name)
+    logger.info(f"📦 延遲載入 {name}（{elapsed}ms）")
+    return module
+
+
+class LazyModule:
+    """屬性存取時才載入的模組代理"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = self._module = _import(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def lazy_callable(module_name: str, attr: str):
+    """回傳包裝函式，第一次呼叫時才載入 module_name.attr"""
+    target = None
+
+    def call(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(_import(module_name), attr)
+        return target(*args, **kwargs)
+
+    call.__name__ = attr
+    call.__qualname__ = f"{module_name}.{attr}"
+    return call
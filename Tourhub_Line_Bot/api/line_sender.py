@@ -0,0 +1,249 @@
+"""
+LINE 訊息發送模組
+- 預設走 SDK（FlexContainer.from_dict → pydantic 模型 → JSON）
+- LINE_FAST_SEND 開啟時直接以快速 JSON 編碼器（orjson，未安裝則用 json）輸出位元組，
+  POST 到 reply / push 端點，省去模型轉換
+- 快速路徑依 SDK 模型欄位清單去除未知欄位與 None，送出內容與 SDK 一致
+- Schema 驗證只在除錯或測試時執行，同一份 payload 只驗證一次
+- 送出前一律清理未知欄位並經 flex_budget 壓縮與大小檢查，超過限制時自動分成多則
+- LINE SDK 延遲到第一次使用時才載入，冷啟動不需付出載入成本
+"""
+
+import os
+import hashlib
+import logging
+
+from api.flex_budget import encode_json, prepare_flex_messages
+from api.lazy_import import lazy_module
+
+# LINE SDK 載入很慢，第一次需要模型欄位或走 SDK 發送時才載入
+messaging = lazy_module('linebot.v3.messaging')
+line_models = lazy_module('linebot.v3.messaging.models')
+
+logger = logging.getLogger(__name__)
+
+LINE_FAST_SEND = os.environ.get('LINE_FAST_SEND', 'false').lower() in ('1', 'true', 'yes')
+# 除錯/測試時以 SDK 模型驗證快速路徑的 payload
+LINE_VALIDATE_FLEX = os.environ.get(
+    'LINE_VALIDATE_FLEX', os.environ.get('FLASK_DEBUG', 'false')
+).lower() in ('1', 'true', 'yes')
+LINE_API_TIMEOUT = float(os.environ.get('LINE_API_TIMEOUT', '10'))
+
+LINE_REPLY_ENDPOINT = 'https://api.line.me/v2/bot/message/reply'
+LINE_PUSH_ENDPOINT = 'https://api.line.me/v2/bot/message/push'
+
+_VALIDATED_LIMIT = 1024
+_validated_digests = set()
+
+
+class LineSendError(Exception):
+    """LINE Messaging API 回傳非 2xx"""
+
+    def __init__(self, status_code, body, headers=None):
+        super().__init__(f"LINE API {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+
+class LineConfiguration:
+    """只保存 access token；走 SDK 發送時才建立 linebot 的 Configuration"""
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+        self._sdk_configuration = None
+
+    def sdk(self):
+        if self._sdk_configuration is None:
+            self._sdk_configuration = messaging.Configuration(access_token=self.access_token)
+        return self._sdk_configuration
+
+
+def _sdk_configuration(configuration):
+    if isinstance(configuration, LineConfiguration):
+        return configuration.sdk()
+    return configuration
+
+
+class SendResult:
+    """與 SDK 的 ApiResponse 相容的回應（status_code / headers / data）"""
+
+    def __init__(self, status_code, headers, data=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+
+# ---- 由 SDK 模型建立欄位白名單 ----
+
+def _class_attr(cls, name):
+    # SDK 模型以雙底線私有屬性記錄 discriminator，需用 name mangling 取值
+    return getattr(cls, f"_{cls.__name__}__{name}", None)
+
+
+# 模型類別名稱 → (欄位 alias → 子模型名稱或 None, discriminator 值 → 模型名稱)
+# 以名稱記錄，可存進啟動快照，有快照時不必載入 SDK
+_schemas = {}
+_NODE_BASES = ('FlexContainer', 'FlexComponent', 'Action')
+
+
+def _schema(name):
+    schema = _schemas.get(name)
+    if schema is None:
+        cls = getattr(line_models, name)
+        fields = {}
+        for field in cls.__fields__.values():
+            child = field.type_
+            fields[field.alias] = child.__name__ if hasattr(child, '__fields__') else None
+        class_map = _class_attr(cls, 'discriminator_value_class_map')
+        schema = (fields, dict(class_map) if class_map else None)
+        _schemas[name] = schema
+    return schema
+
+
+def _sanitize(value, name):
+    value_type = type(value)
+    if value_type is list:
+        return [_sanitize(item, name) for item in value]
+    if value_type is not dict:
+        # 純值，或是凍結的共用子樹（建立模板時已清理過）
+        return value
+
+    fields, class_map = _schema(name)
+    if class_map:
+        concrete = class_map.get(value.get('type'))
+        if concrete is None:
+            raise ValueError(f"未知的 {name} 類型: {value.get('type')}")
+        fields, _ = _schema(concrete)
+
+    result = {}
+    for key, item in value.items():
+        if item is None or key not in fields:
+            continue
+        child = fields[key]
+        result[key] = _sanitize(item, child) if child is not None else item
+    return result
+
+
+def sanitize_flex(contents: dict) -> dict:
+    """依 SDK 模型欄位去除未知欄位與 None（與 FlexContainer.from_dict().to_dict() 相同）"""
+    return _sanitize(contents, 'FlexContainer')
+
+
+_node_classes = None
+
+
+def sanitize_node(node: dict):
+    """依節點 type 找出對應的 SDK 模型（container / component / action）並清理，
+    無法判斷時回傳 None"""
+    global _node_classes
+    if _node_classes is None:
+        classes = {}
+        for base in _NODE_BASES:
+            classes.update(_schema(base)[1])
+        _node_classes = classes
+    name = _node_classes.get(node.get('type')) if type(node) is dict else None
+    if name is None:
+        return None
+    return _sanitize(node, name)
+
+
+def export_schemas() -> dict:
+    """建立 Flex 相關所有模型的欄位白名單（供啟動快照保存）"""
+    pending = list(_NODE_BASES)
+    seen = set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        fields, class_map = _schema(name)
+        pending.extend(child for child in fields.values() if child)
+        if class_map:
+            pending.extend(class_map.values())
+    return {name: _schemas[name] for name in seen}
+
+
+def install_schemas(schemas: dict):
+    """載入快照中的欄位白名單"""
+    global _node_classes
+    _schemas.update(schemas)
+    _node_classes = None
+
+
+# ---- 序列化與驗證 ----
+
+def _validate_once(contents: dict):
+    digest = hashlib.sha1(encode_json(contents)).digest()
+    if digest in _validated_digests:
+        return
+    expected = messaging.FlexContainer.from_dict(contents).to_dict()
+    if sanitize_flex(contents) != expected:
+        logger.warning("快速路徑 Flex payload 與 SDK 轉換結果不同")
+    if len(_validated_digests) >= _VALIDATED_LIMIT:
+        _validated_digests.clear()
+    _validated_digests.add(digest)
+
+
+def _flex_message_dict(alt_text: str, contents: dict) -> dict:
+    return {'type': 'flex', 'altText': alt_text, 'contents': contents}
+
+
+def _post(configuration, url: str, body: dict) -> SendResult:
+    encoded = encode_json(body)
+    if LINE_VALIDATE_FLEX:
+        for message in body['messages']:
+            _validate_once(message['contents'])
+
+    from api.http_client import get_session
+    response = get_session().post(
+        url,
+        data=encoded,
+        headers={
+            'Authorization': f"Bearer {configuration.access_token}",
+            'Content-Type': 'application/json',
+        },
+        timeout=LINE_API_TIMEOUT
+    )
+    if response.status_code >= 300:
+        raise LineSendError(response.status_code, response.text, response.headers)
+    return SendResult(response.status_code, response.headers, response.content)
+
+
+# ---- 對外介面 ----
+
+def _prepare(alt_text, contents, template):
+    # 先依 SDK 欄位清理（產生新物件，壓縮時不會改到呼叫端的資料），再壓縮與檢查大小
+    return prepare_flex_messages(alt_text, sanitize_flex(contents), template)
+
+
+def _sdk_messages(pages):
+    return [messaging.FlexMessage(alt_text=alt, contents=messaging.FlexContainer.from_dict(contents)) for alt, contents in pages]
+
+
+def reply_flex(configuration, reply_token: str, alt_text: str, contents: dict, template: str = None):
+    """回覆 Flex Message（過大時自動分成多則），回傳含 headers（x-line-request-id）的回應"""
+    pages = _prepare(alt_text, contents, template)
+    if LINE_FAST_SEND:
+        body = {'replyToken': reply_token, 'messages': [_flex_message_dict(alt, c) for alt, c in pages]}
+        return _post(configuration, LINE_REPLY_ENDPOINT, body)
+
+    with messaging.ApiClient(_sdk_configuration(configuration)) as api_client:
+        line_bot_api = messaging.MessagingApi(api_client)
+        return line_bot_api.reply_message_with_http_info(
+            messaging.ReplyMessageRequest(reply_token=reply_token, messages=_sdk_messages(pages))
+        )
+
+
+def push_flex(configuration, to: str, alt_text: str, contents: dict, template: str = None):
+    """推播 Flex Message（過大時自動分成多則），回傳含 headers（x-line-request-id）的回應"""
+    pages = _prepare(alt_text, contents, template)
+    if LINE_FAST_SEND:
+        body = {'to': to, 'messages': [_flex_message_dict(alt, c) for alt, c in pages]}
+        return _post(configuration, LINE_PUSH_ENDPOINT, body)
+
+    with messaging.ApiClient(_sdk_configuration(configuration)) as api_client:
+        line_bot_api = messaging.MessagingApi(api_client)
+        return line_bot_api.push_message_with_http_info(
+            messaging.PushMessageRequest(to=to, messages=_sdk_messages(pages))
+        )
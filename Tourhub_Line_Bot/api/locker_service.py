@@ -1,10 +1,11 @@
 import os
 import logging
-import requests
 import re
 import math
 import time
-from bs4 import BeautifulSoup
+from api import snapshot_store
+from api.http_client import fetch_parsed
+from api.html_parser import make_soup
 
 logger = logging.getLogger(__name__)
 
@@ -103,54 +104,43 @@ def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+# 主要城市座標範圍：(緯度下限, 緯度上限, 經度下限, 經度上限, 名稱)，依序比對
+CITY_REGIONS = (
+    (35.5, 35.8, 139.5, 139.9, "東京"),
+    (34.6, 34.8, 135.4, 135.6, "大阪"),
+    (35.0, 35.2, 135.7, 135.8, "京都"),
+    (35.1, 35.2, 136.8, 137.0, "名古屋"),
+    (43.0, 43.2, 141.3, 141.5, "札幌"),
+    (33.5, 33.7, 130.3, 130.5, "福岡"),
+    (26.1, 26.3, 127.6, 127.8, "沖繩"),
+    (25.0, 25.1, 121.4, 121.6, "台北"),
+    (22.2, 22.4, 114.1, 114.3, "香港"),
+    (1.2, 1.5, 103.6, 103.9, "新加坡"),
+    (37.4, 37.7, 126.9, 127.2, "首爾"),
+    (36.6, 36.8, 137.1, 137.3, "富山"),
+    # 不在主要城市範圍內時的大區域
+    (35.0, 36.0, 139.0, 140.0, "關東地區"),
+    (34.0, 35.0, 135.0, 136.0, "關西地區"),
+    (42.0, 44.0, 140.0, 142.0, "北海道"),
+)
+
+
+def _find_region(table, lat: float, lng: float):
+    for lat_min, lat_max, lng_min, lng_max, value in table:
+        if lat_min <= lat <= lat_max and lng_min <= lng <= lng_max:
+            return value
+    return None
+
+
 def _get_location_name_from_coordinates(lat: float, lng: float) -> str:
-    """根據座標獲取地點名稱"""
+    """根據座標獲取地點名稱（簡單的座標範圍判斷）"""
     try:
-        # 使用反向地理編碼來獲取地點名稱
-        # 這裡使用一個簡單的座標範圍判斷來識別主要城市
-        if 35.5 <= lat <= 35.8 and 139.5 <= lng <= 139.9:
-            return "東京"
-        elif 34.6 <= lat <= 34.8 and 135.4 <= lng <= 135.6:
-            return "大阪"
-        elif 35.0 <= lat <= 35.2 and 135.7 <= lng <= 135.8:
-            return "京都"
-        elif 35.1 <= lat <= 35.2 and 136.8 <= lng <= 137.0:
-            return "名古屋"
-        elif 43.0 <= lat <= 43.2 and 141.3 <= lng <= 141.5:
-            return "札幌"
-        elif 33.5 <= lat <= 33.7 and 130.3 <= lng <= 130.5:
-            return "福岡"
-        elif 26.1 <= lat <= 26.3 and 127.6 <= lng <= 127.8:
-            return "沖繩"
-        elif 25.0 <= lat <= 25.1 and 121.4 <= lng <= 121.6:
-            return "台北"
-        elif 22.2 <= lat <= 22.4 and 114.1 <= lng <= 114.3:
-            return "香港"
-        elif 1.2 <= lat <= 1.5 and 103.6 <= lng <= 103.9:
-            return "新加坡"
-        elif 37.4 <= lat <= 37.7 and 126.9 <= lng <= 127.2:
-            return "首爾"
-        elif 36.6 <= lat <= 36.8 and 137.1 <= lng <= 137.3:
-            return "富山"
-        else:
-            # 如果不在已知範圍內，嘗試使用更精確的判斷
-            if 35.0 <= lat <= 36.0 and 139.0 <= lng <= 140.0:
-                return "關東地區"
-            elif 34.0 <= lat <= 35.0 and 135.0 <= lng <= 136.0:
-                return "關西地區"
-            elif 42.0 <= lat <= 44.0 and 140.0 <= lng <= 142.0:
-                return "北海道"
-            else:
-                return "附近地區"
+        return _find_region(CITY_REGIONS, lat, lng) or "附近地區"
     except Exception as e:
         logger.warning(f"獲取地點名稱失敗: {e}")
         return "附近地區"
 
 def _scrape_site_for_lockers(url: str, headers: dict):
-    resp = requests.get(url, headers=headers, timeout=12)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.content, 'html.parser')
-
     # Ecbo Cloak 置物櫃服務 - 跳過，因為是動態網站
     if 'cloak.ecbo.io' in url:
         # Ecbo Cloak 是動態網站，需要 JavaScript 渲染，爬蟲無法獲取有效數據
@@ -158,6 +148,33 @@ def _scrape_site_for_lockers(url: str, headers: dict):
         logger.info("跳過 Ecbo Cloak 網站（動態網站，需要 JavaScript 渲染）")
         return []
 
+    items = fetch_parsed(
+        url,
+        lambda content: _parse_locker_html(url, content),
+        parse_key='lockers',
+        headers=headers,
+        timeout=12
+    )
+    # 解析結果會被快取重用，回傳副本避免呼叫端修改到快取
+    return [dict(item) for item in items]
+
+# 只需部分子樹即可解析的來源：(網址片段, parse_only 標籤, selectolax 子樹選擇器)
+_LOCKER_SOURCE_SUBTREES = [
+    ('akilocker.biz', ['a'], 'a[href]'),
+    ('metocan.co.jp/locker', ['a', 'h2', 'h3', 'h4', 'strong', 'b'], None),
+    ('qrtranslator.com', ['h1', 'title'], 'h1, title'),
+]
+
+def _make_locker_soup(url: str, content):
+    for domain, parse_only, subtree_css in _LOCKER_SOURCE_SUBTREES:
+        if domain in url:
+            return make_soup(content, parse_only=parse_only, subtree_css=subtree_css)
+    return make_soup(content)
+
+def _parse_locker_html(url: str, content):
+    """依來源網站解析置物櫃頁面 HTML"""
+    soup = _make_locker_soup(url, content)
+
     # Tokyo Metro Locker Concierge（入口頁，多語，動態內容為主：保底抽鏈結與區塊文字）
     if 'akilocker.biz' in url:
         items = []
@@ -484,184 +501,125 @@ def get_station_specific_lockers(lat: float, lng: float, location_name: str = No
         logger.error(f"獲取車站特定置物櫃失敗: {e}")
         return fetch_nearby_lockers(lat, lng, max_items=5)
 
+# 主要車站座標範圍，依序比對
+MAJOR_STATIONS = (
+    # 富山站（擴大識別範圍）
+    (36.69, 36.70, 137.20, 137.22, {'name': '富山站', 'city': '富山', 'type': 'major_station', 'railway_company': 'JR西日本'}),
+    (35.681, 35.682, 139.767, 139.768, {'name': '東京站', 'city': '東京', 'type': 'major_station', 'railway_company': 'JR東日本'}),
+    (35.689, 35.691, 139.700, 139.702, {'name': '新宿站', 'city': '東京', 'type': 'major_station', 'railway_company': 'JR東日本'}),
+    (34.702, 34.704, 135.495, 135.497, {'name': '大阪站', 'city': '大阪', 'type': 'major_station', 'railway_company': 'JR西日本'}),
+    (34.985, 34.986, 135.758, 135.759, {'name': '京都站', 'city': '京都', 'type': 'major_station', 'railway_company': 'JR西日本'}),
+)
+
+# 車站置物櫃：(名稱, 地址, 緯度偏移, 經度偏移, 距離km, 空位, 位置類型, 尺寸, 價格)
+STATION_LOCKERS = {
+    '富山站': (
+        ('富山站 東口 置物櫃', '富山縣富山市明輪町1-227', 0.0001, 0.0001, 0.1, 15, 'station_exit', ('小', '中', '大'), '300-600円'),
+        ('富山站 西口 置物櫃', '富山縣富山市明輪町1-227', -0.0001, -0.0001, 0.1, 12, 'station_exit', ('小', '中', '大'), '300-600円'),
+        ('富山站 改札內 置物櫃', '富山縣富山市明輪町1-227', 0.0, 0.0, 0.0, 8, 'inside_station', ('小', '中'), '300-500円'),
+    ),
+    '東京站': (
+        ('東京站 丸之內北口 置物櫃', '東京都千代田區丸之內1-9-1', 0.0002, 0.0002, 0.1, 25, 'station_exit', ('小', '中', '大'), '400-800円'),
+        ('東京站 八重洲南口 置物櫃', '東京都千代田區丸之內1-9-1', -0.0002, -0.0002, 0.1, 20, 'station_exit', ('小', '中', '大'), '400-800円'),
+    ),
+}
+
+
 def _identify_station_type(lat: float, lng: float):
     """識別車站類型"""
-    # 富山站（擴大識別範圍）
-    if 36.69 <= lat <= 36.70 and 137.20 <= lng <= 137.22:
-        return {
-            'name': '富山站',
-            'city': '富山',
-            'type': 'major_station',
-            'railway_company': 'JR西日本'
-        }
-    # 東京站
-    elif 35.681 <= lat <= 35.682 and 139.767 <= lng <= 139.768:
-        return {
-            'name': '東京站',
-            'city': '東京',
-            'type': 'major_station',
-            'railway_company': 'JR東日本'
-        }
-    # 新宿站
-    elif 35.689 <= lat <= 35.691 and 139.700 <= lng <= 139.702:
-        return {
-            'name': '新宿站',
-            'city': '東京',
-            'type': 'major_station',
-            'railway_company': 'JR東日本'
-        }
-    # 大阪站
-    elif 34.702 <= lat <= 34.704 and 135.495 <= lng <= 135.497:
-        return {
-            'name': '大阪站',
-            'city': '大阪',
-            'type': 'major_station',
-            'railway_company': 'JR西日本'
-        }
-    # 京都站
-    elif 34.985 <= lat <= 34.986 and 135.758 <= lng <= 135.759:
-        return {
-            'name': '京都站',
-            'city': '京都',
-            'type': 'major_station',
-            'railway_company': 'JR西日本'
-        }
-    return None
+    station = _find_region(MAJOR_STATIONS, lat, lng)
+    return dict(station) if station else None
+
 
 def _get_predefined_station_lockers(station_info, lat: float, lng: float):
     """獲取預定義的車站置物櫃信息"""
+    if station_info['type'] != 'major_station':
+        return []
+
     station_name = station_info['name']
-    city = station_info['city']
-    
-    # 根據車站類型返回相應的置物櫃信息
-    if station_info['type'] == 'major_station':
-        lockers = []
-        
-        # 富山站的置物櫃信息
-        if station_name == '富山站':
-            lockers = [
-                {
-                    'name': '富山站 東口 置物櫃',
-                    'address': '富山縣富山市明輪町1-227',
-                    'map_uri': f'https://maps.google.com/?q={lat},{lng}',
-                    'latlng': (lat + 0.0001, lng + 0.0001),
-                    'distance_km': 0.1,
-                    'has_vacancy': True,
-                    'available_slots': 15,
-                    'location_type': 'station_exit',
-                    'size_options': ['小', '中', '大'],
-                    'price_range': '300-600円'
-                },
-                {
-                    'name': '富山站 西口 置物櫃',
-                    'address': '富山縣富山市明輪町1-227',
-                    'map_uri': f'https://maps.google.com/?q={lat},{lng}',
-                    'latlng': (lat - 0.0001, lng - 0.0001),
-                    'distance_km': 0.1,
-                    'has_vacancy': True,
-                    'available_slots': 12,
-                    'location_type': 'station_exit',
-                    'size_options': ['小', '中', '大'],
-                    'price_range': '300-600円'
-                },
-                {
-                    'name': '富山站 改札內 置物櫃',
-                    'address': '富山縣富山市明輪町1-227',
-                    'map_uri': f'https://maps.google.com/?q={lat},{lng}',
-                    'latlng': (lat, lng),
-                    'distance_km': 0.0,
-                    'has_vacancy': True,
-                    'available_slots': 8,
-                    'location_type': 'inside_station',
-                    'size_options': ['小', '中'],
-                    'price_range': '300-500円'
-                }
-            ]
-        
-        # 東京站的置物櫃信息
-        elif station_name == '東京站':
-            lockers = [
-                {
-                    'name': '東京站 丸之內北口 置物櫃',
-                    'address': '東京都千代田區丸之內1-9-1',
-                    'map_uri': f'https://maps.google.com/?q={lat},{lng}',
-                    'latlng': (lat + 0.0002, lng + 0.0002),
-                    'distance_km': 0.1,
-                    'has_vacancy': True,
-                    'available_slots': 25,
-                    'location_type': 'station_exit',
-                    'size_options': ['小', '中', '大'],
-                    'price_range': '400-800円'
-                },
-                {
-                    'name': '東京站 八重洲南口 置物櫃',
-                    'address': '東京都千代田區丸之內1-9-1',
-                    'map_uri': f'https://maps.google.com/?q={lat},{lng}',
-                    'latlng': (lat - 0.0002, lng - 0.0002),
-                    'distance_km': 0.1,
-                    'has_vacancy': True,
-                    'available_slots': 20,
-                    'location_type': 'station_exit',
-                    'size_options': ['小', '中', '大'],
-                    'price_range': '400-800円'
-                }
-            ]
-        
+    entries = STATION_LOCKERS.get(station_name)
+    if entries is None:
         # 其他車站的通用置物櫃信息
-        else:
-            lockers = [
-                {
-                    'name': f'{station_name} 置物櫃',
-                    'address': f'{city}',
-                    'map_uri': f'https://maps.google.com/?q={lat},{lng}',
-                    'latlng': (lat, lng),
-                    'distance_km': 0.0,
-                    'has_vacancy': True,
-                    'available_slots': 10,
-                    'location_type': 'station',
-                    'size_options': ['小', '中', '大'],
-                    'price_range': '300-600円'
-                }
-            ]
-        
-        return lockers
-    
-    return []
+        entries = ((f'{station_name} 置物櫃', station_info['city'], 0.0, 0.0, 0.0, 10, 'station', ('小', '中', '大'), '300-600円'),)
+
+    return [
+        {
+            'name': name,
+            'address': address,
+            'map_uri': f'https://maps.google.com/?q={lat},{lng}',
+            'latlng': (lat + dlat, lng + dlng),
+            'distance_km': distance_km,
+            'has_vacancy': True,
+            'available_slots': slots,
+            'location_type': location_type,
+            'size_options': list(sizes),
+            'price_range': price_range
+        }
+        for name, address, dlat, dlng, distance_km, slots, location_type, sizes, price_range in entries
+    ]
+
+LOCKER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+}
+
+# 背景爬取的置物櫃候選快照（共用快照儲存）有效秒數
+LOCKER_SNAPSHOT_MAX_AGE = int(os.environ.get('LOCKER_SNAPSHOT_MAX_AGE', '1800'))
+
+def _locker_source_urls():
+    urls = []
+    if LOCKER_SITE_URL:
+        urls.append(LOCKER_SITE_URL)
+    if LOCKER_EXTRA_SOURCES:
+        urls.extend([u.strip() for u in LOCKER_EXTRA_SOURCES.split(',') if u.strip()])
+    # 加入預設整合來源（避免重複）
+    for u in DEFAULT_LOCKER_SOURCES:
+        if u not in urls:
+            urls.append(u)
+    return urls
+
+def crawl_locker_candidates():
+    """爬取所有置物櫃來源並去除重複項目（不含距離）"""
+    candidates = []
+    seen = set()
+    for url in _locker_source_urls():
+        try:
+            for item in _scrape_site_for_lockers(url, LOCKER_HEADERS):
+                key = (item.get('name'), item.get('address'), item.get('map_uri'))
+                if key in seen:
+                    continue
+                seen.add(key)
+                candidates.append(item)
+        except Exception as e:
+            logger.warning(f"來源抓取失敗 {url}: {e}")
+    return candidates
+
+def refresh_locker_snapshot():
+    """重新爬取置物櫃來源並整批替換快照（供排程工作呼叫）"""
+    candidates = crawl_locker_candidates()
+    if not candidates:
+        raise RuntimeError("置物櫃來源皆未取得資料")
+    snapshot_store.save('locker_candidates', candidates)
+    return {'candidates': len(candidates)}
+
+def _get_locker_candidates():
+    candidates = snapshot_store.load('locker_candidates', LOCKER_SNAPSHOT_MAX_AGE)
+    if candidates is not None:
+        return candidates
+    return crawl_locker_candidates()
 
 def fetch_nearby_lockers(lat: float, lng: float, max_items: int = 3):
-    """從多個置物櫃來源網站爬取清單，解析座標，依距離排序回傳最近 max_items 筆。"""
+    """從多個置物櫃來源網站爬取清單（優先使用背景快照），解析座標，依距離排序回傳最近 max_items 筆。"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
-        }
-        urls = []
-        if LOCKER_SITE_URL:
-            urls.append(LOCKER_SITE_URL)
-        if LOCKER_EXTRA_SOURCES:
-            urls.extend([u.strip() for u in LOCKER_EXTRA_SOURCES.split(',') if u.strip()])
-        # 加入預設整合來源（避免重複）
-        for u in DEFAULT_LOCKER_SOURCES:
-            if u not in urls:
-                urls.append(u)
-
         candidates = []
-        seen = set()
-        for url in urls:
-            try:
-                items = _scrape_site_for_lockers(url, headers)
-                for item in items:
-                    key = (item.get('name'), item.get('address'), item.get('map_uri'))
-                    if key in seen:
-                        continue
-                    seen.add(key)
-                    if item['latlng']:
-                        lat2, lng2 = item['latlng']
-                        item['distance_km'] = _haversine_km(lat, lng, lat2, lng2)
-                    else:
-                        item['distance_km'] = None
-                    candidates.append(item)
-            except Exception as e:
-                logger.warning(f"來源抓取失敗 {url}: {e}")
+        for item in _get_locker_candidates():
+            # 快照為共用資料，距離寫在副本上
+            item = dict(item)
+            if item['latlng']:
+                lat2, lng2 = item['latlng']
+                item['distance_km'] = _haversine_km(lat, lng, lat2, lng2)
+            else:
+                item['distance_km'] = None
+            candidates.append(item)
 
         # 先過濾出有距離的，按距離排序；若不足，再補無距離者
         with_distance = [c for c in candidates if c['distance_km'] is not None]
@@ -0,0 +1,55 @@
+"""
+程序內指標模組
+- 計數器（incr）與數值摘要（observe：次數 / 總和 / 最大值）
+- 可用 label 細分（例如依模板名稱）
+- 由 /api/metrics 匯出
+"""
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_summaries = {}
+
+
+def incr(name: str, label: str = None, value: int = 1):
+    """累加計數器"""
+    key = label or '_'
+    with _lock:
+        bucket = _counters.setdefault(name, {})
+        bucket[key] = bucket.get(key, 0) + value
+
+
+def observe(name: str, value: float, label: str = None):
+    """記錄一筆數值（例如位元組數、毫秒數）"""
+    key = label or '_'
+    with _lock:
+        bucket = _summaries.setdefault(name, {})
+        stats = bucket.get(key)
+        if stats is None:
+            bucket[key] = {'count': 1, 'sum': value, 'max': value, 'last': value}
+        else:
+            stats['count'] += 1
+            stats['sum'] += value
+            stats['last'] = value
+            if value > stats['max']:
+                stats['max'] = value
+
+
+def snapshot() -> dict:
+    """匯出目前所有指標（摘要附平均值）"""
+    with _lock:
+        summaries = {}
+        for name, bucket in _summaries.items():
+            summaries[name] = {
+                key: dict(stats, avg=round(stats['sum'] / stats['count'], 3))
+                for key, stats in bucket.items()
+            }
+        counters = {name: dict(bucket) for name, bucket in _counters.items()}
+    return {'counters': counters, 'summaries': summaries}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _summaries.clear()
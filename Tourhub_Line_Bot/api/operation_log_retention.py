@@ -0,0 +1,167 @@
+"""
+操作日誌分割維護（user_operation_logs）
+- user_operation_logs 依 created_at 每月一個 RANGE 分割（scripts/partition_operation_logs.py）：
+  pYYYYMM 存放該月資料，pmax 收納還沒有分割的月份
+- 分割表不支援外鍵，原本外鍵的 ON DELETE 效果改在排程中補做（最多延遲一個排程間隔）：
+  已刪除網站模組的 module_id 設為 NULL（原 SET NULL），已刪除用戶的日誌刪除（原 CASCADE）
+- 排程工作 operation_log_maintenance 每天執行：
+  1. 清理指向已刪除用戶 / 網站模組的日誌（先於彙總，統計表不會記到已刪除的模組）
+  2. 從 pmax 切出本月起 OPERATION_LOG_PARTITIONS_AHEAD 個月的分割（pmax 為空時只改定義，不搬資料）
+  3. 整個分割都早於保留期限（OPERATION_LOG_RETENTION_MONTHS 個月）時，先依日期彙總到
+     user_operation_daily_stats，再以 DROP PARTITION 刪除，不逐筆 DELETE
+- 彙總以覆寫方式寫入，彙總後、刪除前中斷時重跑結果相同
+"""
+
+import os
+import logging
+from datetime import date
+
+from api.database import get_database_connection
+
+logger = logging.getLogger(__name__)
+
+OPERATION_LOG_RETENTION_MONTHS = int(os.environ.get('OPERATION_LOG_RETENTION_MONTHS', '6'))
+OPERATION_LOG_PARTITIONS_AHEAD = int(os.environ.get('OPERATION_LOG_PARTITIONS_AHEAD', '3'))
+
+LOG_TABLE = 'user_operation_logs'
+MAX_PARTITION = 'pmax'
+
+PARTITIONS_QUERY = """
+SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+FROM information_schema.PARTITIONS
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+ORDER BY PARTITION_ORDINAL_POSITION
+"""
+# 沒有網站模組的操作 module_id 記為 0（統計表主鍵不允許 NULL）
+ROLLUP_QUERY = """
+INSERT INTO user_operation_daily_stats
+    (stat_date, operation_type, module_id, result_status, operation_count, user_count)
+SELECT
+    DATE(created_at),
+    operation_type,
+    COALESCE(module_id, 0),
+    COALESCE(result_status, 'pending'),
+    COUNT(*),
+    COUNT(DISTINCT unified_user_id)
+FROM user_operation_logs PARTITION ({partition})
+GROUP BY DATE(created_at), operation_type, COALESCE(module_id, 0), COALESCE(result_status, 'pending')
+ON DUPLICATE KEY UPDATE
+    operation_count = VALUES(operation_count),
+    user_count = VALUES(user_count)
+"""
+
+
+# 取代分割前的外鍵：module_id → website_modules ON DELETE SET NULL、unified_user_id → unified_users ON DELETE CASCADE
+ORPHAN_MODULES_QUERY = """
+UPDATE user_operation_logs l
+LEFT JOIN website_modules m ON m.id = l.module_id
+SET l.module_id = NULL
+WHERE l.module_id IS NOT NULL AND m.id IS NULL
+"""
+ORPHAN_USERS_QUERY = """
+DELETE l FROM user_operation_logs l
+LEFT JOIN unified_users u ON u.id = l.unified_user_id
+WHERE u.id IS NULL
+"""
+
+
+def month_start(day, offset=0) -> date:
+    """day 所在月份往後 offset 個月的一日"""
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _boundary(day) -> str:
+    # 分割上限以資料庫時區換算，與 created_at 的分割函式一致
+    return f"UNIX_TIMESTAMP('{day:%Y-%m-%d} 00:00:00')"
+
+
+def _unix_timestamps(cursor, days):
+    cursor.execute("SELECT " + ", ".join(_boundary(day) for day in days))
+    return [int(value) for value in cursor.fetchone()]
+
+
+def list_partitions(cursor):
+    """[(分割名稱, 上限 UNIX 時間；MAXVALUE 為 None)]，資料表未分割時為空列表"""
+    cursor.execute(PARTITIONS_QUERY, (LOG_TABLE,))
+    return [
+        (name, None if bound in (None, 'MAXVALUE') else int(bound))
+        for name, bound in cursor.fetchall() if name
+    ]
+
+
+def clean_orphans(cursor):
+    """補做外鍵的 ON DELETE 效果，回傳 (清除 module_id 的列數, 刪除的列數)"""
+    cursor.execute(ORPHAN_MODULES_QUERY)
+    modules_cleared = max(cursor.rowcount, 0)
+    cursor.execute(ORPHAN_USERS_QUERY)
+    return modules_cleared, max(cursor.rowcount, 0)
+
+
+def create_future_partitions(cursor, partitions, today) -> list:
+    """從 pmax 切出本月起 OPERATION_LOG_PARTITIONS_AHEAD 個月中還沒有的分割，回傳新增的名稱"""
+    highest = max((bound for _, bound in partitions if bound is not None), default=None)
+    months = [month_start(today, i) for i in range(OPERATION_LOG_PARTITIONS_AHEAD + 1)]
+    bounds = _unix_timestamps(cursor, [month_start(month, 1) for month in months])
+    # 只能在最後一個有上限的分割之後新增（例如 p_history 已涵蓋本月時從下個月開始）
+    missing = [month for month, bound in zip(months, bounds) if highest is None or bound > highest]
+    if not missing:
+        return []
+
+    definitions = ", ".join(
+        f"PARTITION {partition_name(month)} VALUES LESS THAN ({_boundary(month_start(month, 1))})"
+        for month in missing
+    )
+    cursor.execute(
+        f"ALTER TABLE {LOG_TABLE} REORGANIZE PARTITION {MAX_PARTITION} INTO "
+        f"({definitions}, PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE)"
+    )
+    return [partition_name(month) for month in missing]
+
+
+def drop_expired_partitions(cursor, partitions, today):
+    """彙總並刪除整個早於保留期限的分割，回傳 (刪除的名稱, 寫入統計表的列數)"""
+    cutoff, = _unix_timestamps(cursor, [month_start(today, -OPERATION_LOG_RETENTION_MONTHS)])
+    dropped, rolled_up = [], 0
+    for name, bound in partitions:
+        if bound is None or bound > cutoff:
+            continue
+        cursor.execute(ROLLUP_QUERY.format(partition=name))
+        rolled_up += max(cursor.rowcount, 0)
+        cursor.execute(f"ALTER TABLE {LOG_TABLE} DROP PARTITION {name}")
+        dropped.append(name)
+    return dropped, rolled_up
+
+
+def run_operation_log_maintenance(today=None) -> dict:
+    """清理孤立日誌、新增未來月份的分割、彙總並刪除過期分割（供排程工作呼叫）"""
+    today = today or date.today()
+    connection = get_database_connection()
+    if not connection:
+        raise RuntimeError("資料庫連接失敗")
+    try:
+        cursor = connection.cursor()
+        try:
+            partitions = list_partitions(cursor)
+            if not partitions or partitions[-1][0] != MAX_PARTITION:
+                raise RuntimeError(f"{LOG_TABLE} 尚未依月份分割，請先執行 scripts/partition_operation_logs.py")
+            modules_cleared, orphans_deleted = clean_orphans(cursor)
+            created = create_future_partitions(cursor, partitions, today)
+            dropped, rolled_up = drop_expired_partitions(cursor, partitions, today)
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+
+    if created or dropped:
+        logger.info(f"🗂️ 操作日誌分割：新增 {created}，彙總後刪除 {dropped}")
+    if modules_cleared or orphans_deleted:
+        logger.info(f"🧹 操作日誌清理：{modules_cleared} 筆模組已刪除，{orphans_deleted} 筆用戶已刪除")
+    return {
+        'created': created, 'dropped': dropped, 'rolled_up': rolled_up,
+        'modules_cleared': modules_cleared, 'orphans_deleted': orphans_deleted,
+    }
@@ -0,0 +1,244 @@
+"""
+操作日誌寫入佇列（user_operation_logs）
+- 預設 OPERATION_LOG_WRITE_BEHIND=false：log() 放進佇列後立即以同一路徑同步寫入
+  （serverless 程序回應後可能被凍結，背景執行緒不一定有機會寫入）
+- 長駐程序的部署可設為 true：log() 只放進佇列，不在請求路徑上寫資料庫；
+  背景執行緒每 OPERATION_LOG_FLUSH_INTERVAL_MS 毫秒、或累積 OPERATION_LOG_FLUSH_BATCH 筆時，
+  以多列 INSERT 一次寫入（database.insert_user_operation_logs）
+- 佇列上限 OPERATION_LOG_QUEUE_SIZE 筆；資料庫過慢而佇列已滿時依 OPERATION_LOG_OVERFLOW 處理：
+  spill（預設）附加到 OPERATION_LOG_SPILL_PATH，寫入恢復後重新載入；drop 直接捨棄並計數
+- 寫入失敗的紀錄放回佇列等下次重試；程序結束時同步寫入，仍失敗則存到 spill 檔
+"""
+
+import os
+import json
+import atexit
+import logging
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+
+from api import metrics
+from api.lazy_import import lazy_callable
+
+logger = logging.getLogger(__name__)
+
+OPERATION_LOG_WRITE_BEHIND = os.environ.get('OPERATION_LOG_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+OPERATION_LOG_FLUSH_INTERVAL_MS = int(os.environ.get('OPERATION_LOG_FLUSH_INTERVAL_MS', '1000'))
+OPERATION_LOG_FLUSH_BATCH = int(os.environ.get('OPERATION_LOG_FLUSH_BATCH', '200'))
+OPERATION_LOG_QUEUE_SIZE = int(os.environ.get('OPERATION_LOG_QUEUE_SIZE', '10000'))
+OPERATION_LOG_OVERFLOW = os.environ.get('OPERATION_LOG_OVERFLOW', 'spill').lower()
+OPERATION_LOG_SPILL_PATH = (
+    os.environ.get('OPERATION_LOG_SPILL_PATH') or os.path.join(tempfile.gettempdir(), 'tourhub_operation_logs_spill.jsonl')
+)
+# 程序結束時的寫入重試次數
+OPERATION_LOG_SHUTDOWN_ATTEMPTS = 3
+
+# user_operation_logs.result_status 允許的值
+RESULT_STATUSES = ('success', 'failed', 'pending')
+
+
+def make_record(unified_user_id, operation_type, data=None, result_status='success',
+                module_id=None, error_message=None) -> dict:
+    """組成一筆操作日誌；建立時間在此時記下，不受批次寫入延遲影響"""
+    data = dict(data or {})
+    if result_status not in RESULT_STATUSES:
+        # 其他狀態（例如 partial）記為 failed，原狀態保留在操作數據中
+        data['result_detail'] = result_status
+        result_status = 'failed'
+    return {
+        'unified_user_id': unified_user_id,
+        'module_id': module_id,
+        'operation_type': operation_type,
+        'operation_data': json.dumps(data, ensure_ascii=False, default=str),
+        'result_status': result_status,
+        'error_message': error_message,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+class OperationLogSink:
+    """操作日誌佇列：writer(records) 批次寫入"""
+
+    def __init__(self, writer, interval_ms=OPERATION_LOG_FLUSH_INTERVAL_MS, batch_size=OPERATION_LOG_FLUSH_BATCH,
+                 max_queue=OPERATION_LOG_QUEUE_SIZE, overflow=OPERATION_LOG_OVERFLOW,
+                 write_behind=OPERATION_LOG_WRITE_BEHIND, spill_path=OPERATION_LOG_SPILL_PATH):
+        self._writer = writer
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.write_behind = write_behind
+        self.spill_path = spill_path
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._queue = deque()
+        self._thread = None
+        self._load_spill()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def log(self, unified_user_id, operation_type, data=None, result_status='success',
+            module_id=None, error_message=None):
+        """記下一筆操作日誌（不等待寫入）"""
+        self.put(make_record(unified_user_id, operation_type, data, result_status, module_id, error_message))
+
+    def put(self, record):
+        with self._lock:
+            full = len(self._queue) >= self.max_queue
+            if not full:
+                self._queue.append(record)
+            size = len(self._queue)
+        if full:
+            self._overflow([record])
+        else:
+            metrics.incr('operation_log', label='queued')
+
+        if not self.write_behind:
+            try:
+                self.flush()
+            except Exception as e:
+                # 請求路徑上不因日誌失敗而中斷，紀錄留在佇列等下次寫入
+                logger.error(f"寫入操作日誌失敗（待寫入 {len(self._queue)} 筆）: {e}")
+            return
+        self._ensure_thread()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def _overflow(self, records):
+        if self.overflow == 'spill' and self._spill(records):
+            metrics.incr('operation_log', label='spilled', value=len(records))
+            return
+        metrics.incr('operation_log', label='dropped', value=len(records))
+        logger.warning(f"⚠️ 操作日誌佇列已滿，捨棄 {len(records)} 筆")
+
+    def flush(self) -> int:
+        """寫入佇列中的所有紀錄，回傳寫入筆數；失敗時未寫入的紀錄放回佇列並丟出例外"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    break
+                try:
+                    self._writer(batch)
+                except Exception:
+                    self._restore(batch)
+                    metrics.incr('operation_log_flush', label='error')
+                    raise
+                written += len(batch)
+                metrics.observe('operation_log_flush_rows', len(batch))
+        if written:
+            metrics.incr('operation_log_flush', label='ok')
+        # 寫入恢復後接回先前溢出到檔案的紀錄
+        if self.spill_path and os.path.exists(self.spill_path) and len(self._queue) < self.max_queue // 2:
+            self._load_spill()
+        return written
+
+    def _restore(self, batch):
+        # 放回佇列前端，保持寫入順序；超出上限的部分依溢出規則處理
+        with self._lock:
+            room = max(self.max_queue - len(self._queue), 0)
+            kept, overflow = batch[:room], batch[room:]
+            self._queue.extendleft(reversed(kept))
+        if overflow:
+            self._overflow(overflow)
+
+    # ---- 背景寫入 ----
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='operation-log-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if not self._queue:
+                continue
+            try:
+                self.flush()
+                delay = self.interval
+            except Exception as e:
+                # 資料庫暫時無法使用時逐步拉長間隔，最多 30 秒
+                delay = min(max(delay * 2, 1.0), 30.0)
+                logger.error(f"操作日誌寫入失敗，{delay:.1f} 秒後重試（待寫入 {len(self._queue)} 筆）: {e}")
+
+    # ---- 溢出檔與程序結束 ----
+
+    def close(self):
+        """同步寫入所有紀錄；多次失敗時存到 spill 檔，下次啟動時載入"""
+        for attempt in range(1, OPERATION_LOG_SHUTDOWN_ATTEMPTS + 1):
+            if not self._queue:
+                return
+            try:
+                self.flush()
+                return
+            except Exception as e:
+                logger.error(f"結束前寫入操作日誌失敗（第 {attempt} 次）: {e}")
+        with self._lock:
+            records = list(self._queue)
+            self._queue.clear()
+        if records and not self._spill(records):
+            logger.error(f"操作日誌 {len(records)} 筆遺失")
+
+    def _spill(self, records) -> bool:
+        if not self.spill_path:
+            return False
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            logger.warning(f"⚠️ {len(records)} 筆操作日誌已暫存至 {self.spill_path}")
+            return True
+        except OSError as e:
+            logger.error(f"暫存操作日誌失敗: {e}")
+            return False
+
+    def _load_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+                os.remove(self.spill_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"讀取暫存操作日誌失敗: {e}")
+            return
+        # 放在佇列後面（檔案中的紀錄較舊，但寫入順序不影響 created_at）；放不下的寫回檔案
+        with self._lock:
+            room = max(self.max_queue - len(self._queue), 0)
+            self._queue.extend(records[:room])
+        if records[room:]:
+            self._spill(records[room:])
+        if records:
+            logger.info(f"📥 載入 {min(room, len(records))} 筆暫存操作日誌")
+            if self.write_behind:
+                self._ensure_thread()
+                self._wakeup.set()
+
+
+_sink = OperationLogSink(writer=lazy_callable('api.database', 'insert_user_operation_logs'))
+atexit.register(_sink.close)
+
+
+def log(unified_user_id, operation_type, data=None, result_status='success', module_id=None, error_message=None):
+    _sink.log(unified_user_id, operation_type, data, result_status, module_id, error_message)
+
+
+def flush() -> int:
+    return _sink.flush()
@@ -3,157 +3,155 @@
 """
 
 import logging
+from decimal import Decimal, InvalidOperation
+
+from api.theme import RANK_COLORS
 
 logger = logging.getLogger(__name__)
 
-def create_paginated_leaderboard(rank, page=1):
-    """創建分頁的排行榜詳細資訊"""
-    from api.web_scraper import scrape_leaderboard_data
-    
-    # 獲取資料
-    leaderboard_data = scrape_leaderboard_data()
-    data = leaderboard_data.get(str(rank))
-    
-    if not data:
-        # 後援：從資料庫查詢第 rank 名基本資訊，避免回傳 None
+_RANK_TITLES = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
+
+def _leaderboard_entry_from_trip(rank, trip_row):
+    """資料庫的排行資料列 → 與爬蟲一致的基本顯示資料"""
+    days = None
+    if trip_row.get('start_date') and trip_row.get('end_date'):
         try:
-            from api.database import get_database_connection
-            connection = get_database_connection()
-            if not connection:
-                return create_no_content_page(rank, "基本資訊")
+            days = (trip_row['end_date'] - trip_row['start_date']).days + 1
+        except Exception:
+            days = None
 
-            cursor = connection.cursor(dictionary=True)
-            leaderboard_query = """
-            SELECT
-                t.trip_id,
-                t.title,
-                t.area,
-                t.start_date,
-                t.end_date
-            FROM line_trips t
-            LEFT JOIN trip_stats ts ON t.trip_id = ts.trip_id
-            WHERE t.trip_id IS NOT NULL
-            ORDER BY ts.popularity_score DESC, ts.favorite_count DESC, ts.share_count DESC
-            LIMIT %s, 1
-            """
+    return {
+        "rank": int(rank),
+        "title": trip_row.get('title') or f"第{rank}名行程",
+        "rank_title": _RANK_TITLES.get(int(rank), f"第{rank}名"),
+        "color": RANK_COLORS.get(int(rank), "#9B59B6"),
+        "destination": trip_row.get('area') or "",
+        "duration": (f"{days}天{days-1}夜" if days and days > 1 else ("1天" if days == 1 else ""))
+    }
 
-            cursor.execute(leaderboard_query, (int(rank) - 1,))
-            trip_row = cursor.fetchone()
-            cursor.close()
-            connection.close()
+def get_leaderboard_entries(ranks):
+    """多個名次的基本顯示資料 {名次: 資料}，無法取得的名次不在結果中
 
-            if not trip_row:
-                return create_no_content_page(rank, "基本資訊")
+    優先使用網站排行榜（背景快照），其餘名次以一次排行查詢補上（見 database.get_ranked_trips_at）
+    """
+    from api.web_scraper import get_leaderboard_data
 
-            # 構造與爬蟲一致的基本顯示資料
-            days = None
-            if trip_row.get('start_date') and trip_row.get('end_date'):
-                try:
-                    days = (trip_row['end_date'] - trip_row['start_date']).days + 1
-                except Exception:
-                    days = None
+    leaderboard_data = get_leaderboard_data() or {}
+    entries = {}
+    missing = []
+    for rank in ranks:
+        data = leaderboard_data.get(str(rank))
+        if data:
+            entries[rank] = data
+        else:
+            missing.append(rank)
 
-            rank_colors = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
-            rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
+    if missing:
+        # 後援：從資料庫查詢這些名次的基本資訊
+        try:
+            from api.database import get_ranked_trips_at
+            for rank, trip_row in get_ranked_trips_at(missing).items():
+                entries[rank] = _leaderboard_entry_from_trip(rank, trip_row)
+        except Exception as e:
+            logger.error(f"查詢排行榜名次 {missing} 失敗: {e}")
+    return entries
 
-            data = {
-                "rank": int(rank),
-                "title": trip_row.get('title') or f"第{rank}名行程",
-                "rank_title": rank_titles.get(int(rank), f"第{rank}名"),
-                "color": rank_colors.get(int(rank), "#9B59B6"),
-                "destination": trip_row.get('area') or "",
-                "duration": (f"{days}天{days-1}夜" if days and days > 1 else ("1天" if days == 1 else ""))
-            }
+def create_leaderboard_summary(rank, data, favorited=False):
+    """排行榜名次的基本資訊卡片；favorited 為 True 時以「移除收藏」取代「加入收藏」"""
+    if favorited:
+        favorite_action = {"type": "postback", "label": "移除收藏 🗑️", "data": f"action=favorite_remove&rank={rank}"}
+    else:
+        favorite_action = {"type": "postback", "label": "加入收藏 ❤️", "data": f"action=favorite_add&rank={rank}"}
 
-        except Exception:
-            return create_no_content_page(rank, "基本資訊")
-    
+    return {
+        "type": "bubble",
+        "size": "giga",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": data.get("rank_title", data["title"]),
+                    "weight": "bold",
+                    "size": "lg",
+                    "color": "#ffffff",
+                    "align": "center"
+                }
+            ],
+            "backgroundColor": data["color"],
+            "paddingAll": "20px"
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": data['title'],
+                    "weight": "bold",
+                    "size": "md",
+                    "color": "#333333",
+                    "marginBottom": "md"
+                },
+                {
+                    "type": "text",
+                    "text": f"目的地：{data['destination']}",
+                    "size": "sm",
+                    "color": "#555555",
+                    "marginBottom": "sm"
+                },
+                {
+                    "type": "text",
+                    "text": f"行程天數：{data['duration']}",
+                    "size": "sm",
+                    "color": "#555555",
+                    "marginBottom": "md"
+                }
+            ],
+            "paddingAll": "20px"
+        },
+        "footer": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "button",
+                    "action": {
+                        "type": "postback",
+                        "label": "查看詳細行程 📋",
+                        "data": f"action=leaderboard_page&rank={rank}&page=2"
+                    },
+                    "style": "primary",
+                    "color": data["color"],
+                    "height": "sm"
+                },
+                {
+                    "type": "button",
+                    "action": favorite_action,
+                    "style": "secondary",
+                    "height": "sm",
+                    "margin": "sm"
+                }
+            ],
+            "paddingAll": "20px"
+        }
+    }
+
+def create_paginated_leaderboard(rank, page=1):
+    """創建分頁的排行榜詳細資訊"""
     # 分頁邏輯
     if page == 1:
         # 第一頁：基本資訊
-        return {
-            "type": "bubble",
-            "size": "giga",
-            "header": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": data.get("rank_title", data["title"]),
-                        "weight": "bold",
-                        "size": "lg",
-                        "color": "#ffffff",
-                        "align": "center"
-                    }
-                ],
-                "backgroundColor": data["color"],
-                "paddingAll": "20px"
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": data['title'],
-                        "weight": "bold",
-                        "size": "md",
-                        "color": "#333333",
-                        "marginBottom": "md"
-                    },
-                    {
-                        "type": "text",
-                        "text": f"目的地：{data['destination']}",
-                        "size": "sm",
-                        "color": "#555555",
-                        "marginBottom": "sm"
-                    },
-                    {
-                        "type": "text",
-                        "text": f"行程天數：{data['duration']}",
-                        "size": "sm",
-                        "color": "#555555",
-                        "marginBottom": "md"
-                    }
-                ],
-                "paddingAll": "20px"
-            },
-            "footer": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "button",
-                        "action": {
-                            "type": "postback",
-                            "label": "查看詳細行程 📋",
-                            "data": f"action=leaderboard_page&rank={rank}&page=2"
-                        },
-                        "style": "primary",
-                        "color": data["color"],
-                        "height": "sm"
-                    },
-                    {
-                        "type": "button",
-                        "action": {
-                            "type": "postback",
-                            "label": "加入收藏 ❤️",
-                            "data": f"action=favorite_add&rank={rank}"
-                        },
-                        "style": "secondary",
-                        "height": "sm",
-                        "margin": "sm"
-                    }
-                ],
-                "paddingAll": "20px"
-            }
-        }
+        data = get_leaderboard_entries([rank]).get(rank)
+        if not data:
+            return create_no_content_page(rank, "基本資訊")
+        return create_leaderboard_summary(rank, data)
     
     elif page == 2:
         # 第二頁：詳細行程
-        from api.web_scraper import scrape_trip_details
-        trip_data = scrape_trip_details(int(rank))
+        from api.web_scraper import get_trip_details
+        trip_data = get_trip_details(int(rank))
         
         if not trip_data:
             return create_no_content_page(rank, "詳細行程")
@@ -232,9 +230,9 @@ def create_paginated_leaderboard(rank, page=1):
 
 def create_paginated_itinerary(rank, page=1):
     """創建分頁的詳細行程"""
-    from api.web_scraper import scrape_trip_details
+    from api.web_scraper import get_trip_details
     
-    trip_data = scrape_trip_details(int(rank))
+    trip_data = get_trip_details(int(rank))
     if not trip_data:
         return create_no_content_page(rank, "詳細行程")
     
@@ -375,3 +373,51 @@ def create_no_content_page(rank, content_type):
             "paddingAll": "20px"
         }
     }
+
+# ---- 「更多排行」分頁游標 ----
+# 游標放在 postback data 中：「下一頁第一名的名次~排序鍵」，例如 11~0~85.5~12~3~1024；
+# 沒有統計資料的行程為 名次~1~trip_id
+
+RANKINGS_PAGE_SIZE = 10
+
+def ranking_key(row):
+    """排行榜資料列的排序鍵：(0, 熱門分數, 收藏數, 分享數, trip_id)，沒有統計資料時為 (1, trip_id)"""
+    if row.get('has_stats'):
+        return (0, row['popularity_score'], row['favorite_count'], row['share_count'], row['trip_id'])
+    return (1, row['trip_id'])
+
+def encode_ranking_cursor(rank, key):
+    """名次與排序鍵 → postback 用的游標字串"""
+    return "~".join(str(part) for part in (int(rank),) + tuple(key))
+
+def decode_ranking_cursor(token):
+    """游標字串 → (名次, 排序鍵)，格式錯誤時丟出 ValueError"""
+    parts = (token or "").split("~")
+    try:
+        rank, phase = int(parts[0]), int(parts[1])
+        if phase == 0 and len(parts) == 6:
+            # 分數可能是小數，以 Decimal 原樣傳回資料庫比較，避免浮點誤差造成跳號或重複
+            key = (0, Decimal(parts[2]), Decimal(parts[3]), Decimal(parts[4]), int(parts[5]))
+        elif phase == 1 and len(parts) == 3:
+            key = (1, int(parts[2]))
+        else:
+            raise ValueError(token)
+    except (IndexError, InvalidOperation) as e:
+        raise ValueError(token) from e
+    if rank < 1:
+        raise ValueError(token)
+    return rank, key
+
+def get_rankings_page(token, page_size=RANKINGS_PAGE_SIZE):
+    """依游標取得一頁排行：回傳 (本頁第一名的名次, 資料列, 下一頁游標或 None)"""
+    from api.database import get_ranked_trips_after
+
+    start_rank, key = decode_ranking_cursor(token)
+    # 多取一筆判斷是否還有下一頁
+    rows = get_ranked_trips_after(key, page_size + 1)
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_ranking_cursor(start_rank + page_size, ranking_key(rows[-1]))
+    return start_rank, rows, next_cursor
+
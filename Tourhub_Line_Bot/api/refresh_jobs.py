@@ -0,0 +1,44 @@
+"""
+背景刷新工作註冊
+- 排行榜爬取、置物櫃爬取、行程統計排行都移出 webhook，由排程或 cron 更新快照
+- 關鍵字 / 訊息模板設定的版本檢查（有新版本才重新載入）
+- 行程地區搜尋索引的增量更新（索引在程序內：cron 更新接到請求的程序，其他程序由第一個查詢同步建立）
+- 操作日誌的月份分割維護（新增分割、彙總並刪除過期分割）
+"""
+
+import os
+import logging
+import importlib.util
+
+from api.scheduler import register_job
+from api.lazy_import import lazy_callable
+from api import config_store
+
+logger = logging.getLogger(__name__)
+
+# 工作函式在第一次執行時才載入所屬模組（爬蟲、資料庫相依較重）
+register_job(
+    'leaderboard_refresh', lazy_callable('api.web_scraper', 'refresh_leaderboard_snapshot'),
+    interval=int(os.environ.get('LEADERBOARD_REFRESH_INTERVAL', '1800')), jitter=60
+)
+register_job(
+    'locker_crawl', lazy_callable('api.locker_service', 'refresh_locker_snapshot'),
+    interval=int(os.environ.get('LOCKER_CRAWL_INTERVAL', '900')), jitter=60
+)
+register_job('config_reload', config_store.reload, interval=config_store.CONFIG_POLL_SECONDS)
+
+if importlib.util.find_spec('mysql') is not None:
+    register_job(
+        'trip_stats_refresh', lazy_callable('api.database', 'refresh_ranked_trips_snapshot'),
+        interval=int(os.environ.get('TRIP_STATS_REFRESH_INTERVAL', '600')), jitter=30
+    )
+    register_job(
+        'trip_search_refresh', lazy_callable('api.trip_search', 'refresh_trip_search_index'),
+        interval=int(os.environ.get('TRIP_SEARCH_REFRESH_INTERVAL', '300')), jitter=30
+    )
+    register_job(
+        'operation_log_maintenance', lazy_callable('api.operation_log_retention', 'run_operation_log_maintenance'),
+        interval=int(os.environ.get('OPERATION_LOG_MAINTENANCE_INTERVAL', '86400')), jitter=600
+    )
+else:
+    logger.warning("mysql-connector 未安裝，略過行程統計刷新、搜尋索引與操作日誌分割維護工作")
@@ -0,0 +1,64 @@
+"""
+事件路由模組
+- 以名稱（模板名稱、postback action、快速回覆類型）對應處理函式，查表分派
+- 每條路由自動記錄延遲（route_latency_ms）、呼叫次數與錯誤次數，由 /api/metrics 匯出
+"""
+
+import time
+import logging
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+# 處理函式已自行回覆（例如改用 push），呼叫端不需再送出
+HANDLED = object()
+
+
+class Router:
+    """名稱 → 處理函式的分派表"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._routes = {}
+        self._default = None
+
+    def route(self, *keys):
+        """註冊處理函式，可同時對應多個名稱"""
+        def decorator(func):
+            for key in keys:
+                if key in self._routes:
+                    logger.warning(f"{self.name} 路由 {key} 重複註冊，改用 {func.__name__}")
+                self._routes[key] = func
+            return func
+        return decorator
+
+    def default(self, func):
+        """註冊找不到路由時使用的處理函式"""
+        self._default = func
+        return func
+
+    def get_routes(self):
+        return list(self._routes)
+
+    def dispatch(self, key, *args, **kwargs):
+        """依名稱呼叫處理函式並記錄延遲；例外照常拋出，由呼叫端決定回應"""
+        handler = self._routes.get(key)
+        if handler is None:
+            # 名稱可能來自使用者輸入，只依路由表計數避免標籤無限增加
+            metrics.incr('route_unmatched', label=self.name)
+            logger.info(f"{self.name} 無對應路由: {key}，使用預設處理")
+            handler = self._default
+            key = '_default'
+            if handler is None:
+                return None
+
+        label = f"{self.name}:{key}"
+        start = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            metrics.incr('route_errors', label=label)
+            raise
+        finally:
+            metrics.observe('route_latency_ms', round((time.perf_counter() - start) * 1000, 3), label=label)
@@ -0,0 +1,82 @@
+"""
+文字訊息路由快取
+- KeywordMatcher：關鍵字依長度由長到短（同長度依設定順序）預先排好，找到第一個即為最佳匹配
+- RoutingCache：以正規化後的訊息文字為鍵，快取路由決定（模板名稱與參數），
+  有界 LRU，關鍵字設定更新時整批失效
+- 只快取路由決定，不快取任何依使用者產生的回應內容
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUTING_CACHE_SIZE = int(os.environ.get('ROUTING_CACHE_SIZE', '1024'))
+# 過長的訊息多半不會重複出現，不放入快取
+ROUTING_CACHE_MAX_TEXT = 64
+
+
+def normalize_message(text) -> str:
+    return (text or '').strip()
+
+
+class KeywordMatcher:
+    """依 KEYWORD_MAPPINGS 預先排序的關鍵字比對器"""
+
+    def __init__(self, mappings: dict):
+        self.source = mappings
+        entries = []
+        for mapping in mappings.values():
+            for keyword in mapping["keywords"]:
+                entries.append((keyword, mapping))
+        # sort 為穩定排序：同長度保留設定檔中的先後順序
+        entries.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self._entries = entries
+
+    def match(self, text: str):
+        """回傳 (關鍵字, 模板設定)，沒有匹配時回傳 None"""
+        for keyword, mapping in self._entries:
+            if keyword in text:
+                return keyword, mapping
+        return None
+
+
+class RoutingCache:
+    """訊息文字 → 路由決定 的有界 LRU"""
+
+    def __init__(self, maxsize: int = ROUTING_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.version = 0
+
+    def get(self, text: str):
+        with self._lock:
+            decision = self._entries.get(text)
+            if decision is not None:
+                self._entries.move_to_end(text)
+        metrics.incr('routing_cache', label='hit' if decision is not None else 'miss')
+        return decision
+
+    def put(self, text: str, decision):
+        if self.maxsize <= 0 or len(text) > ROUTING_CACHE_MAX_TEXT:
+            return
+        with self._lock:
+            self._entries[text] = decision
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """關鍵字或模板設定更新後呼叫"""
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+        logger.info(f"🔄 路由快取已清除（版本 {self.version}）")
+
+    def __len__(self):
+        return len(self._entries)
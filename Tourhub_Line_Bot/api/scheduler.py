@@ -0,0 +1,129 @@
+"""
+背景排程工作模組
+- 具名工作註冊（間隔秒數、隨機抖動）
+- 同一工作同時只執行一次（非阻塞鎖，重複觸發直接略過）
+- 記錄每個工作的最後執行狀態，供 /api/jobs 查詢
+- 本機長駐時可啟動背景執行緒；Vercel 上則由 cron 呼叫 /api/jobs/<name>/run
+"""
+
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    def __init__(self, name, func, interval, jitter):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.next_run_at = 0.0
+        self.last_started_at = None
+        self.last_finished_at = None
+        self.last_status = None
+        self.last_error = None
+        self.last_duration_ms = None
+        self.last_result = None
+        self.run_count = 0
+
+    def schedule_next(self):
+        self.next_run_at = time.time() + self.interval + random.uniform(0, self.jitter)
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'jitter': self.jitter,
+            'running': self.lock.locked(),
+            'run_count': self.run_count,
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+            'last_started_at': self.last_started_at,
+            'last_finished_at': self.last_finished_at,
+            'last_duration_ms': self.last_duration_ms,
+            'last_result': self.last_result,
+            'next_run_at': self.next_run_at,
+        }
+
+
+_jobs = {}
+
+
+def register_job(name: str, func, interval: int, jitter: int = 0):
+    """註冊具名工作；同名重複註冊時覆寫設定"""
+    _jobs[name] = _Job(name, func, interval, jitter)
+    return func
+
+
+def get_job_names():
+    return list(_jobs)
+
+
+def run_job(name: str, force: bool = True) -> dict:
+    """執行指定工作，回傳執行狀態
+    - force=False 時未到排程時間會略過
+    - 工作正在執行中時不等待，直接回傳 skipped
+    """
+    job = _jobs.get(name)
+    if job is None:
+        raise KeyError(name)
+
+    if not force and time.time() < job.next_run_at:
+        return {'job': name, 'status': 'skipped', 'reason': 'not_due'}
+    if not job.lock.acquire(blocking=False):
+        return {'job': name, 'status': 'skipped', 'reason': 'running'}
+
+    try:
+        job.last_started_at = time.time()
+        start = time.perf_counter()
+        try:
+            job.last_result = job.func()
+            job.last_status = 'success'
+            job.last_error = None
+        except Exception as e:
+            logger.error(f"排程工作 {name} 執行失敗: {e}")
+            job.last_status = 'failed'
+            job.last_error = str(e)
+        job.last_duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        job.last_finished_at = time.time()
+        job.run_count += 1
+        job.schedule_next()
+        return {'job': name, 'status': job.last_status, 'duration_ms': job.last_duration_ms,
+                'result': job.last_result, 'error': job.last_error}
+    finally:
+        job.lock.release()
+
+
+def run_due_jobs():
+    """執行所有已到期的工作"""
+    return [run_job(name, force=False) for name in list(_jobs)]
+
+
+def get_job_status() -> dict:
+    return {name: job.status() for name, job in _jobs.items()}
+
+
+_scheduler_thread = None
+
+
+def start_background_scheduler(poll_seconds: float = 5.0):
+    """啟動背景排程執行緒（僅適用長駐程序，例如本機開發伺服器）"""
+    global _scheduler_thread
+    if _scheduler_thread is not None:
+        return _scheduler_thread
+
+    def loop():
+        while True:
+            try:
+                run_due_jobs()
+            except Exception as e:
+                logger.error(f"背景排程執行失敗: {e}")
+            time.sleep(poll_seconds)
+
+    _scheduler_thread = threading.Thread(target=loop, name='job-scheduler', daemon=True)
+    _scheduler_thread.start()
+    logger.info(f"背景排程已啟動，工作: {', '.join(_jobs)}")
+    return _scheduler_thread
@@ -0,0 +1,142 @@
+"""
+跨程序共用的背景快照（排行榜、行程排行、置物櫃候選）
+- 排程工作把結果寫入 MySQL 的 app_snapshots 表（名稱 → JSON），每個 serverless 實例都讀得到，
+  不只是剛好接到 cron 請求的那一個
+- 讀取時先用程序內副本，超過 SNAPSHOT_LOCAL_TTL 秒才回資料庫確認；內容未變時資料庫不回傳 payload
+- 日期、時間、Decimal 以標記物件保存，讀回後還原為原本的型別
+- SNAPSHOT_STORE=memory 或資料庫無法使用時，只保留程序內副本（與排程所在實例共用不到）
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import importlib.util
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# 'db'、'memory'；未安裝 mysql-connector 時預設為 memory
+SNAPSHOT_STORE = os.environ.get(
+    'SNAPSHOT_STORE', 'db' if importlib.util.find_spec('mysql') is not None else 'memory'
+).lower()
+SNAPSHOT_LOCAL_TTL = float(os.environ.get('SNAPSHOT_LOCAL_TTL', '60'))
+
+SNAPSHOT_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS app_snapshots (
+    name VARCHAR(64) PRIMARY KEY,
+    payload LONGTEXT NOT NULL,
+    updated_at DOUBLE NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+# updated_at 為寫入時的 UNIX 時間；與本地副本相同時不回傳 payload
+SNAPSHOT_LOAD_QUERY = (
+    "SELECT updated_at, IF(updated_at = %s, NULL, payload) AS payload FROM app_snapshots WHERE name = %s"
+)
+SNAPSHOT_SAVE_QUERY = (
+    "INSERT INTO app_snapshots (name, payload, updated_at) VALUES (%s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE payload = VALUES(payload), updated_at = VALUES(updated_at)"
+)
+
+_lock = threading.Lock()
+_local = {}   # 名稱 → {'data', 'updated_at'（寫入時間）, 'checked_at'（上次向資料庫確認的時間）}
+_table_ready = False
+
+
+# ---- 序列化 ----
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'__timedelta__': value.total_seconds()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    raise TypeError(f"無法序列化 {type(value).__name__}")
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key == '__datetime__':
+            return datetime.fromisoformat(value)
+        if key == '__date__':
+            return date.fromisoformat(value)
+        if key == '__timedelta__':
+            return timedelta(seconds=value)
+        if key == '__decimal__':
+            return Decimal(value)
+    return obj
+
+
+def dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_encode)
+
+
+def loads(payload):
+    return json.loads(payload, object_hook=_decode)
+
+
+# ---- 資料庫 ----
+
+def _execute(query, params, fetch=False):
+    global _table_ready
+    from api.database import get_database_connection
+    connection = get_database_connection()
+    if not connection:
+        raise RuntimeError("資料庫連接失敗")
+    try:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            if not _table_ready:
+                cursor.execute(SNAPSHOT_TABLE_DDL)
+                _table_ready = True
+            cursor.execute(query, params)
+            return cursor.fetchall() if fetch else None
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+
+
+# ---- 對外介面 ----
+
+def save(name: str, data):
+    """寫入快照（供排程工作呼叫）：先更新程序內副本，再寫入共用儲存；寫入失敗時丟出例外"""
+    updated_at = time.time()
+    with _lock:
+        _local[name] = {'data': data, 'updated_at': updated_at, 'checked_at': time.monotonic()}
+    if SNAPSHOT_STORE == 'db':
+        _execute(SNAPSHOT_SAVE_QUERY, (name, dumps(data), updated_at))
+
+
+def _sync(name, entry):
+    """向共用儲存確認最新版本，回傳新的本地項目（失敗時沿用舊項目並等下一個 TTL 再試）"""
+    known = entry['updated_at'] if entry else -1.0
+    try:
+        rows = _execute(SNAPSHOT_LOAD_QUERY, (known, name), fetch=True)
+    except Exception as e:
+        logger.warning(f"讀取共用快照 {name} 失敗，沿用程序內副本: {e}")
+        rows = None
+    if rows and rows[0]['payload'] is not None:
+        entry = {'data': loads(rows[0]['payload']), 'updated_at': float(rows[0]['updated_at'])}
+    else:
+        entry = dict(entry) if entry else {'data': None, 'updated_at': 0.0}
+    entry['checked_at'] = time.monotonic()
+    with _lock:
+        _local[name] = entry
+    return entry
+
+
+def load(name: str, max_age: float):
+    """讀取寫入未滿 max_age 秒的快照，沒有或過舊時回傳 None"""
+    entry = _local.get(name)
+    if SNAPSHOT_STORE == 'db' and (entry is None or time.monotonic() - entry['checked_at'] >= SNAPSHOT_LOCAL_TTL):
+        entry = _sync(name, entry)
+    if entry is None or entry['data'] is None or time.time() - entry['updated_at'] >= max_age:
+        return None
+    return entry['data']
@@ -0,0 +1,132 @@
+"""
+啟動快照
+- 建置時（scripts/build_snapshot.py）把預先算好的物件存成一個檔案：
+  關鍵字比對器、套用主題後凍結的靜態卡片、Flex 欄位白名單（有它就不必載入 LINE SDK）
+- 啟動時一次讀入（可行時以 mmap 對應），先比對設定與相關程式碼的指紋，
+  不一致（設定或程式已改、快照過期）就忽略快照，改回原本的即時建立
+- 檔頭為一行 JSON（格式版本、指紋、建立時間），其後為 pickle 內容
+"""
+
+import os
+import json
+import mmap
+import time
+import pickle
+import hashlib
+import logging
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNAPSHOT_FORMAT = 1
+STARTUP_SNAPSHOT_PATH = (
+    os.environ.get('STARTUP_SNAPSHOT_PATH') or os.path.join(ROOT_DIR, 'build', 'startup_snapshot.pkl')
+)
+STARTUP_SNAPSHOT_ENABLED = os.environ.get('STARTUP_SNAPSHOT', 'true').lower() in ('1', 'true', 'yes')
+
+# 影響快照內容的檔案：設定、模板與主題、清理與壓縮規則，以及固定 SDK 版本的 requirements.txt
+_FINGERPRINT_FILES = (
+    'api/config.py',
+    'api/index.py',
+    'api/theme.py',
+    'api/flex_templates.py',
+    'api/flex_budget.py',
+    'api/line_sender.py',
+    'api/routing_cache.py',
+    'requirements.txt',
+)
+
+_artifacts = {}
+
+
+def config_fingerprint() -> str:
+    digest = hashlib.sha256(f"format:{SNAPSHOT_FORMAT}".encode())
+    for relative_path in _FINGERPRINT_FILES:
+        try:
+            with open(os.path.join(ROOT_DIR, relative_path), 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(f"missing:{relative_path}".encode())
+    return digest.hexdigest()
+
+
+def get(name: str, default=None):
+    """取得已載入的快照物件，沒有快照或快照不含該項時回傳 default"""
+    return _artifacts.get(name, default)
+
+
+def write_snapshot(artifacts: dict, path: str = STARTUP_SNAPSHOT_PATH) -> int:
+    """寫入快照檔（先寫暫存檔再改名），回傳位元組數"""
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'fingerprint': config_fingerprint(),
+        'created_at': int(time.time()),
+        'artifacts': sorted(artifacts),
+    }
+    payload = pickle.dumps(artifacts, protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b'\n')
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _read_buffer(f):
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # 空檔案或不支援 mmap 的檔案系統
+        return f.read()
+
+
+def load_snapshot(path: str = STARTUP_SNAPSHOT_PATH):
+    """讀取並驗證快照，回傳物件 dict；不存在、過期或損毀時回傳 None"""
+    if not STARTUP_SNAPSHOT_ENABLED or not os.path.exists(path):
+        return None
+
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            buffer = _read_buffer(f)
+            view = memoryview(buffer)
+            try:
+                header_end = buffer.find(b'\n')
+                header = json.loads(bytes(view[:header_end]))
+                if header.get('format') != SNAPSHOT_FORMAT or header.get('fingerprint') != config_fingerprint():
+                    logger.warning("⚠️ 啟動快照與目前設定不符，改為即時建立")
+                    metrics.incr('startup_snapshot', label='stale')
+                    return None
+                payload = view[header_end + 1:]
+                try:
+                    artifacts = pickle.loads(payload)
+                finally:
+                    payload.release()
+            finally:
+                view.release()
+                if isinstance(buffer, mmap.mmap):
+                    buffer.close()
+    except Exception as e:
+        logger.error(f"讀取啟動快照失敗，改為即時建立: {e}")
+        metrics.incr('startup_snapshot', label='error')
+        return None
+
+    elapsed = round((time.perf_counter() - start) * 1000, 3)
+    metrics.incr('startup_snapshot', label='loaded')
+    metrics.observe('startup_snapshot_load_ms', elapsed)
+    logger.info(f"📦 已載入啟動快照（{len(artifacts)} 項，{elapsed}ms）")
+    return artifacts
+
+
+def load(path: str = STARTUP_SNAPSHOT_PATH) -> bool:
+    """啟動時呼叫：載入快照供各模組取用"""
+    artifacts = load_snapshot(path)
+    if artifacts is None:
+        return False
+    _artifacts.clear()
+    _artifacts.update(artifacts)
+    return True
@@ -0,0 +1,88 @@
+"""
+Flex Message 現代化主題模組
+- 色彩常數與主題規則查表
+- apply_modern_theme 只走訪一般 dict / list；凍結（預先套用過主題）的共用子樹會略過
+"""
+
+THEME_PRIMARY_BLUE = "#2563EB"      # 現代藍色（主要按鈕/header）
+THEME_SECONDARY_BLUE = "#3B82F6"    # 次要藍色（hover狀態）
+THEME_LIGHT_BLUE_BG = "#EFF6FF"     # 淺藍背景（卡片背景）
+THEME_ACCENT_BLUE = "#1D4ED8"       # 強調藍色（重要元素）
+THEME_TEXT_PRIMARY = "#1F2937"      # 主要文字深灰藍
+THEME_TEXT_SECONDARY = "#6B7280"    # 次要文字
+THEME_TEXT_MUTED = "#9CA3AF"        # 靜音文字
+THEME_SUCCESS = "#10B981"           # 成功綠色
+THEME_WARNING = "#F59E0B"           # 警告橙色
+THEME_ERROR = "#EF4444"             # 錯誤紅色
+THEME_BORDER = "#E5E7EB"            # 邊框顏色
+
+# 排行榜前五名的代表色（排行榜卡片、我的收藏共用）
+RANK_COLORS = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
+
+# 主題規則查表（取代逐一比對顏色清單）
+_HEADER_BACKGROUNDS = frozenset([THEME_PRIMARY_BLUE, THEME_ACCENT_BLUE])
+_PRIMARY_BUTTON_COLORS = {
+    '#FF6B6B': THEME_ERROR, '#E74C3C': THEME_ERROR,                # 排行榜
+    '#4ECDC4': THEME_SUCCESS, '#2ECC71': THEME_SUCCESS,            # 行程管理/成功
+    '#FFA500': THEME_WARNING, '#F59E0B': THEME_WARNING,            # 置物櫃/警告
+    '#9B59B6': THEME_ACCENT_BLUE, '#6C5CE7': THEME_ACCENT_BLUE,    # TourClock/功能說明
+}
+_TEXT_COLORS = {
+    None: THEME_TEXT_PRIMARY, '#333333': THEME_TEXT_PRIMARY, '#222222': THEME_TEXT_PRIMARY, '#000000': THEME_TEXT_PRIMARY,
+    '#666666': THEME_TEXT_SECONDARY, '#777777': THEME_TEXT_SECONDARY, '#888888': THEME_TEXT_SECONDARY, '#555555': THEME_TEXT_SECONDARY,
+    '#999999': THEME_TEXT_MUTED,
+}
+
+def _theme_node(node, parent_key):
+    """套用單一節點的主題規則（只看節點本身與所在的 key）"""
+    if node.get('backgroundColor') == '#FFA500':
+        node['backgroundColor'] = THEME_PRIMARY_BLUE
+
+    node_type = node.get('type')
+    if node_type == 'text':
+        if parent_key == 'header':
+            node['color'] = '#ffffff'
+        else:
+            color = _TEXT_COLORS.get(node.get('color'))
+            if color:
+                node['color'] = color
+    elif node_type == 'button':
+        style = node.get('style')
+        if style == 'primary':
+            node['color'] = _PRIMARY_BUTTON_COLORS.get(node.get('color', ''), THEME_PRIMARY_BLUE)
+        elif style == 'secondary':
+            node.setdefault('color', THEME_TEXT_SECONDARY)
+    elif node_type == 'box' and parent_key == 'header':
+        # header 區塊統一使用主色調
+        if node.get('backgroundColor') not in _HEADER_BACKGROUNDS:
+            node['backgroundColor'] = THEME_PRIMARY_BLUE
+
+def apply_modern_theme(payload, parent_key=None):
+    """套用現代化主題到 Flex Message dict
+    - 統一的色彩系統
+    - 改善的視覺層次
+    - 更好的可讀性
+    以堆疊逐一走訪節點並就地修改，不重建 dict / list；
+    parent_key 為 payload 在父層所在的 key（套用在子樹時使用）
+    """
+    if payload is None:
+        return payload
+
+    # (節點, 所在的 key)；list 內的元素沿用 list 本身的 key
+    # 以 type() 判斷：dict / list 子類別（凍結子樹）已預先套用主題，不再走訪
+    stack = [(payload, parent_key)]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        node, parent_key = pop()
+        node_type = type(node)
+        if node_type is dict:
+            _theme_node(node, parent_key)
+            for key, value in node.items():
+                if type(value) is dict or type(value) is list:
+                    push((value, key))
+        elif node_type is list:
+            for child in node:
+                if type(child) is dict or type(child) is list:
+                    push((child, parent_key))
+    return payload
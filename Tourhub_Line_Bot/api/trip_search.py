@@ -0,0 +1,329 @@
+"""
+行程地區搜尋索引（程序內 n-gram 倒排索引）
+- 索引 line_trips 的地區、標題、描述：中日文字切成二元組（bigram），英數字以整個單字為詞
+- 查詢詞同樣切詞後取交集，再以子字串確認，結果與 LIKE '%詞%' 相同但不必全表掃描
+- 別名展開（東京 / Tokyo / とうきょう …），依熱門分數、收藏數排序，地區符合者優先
+- 由排程工作 trip_search_refresh（vercel.json cron）定期更新；設定 TRIP_SEARCH_UPDATED_COLUMN 時依行程修改時間
+  增量更新，定期整批重建以反映刪除與 trip_stats 熱門分數的變化；同一版本索引的查詢結果會快取
+- 冷啟動的程序沒有索引：第一個查詢同步建立（查詢上限 TRIP_SEARCH_QUERY_TIMEOUT_MS 毫秒，
+  其他請求正在建立時最多等 TRIP_SEARCH_LOCK_WAIT 秒），逾時或失敗時回傳 None 改用 LIKE 查詢；
+  索引過期時由查詢同步更新，其他請求正在更新時沿用舊索引
+- 更新失敗後 TRIP_SEARCH_RETRY_SECONDS 秒內查詢不再嘗試（排程工作不受限）
+- 每次更新索引後，為 KEYWORD_MAPPINGS 中的地區預先算好前 N 名（含格式化後的天數），
+  這些地區的查詢只是一次字典讀取
+"""
+
+import os
+import re
+import time
+import heapq
+import logging
+import threading
+import unicodedata
+
+from api import metrics, config_store
+from api.database import _fetch_all, format_location_trip
+
+logger = logging.getLogger(__name__)
+
+TRIP_SEARCH_MAX_AGE = int(os.environ.get('TRIP_SEARCH_MAX_AGE', '600'))
+TRIP_SEARCH_FULL_REBUILD = int(os.environ.get('TRIP_SEARCH_FULL_REBUILD', '3600'))
+# 預先計算的各地區前 N 名
+TRIP_AREA_TOP_N = int(os.environ.get('TRIP_AREA_TOP_N', '5'))
+# 更新失敗後，查詢再次嘗試更新的最短間隔
+TRIP_SEARCH_RETRY_SECONDS = int(os.environ.get('TRIP_SEARCH_RETRY_SECONDS', '60'))
+# 查詢路徑上建立 / 更新索引時的 SQL 執行上限（毫秒，MAX_EXECUTION_TIME），與等待其他請求建立的秒數
+TRIP_SEARCH_QUERY_TIMEOUT_MS = int(os.environ.get('TRIP_SEARCH_QUERY_TIMEOUT_MS', '2000'))
+TRIP_SEARCH_LOCK_WAIT = float(os.environ.get('TRIP_SEARCH_LOCK_WAIT', '1'))
+# line_trips 記錄修改時間的欄位（預設結構沒有此欄位；留空時每次都整批重建）
+TRIP_SEARCH_UPDATED_COLUMN = os.environ.get('TRIP_SEARCH_UPDATED_COLUMN', '')
+
+_INDEX_QUERY = """
+SELECT
+    t.trip_id,
+    t.title,
+    t.description,
+    t.area,
+    t.start_date,
+    t.end_date,
+    {updated} AS updated_at,
+    COALESCE(ts.favorite_count, 0) AS favorite_count,
+    COALESCE(ts.popularity_score, 0) AS popularity_score
+FROM line_trips t
+LEFT JOIN trip_stats ts ON t.trip_id = ts.trip_id
+"""
+# 未設定修改時間欄位時每次都整批重建
+FULL_INDEX_QUERY = _INDEX_QUERY.format(
+    updated=f"t.{TRIP_SEARCH_UPDATED_COLUMN}" if TRIP_SEARCH_UPDATED_COLUMN else "NULL"
+)
+INCREMENTAL_INDEX_QUERY = (
+    FULL_INDEX_QUERY + f"WHERE t.{TRIP_SEARCH_UPDATED_COLUMN} >= %s\n" if TRIP_SEARCH_UPDATED_COLUMN else None
+)
+
+# 同一地區的不同寫法（第一個為顯示用名稱）
+LOCATION_ALIASES = (
+    ("東京", "tokyo", "とうきょう", "トウキョウ", "東京都"),
+    ("大阪", "osaka", "おおさか", "オオサカ", "大阪府"),
+    ("京都", "kyoto", "きょうと", "キョウト", "京都府"),
+    ("沖繩", "沖縄", "okinawa", "おきなわ", "オキナワ"),
+    ("北海道", "hokkaido", "ほっかいどう", "ホッカイドウ"),
+    ("名古屋", "nagoya", "なごや", "ナゴヤ"),
+    ("福岡", "fukuoka", "ふくおか", "フクオカ"),
+    ("札幌", "sapporo", "さっぽろ", "サッポロ"),
+)
+
+_WORD_RE = re.compile(r'[0-9a-z]+')
+# 平假名、片假名、CJK 統一漢字（含擴充 A 與相容字）
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+
+def normalize_text(text) -> str:
+    # 全形轉半形、英文小寫，讓 Ｔｏｋｙｏ / Tokyo / tokyo 視為相同
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text: str) -> set:
+    """已正規化的文字 → 詞集合（英數單字、中日文二元組；單一漢字保留本身）"""
+    tokens = set(_WORD_RE.findall(text))
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _alias_map():
+    aliases = {}
+    for group in LOCATION_ALIASES:
+        normalized = tuple(normalize_text(name) for name in group)
+        for name in normalized:
+            aliases[name] = normalized
+    return aliases
+
+
+_ALIASES = _alias_map()
+
+
+def expand_terms(query) -> tuple:
+    """查詢字 → 正規化後的別名組（同一地區的寫法共用同一組）"""
+    term = normalize_text(query).strip()
+    if not term:
+        return ()
+    return _ALIASES.get(term, (term,))
+
+
+def tracked_areas() -> list:
+    """KEYWORD_MAPPINGS 中地區行程關鍵字所對應的地區"""
+    mappings = config_store.current().keyword_mappings
+    return [
+        mapping['location'] for mapping in mappings.values()
+        if mapping.get('template') == 'location_trips' and mapping.get('location')
+    ]
+
+
+class TripSearchIndex:
+    """行程倒排索引；更新與查詢以鎖保護"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}       # trip_id → (地區, 全文, 排序鍵, 原始資料)
+        self._postings = {}   # 詞 → trip_id 集合
+        self._results = {}    # (查詢詞, 筆數) → 結果，索引變動時清除
+        self.updated_at = 0.0
+        self.rebuilt_at = 0.0
+        self.max_modified = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _remove(self, trip_id):
+        doc = self._docs.pop(trip_id, None)
+        if doc is None:
+            return
+        for token in tokenize(doc[1]):
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(trip_id)
+                if not ids:
+                    del self._postings[token]
+
+    def _add(self, row):
+        trip_id = row['trip_id']
+        self._remove(trip_id)
+        area = normalize_text(row.get('area'))
+        # 以換行分隔欄位，避免跨欄位誤判為子字串
+        text = '\n'.join((area, normalize_text(row.get('title')), normalize_text(row.get('description'))))
+        rank_key = (-(row.get('popularity_score') or 0), -(row.get('favorite_count') or 0))
+        self._docs[trip_id] = (area, text, rank_key, row)
+        for token in tokenize(text):
+            self._postings.setdefault(token, set()).add(trip_id)
+
+    def rebuild(self, rows):
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._results = {}
+            for row in rows:
+                self._add(row)
+            self.max_modified = max((r['updated_at'] for r in rows if r.get('updated_at')), default=None)
+            self.rebuilt_at = self.updated_at = time.time()
+
+    def update(self, rows):
+        with self._lock:
+            if rows:
+                self._results = {}
+            for row in rows:
+                self._add(row)
+                modified = row.get('updated_at')
+                if modified and (self.max_modified is None or modified > self.max_modified):
+                    self.max_modified = modified
+            self.updated_at = time.time()
+
+    def _token_ids(self, token):
+        ids = self._postings.get(token)
+        if len(token) > 1 and not _WORD_RE.fullmatch(token):
+            return ids
+        # 英數字與單一漢字可能只是索引詞的一部分（tok → tokyo、京 → 東京），
+        # 合併所有包含它的詞
+        matched = [ids for key, ids in self._postings.items() if token in key]
+        if not matched:
+            return None
+        return set().union(*matched) if len(matched) > 1 else matched[0]
+
+    def _match(self, term):
+        tokens = tokenize(term)
+        if not tokens:
+            # 沒有可索引的字（例如只有符號），直接逐筆比對
+            return {trip_id for trip_id, doc in self._docs.items() if term in doc[1]}
+        candidates = None
+        for token in sorted(tokens, key=len, reverse=True):
+            ids = self._token_ids(token)
+            if not ids:
+                return set()
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return candidates
+        # 二元組交集可能誤中（詞分散在不同位置），以子字串確認
+        return {trip_id for trip_id in candidates if term in self._docs[trip_id][1]}
+
+    def search(self, query: str, limit: int = 5):
+        terms = expand_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            results = self._results.get((terms, limit))
+            if results is not None:
+                return results
+            matched = set()
+            for alias in terms:
+                matched |= self._match(alias)
+            docs = self._docs
+            ranked = heapq.nsmallest(
+                limit, matched,
+                key=lambda trip_id: (
+                    # 地區欄位符合者優先，其次依熱門分數、收藏數
+                    not any(alias in docs[trip_id][0] for alias in terms),
+                    docs[trip_id][2],
+                    trip_id,
+                )
+            )
+            results = [docs[trip_id][3] for trip_id in ranked]
+            if len(self._results) >= 256:
+                self._results = {}
+            self._results[(terms, limit)] = results
+            return results
+
+
+_index = TripSearchIndex()
+_refresh_lock = threading.Lock()
+# 上次更新失敗的時間（time.monotonic）
+_last_failed = 0.0
+# 別名組 → 前 TRIP_AREA_TOP_N 名（已格式化），每次更新索引後整份替換
+_area_top = {}
+
+
+def _build_area_top() -> dict:
+    area_top = {}
+    for location in tracked_areas():
+        terms = expand_terms(location)
+        if terms and terms not in area_top:
+            area_top[terms] = [format_location_trip(row) for row in _index.search(location, TRIP_AREA_TOP_N)]
+    return area_top
+
+
+def _bounded(query, timeout_ms):
+    # MySQL 優化器提示：超過時間的 SELECT 直接中止
+    if not timeout_ms:
+        return query
+    return query.replace('SELECT', f'SELECT /*+ MAX_EXECUTION_TIME({timeout_ms}) */', 1)
+
+
+def _refresh(full=False, timeout_ms=0) -> dict:
+    """呼叫前須持有 _refresh_lock"""
+    global _area_top, _last_failed
+    now = time.time()
+    try:
+        if full or not _index.rebuilt_at or now - _index.rebuilt_at >= TRIP_SEARCH_FULL_REBUILD \
+                or _index.max_modified is None or INCREMENTAL_INDEX_QUERY is None:
+            rows = _fetch_all(_bounded(FULL_INDEX_QUERY, timeout_ms), ())
+            _index.rebuild(rows)
+            result = {'mode': 'full', 'trips': len(_index), 'tokens': len(_index._postings)}
+        else:
+            # 以 >= 重新讀取最後一筆的時間點，避免同一秒內的修改遺漏
+            rows = _fetch_all(_bounded(INCREMENTAL_INDEX_QUERY, timeout_ms), (_index.max_modified,))
+            _index.update(rows)
+            result = {'mode': 'incremental', 'changed': len(rows), 'trips': len(_index)}
+    except Exception:
+        _last_failed = time.monotonic()
+        raise
+    _area_top = _build_area_top()
+    result['areas'] = len(_area_top)
+    return result
+
+
+def refresh_trip_search_index(full: bool = False) -> dict:
+    """增量更新索引（沒有索引或超過整批重建間隔時整批重建）並重算各地區前 N 名，供排程工作呼叫"""
+    with _refresh_lock:
+        return _refresh(full)
+
+
+def _is_stale():
+    return not _index.updated_at or time.time() - _index.updated_at >= TRIP_SEARCH_MAX_AGE
+
+
+def _refresh_for_query():
+    """查詢路徑上的同步更新：沒有索引時最多等 TRIP_SEARCH_LOCK_WAIT 秒，有舊索引時不等待；
+    剛失敗過、等不到或 SQL 逾時都直接放棄"""
+    if time.monotonic() - _last_failed < TRIP_SEARCH_RETRY_SECONDS:
+        return
+    if _index.updated_at:
+        acquired = _refresh_lock.acquire(blocking=False)
+    else:
+        acquired = _refresh_lock.acquire(timeout=TRIP_SEARCH_LOCK_WAIT)
+    if not acquired:
+        return
+    try:
+        # 等待期間其他請求可能已更新
+        if _is_stale():
+            _refresh(timeout_ms=TRIP_SEARCH_QUERY_TIMEOUT_MS)
+    except Exception as e:
+        logger.error(f"更新行程索引失敗: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+def search_trips(location: str, limit: int = 5):
+    """搜尋地區行程，回傳 get_trips_by_location 格式；索引無法建立時回傳 None"""
+    if _is_stale():
+        _refresh_for_query()
+        if not _index.updated_at:
+            metrics.incr('trip_search_index', label='cold')
+            return None
+    if limit <= TRIP_AREA_TOP_N:
+        top = _area_top.get(expand_terms(location))
+        if top is not None:
+            metrics.incr('trip_area_top', label='hit')
+            return top[:limit]
+    metrics.incr('trip_area_top', label='miss')
+    return [format_location_trip(row) for row in _index.search(location, limit)]
@@ -1,115 +1,245 @@
-import requests
+import os
+import html
 import logging
-from bs4 import BeautifulSoup
 import re
+from html.parser import HTMLParser
+
+from api import snapshot_store
+from api.http_client import fetch_parsed
+from api.html_parser import make_soup
 
 logger = logging.getLogger(__name__)
 
+TOURHUB_URL = "https://tourhub-ashy.vercel.app/"
+SCRAPER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
 def scrape_leaderboard_data():
     """從 TourHub 網站抓取排行榜資料（無模擬內容）"""
     try:
-        url = "https://tourhub-ashy.vercel.app/"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # 查找排行榜資料
-        leaderboard_data = {}
-        rank_colors = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
-        rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
-        
+        return fetch_parsed(TOURHUB_URL, _parse_leaderboard_html, parse_key='leaderboard', headers=SCRAPER_HEADERS, timeout=10)
+    except Exception as e:
+        logger.error(f"抓取網站資料失敗: {e}")
+        return {}
+
+# 依優先順序嘗試的排行榜項目選擇器
+LEADERBOARD_SELECTORS = [
+    '.leaderboard-item',
+    '.ranking-item',
+    '.trip-item',
+    '[class*="rank"]',
+    '[class*="leaderboard"]',
+    '.card',
+    '.item'
+]
+LEADERBOARD_LIMIT = 5
+
+# incremental：優先以上次命中的選擇器串流解析，找到前 5 名即停止；full：完整解析
+LEADERBOARD_PARSE_MODE = os.environ.get('LEADERBOARD_PARSE_MODE', 'incremental')
+
+# 上次成功命中的選擇器
+_last_leaderboard_selector = None
+
+# 沒有結束標籤的 HTML 元素
+_VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+def _parse_leaderboard_html(content):
+    """解析排行榜頁面 HTML"""
+    global _last_leaderboard_selector
+    try:
+        selector = _last_leaderboard_selector
+        if LEADERBOARD_PARSE_MODE == 'incremental' and selector:
+            items = _stream_leaderboard_items(content, selector, LEADERBOARD_LIMIT)
+            if items:
+                logger.info(f"串流解析找到 {len(items)} 個項目使用選擇器: {selector}")
+                return _build_leaderboard_data(items)
+            logger.info(f"上次的選擇器 {selector} 未命中，改為完整解析")
+
+        soup = make_soup(content, parse_only='body')
+
         # 嘗試多種選擇器來找到排行榜項目
-        selectors = [
-            '.leaderboard-item',
-            '.ranking-item', 
-            '.trip-item',
-            '[class*="rank"]',
-            '[class*="leaderboard"]',
-            '.card',
-            '.item'
-        ]
-        
         items = []
-        for selector in selectors:
+        for selector in LEADERBOARD_SELECTORS:
             items = soup.select(selector)
             if items:
                 logger.info(f"找到 {len(items)} 個項目使用選擇器: {selector}")
+                _last_leaderboard_selector = selector
                 break
-        
+
         if not items:
             logger.warning("未找到排行榜項目")
             return {}
-        
-        # 解析找到的項目
-        for i, item in enumerate(items[:5], 1):
-            try:
-                # 嘗試提取行程標題
-                title_element = (
-                    item.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) or
-                    item.find(class_=re.compile(r'title|name|heading', re.I)) or
-                    item.find(['span', 'div'], text=re.compile(r'.+', re.I))
-                )
-                
-                title = None
-                if title_element:
-                    title = title_element.get_text(strip=True)
-                    # 清理標題
-                    title = re.sub(r'^第?\d+名?[：:]?\s*', '', title)
-                    title = re.sub(r'[🥇🥈🥉🏅🎖️]', '', title)
-                
-                # 嘗試提取地區資訊
-                area = None
-                area_keywords = ['日本', '東京', '大阪', '京都', '北海道', '沖繩', '名古屋', '福岡']
-                if title:
-                    for keyword in area_keywords:
-                        if keyword in title:
-                            area = keyword
-                            break
-                
-                # 嘗試提取天數資訊
-                duration = None
-                duration_match = re.search(r'(\d+)天', (title or '') + str(item))
-                if duration_match:
-                    days = int(duration_match.group(1))
-                    duration = f"{days}天{days-1}夜" if days > 1 else "1天"
-                
-                leaderboard_data[str(i)] = {
-                    "rank": i,
-                    "title": title or "",
-                    "rank_title": rank_titles.get(i, f"第{i}名"),
-                    "color": rank_colors.get(i, "#9B59B6"),
-                    "destination": area or "",
-                    "duration": duration or "",
-                }
-                
-            except Exception as e:
-                logger.error(f"解析第 {i} 個項目時出錯: {e}")
-                continue
-        
-        logger.info(f"成功抓取 {len(leaderboard_data)} 筆排行榜資料")
-        return leaderboard_data
-        
+
+        return _build_leaderboard_data(items[:LEADERBOARD_LIMIT])
+
     except Exception as e:
-        logger.error(f"抓取網站資料失敗: {e}")
+        logger.error(f"解析排行榜資料失敗: {e}")
         return {}
 
+def _build_leaderboard_data(items):
+    """將排行榜項目元素轉為排行榜資料"""
+    leaderboard_data = {}
+    rank_colors = {1: "#FFD700", 2: "#C0C0C0", 3: "#CD7F32", 4: "#4ECDC4", 5: "#FF6B9D"}
+    rank_titles = {1: "🥇 第一名", 2: "🥈 第二名", 3: "🥉 第三名", 4: "🏅 第四名", 5: "🎖️ 第五名"}
+
+    # 解析找到的項目
+    for i, item in enumerate(items, 1):
+        try:
+            # 嘗試提取行程標題
+            title_element = (
+                item.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) or
+                item.find(class_=re.compile(r'title|name|heading', re.I)) or
+                item.find(['span', 'div'], text=re.compile(r'.+', re.I))
+            )
+
+            title = None
+            if title_element:
+                title = title_element.get_text(strip=True)
+                # 清理標題
+                title = re.sub(r'^第?\d+名?[：:]?\s*', '', title)
+                title = re.sub(r'[🥇🥈🥉🏅🎖️]', '', title)
+
+            # 嘗試提取地區資訊
+            area = None
+            area_keywords = ['日本', '東京', '大阪', '京都', '北海道', '沖繩', '名古屋', '福岡']
+            if title:
+                for keyword in area_keywords:
+                    if keyword in title:
+                        area = keyword
+                        break
+
+            # 嘗試提取天數資訊
+            duration = None
+            duration_match = re.search(r'(\d+)天', (title or '') + str(item))
+            if duration_match:
+                days = int(duration_match.group(1))
+                duration = f"{days}天{days-1}夜" if days > 1 else "1天"
+
+            leaderboard_data[str(i)] = {
+                "rank": i,
+                "title": title or "",
+                "rank_title": rank_titles.get(i, f"第{i}名"),
+                "color": rank_colors.get(i, "#9B59B6"),
+                "destination": area or "",
+                "duration": duration or "",
+            }
+
+        except Exception as e:
+            logger.error(f"解析第 {i} 個項目時出錯: {e}")
+            continue
+
+    logger.info(f"成功抓取 {len(leaderboard_data)} 筆排行榜資料")
+    return leaderboard_data
+
+def _selector_matcher(selector: str):
+    """將排行榜選擇器轉為 (class 屬性值) -> bool 的判斷函式"""
+    if selector.startswith('.'):
+        name = selector[1:]
+        return lambda class_value: name in class_value.split()
+    m = re.fullmatch(r'\[class\*="([^"]+)"\]', selector)
+    if m:
+        fragment = m.group(1)
+        return lambda class_value: fragment in class_value
+    raise ValueError(f"不支援的選擇器: {selector}")
+
+class _StopParsing(Exception):
+    pass
+
+class _LeaderboardItemCollector(HTMLParser):
+    """事件式擷取符合選擇器的元素原始 HTML，前 limit 個元素都結束後即停止"""
+
+    def __init__(self, selector: str, limit: int):
+        super().__init__(convert_charrefs=True)
+        self.matches = _selector_matcher(selector)
+        self.limit = limit
+        # 每個擷取：{'tag': 標籤名, 'parts': HTML 片段, 'stack': 尚未關閉的標籤}
+        self.captures = []
+        self.active = []
+
+    def _complete(self, capture):
+        self.active.remove(capture)
+        if len(self.captures) >= self.limit and not any(c in self.active for c in self.captures[:self.limit]):
+            raise _StopParsing()
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, self.get_starttag_text(), tag in _VOID_ELEMENTS)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, self.get_starttag_text(), True)
+
+    def _start(self, tag, attrs, raw, closed):
+        for capture in self.active:
+            capture['parts'].append(raw)
+            if not closed:
+                capture['stack'].append(tag)
+        if len(self.captures) >= self.limit:
+            return
+        class_value = next((v for k, v in attrs if k == 'class' and v), None)
+        if class_value and self.matches(class_value):
+            capture = {'tag': tag, 'parts': [raw], 'stack': [] if closed else [tag]}
+            self.captures.append(capture)
+            self.active.append(capture)
+            if closed:
+                self._complete(capture)
+
+    def handle_endtag(self, tag):
+        for capture in list(self.active):
+            if tag not in capture['stack']:
+                continue
+            capture['parts'].append(f'</{tag}>')
+            # 自動關閉未明確結束的子元素（與瀏覽器行為一致）
+            while capture['stack'].pop() != tag:
+                pass
+            if not capture['stack']:
+                self._complete(capture)
+
+    def handle_data(self, data):
+        if self.active:
+            escaped = html.escape(data, quote=False)
+            for capture in self.active:
+                capture['parts'].append(escaped)
+
+def _stream_leaderboard_items(content, selector: str, limit: int, chunk_size: int = 16384):
+    """以事件式解析擷取前 limit 個排行榜項目，耗時取決於排行榜在頁面中的位置"""
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    collector = _LeaderboardItemCollector(selector, limit)
+    try:
+        for start in range(0, len(text), chunk_size):
+            collector.feed(text[start:start + chunk_size])
+        collector.close()
+    except _StopParsing:
+        pass
+
+    items = []
+    for capture in collector.captures[:limit]:
+        fragment = make_soup(''.join(capture['parts']))
+        element = fragment.find(capture['tag'])
+        if element is not None:
+            items.append(element)
+    return items
+
 def scrape_trip_details(rank):
     """從網站抓取特定排名的詳細行程（無模擬內容）"""
     try:
-        url = "https://tourhub-ashy.vercel.app/"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
+        return fetch_parsed(
+            TOURHUB_URL,
+            lambda content: _parse_trip_details_html(content, rank),
+            parse_key=f'trip_details:{rank}',
+            headers=SCRAPER_HEADERS,
+            timeout=10
+        )
+    except Exception as e:
+        logger.error(f"抓取第{rank}名詳細行程失敗: {e}")
+        return None
+
+def _parse_trip_details_html(content, rank):
+    """解析詳細行程頁面 HTML"""
+    try:
+        soup = make_soup(content, parse_only='body')
         
         # 查找詳細行程資料
         # 嘗試找到第 rank 個行程的詳細資訊
@@ -153,7 +283,41 @@ def scrape_trip_details(rank):
         return result
         
     except Exception as e:
-        logger.error(f"抓取第{rank}名詳細行程失敗: {e}")
+        logger.error(f"解析第{rank}名詳細行程失敗: {e}")
         return None
 
 ## 已移除預設排行榜模擬資料
+
+# 背景刷新的排行榜快照（由排程工作寫入共用快照儲存，使用者請求優先讀取，避免在 webhook 中抓網頁）
+LEADERBOARD_SNAPSHOT_MAX_AGE = int(os.environ.get('LEADERBOARD_SNAPSHOT_MAX_AGE', '3600'))
+
+def refresh_leaderboard_snapshot():
+    """重新抓取排行榜與前 5 名詳細行程並更新快照（供排程工作呼叫）"""
+    data = scrape_leaderboard_data()
+    if not data:
+        raise RuntimeError("排行榜抓取結果為空，保留舊快照")
+    # 快照以 JSON 保存，名次鍵使用字串
+    trip_details = {str(rank): scrape_trip_details(rank) for rank in range(1, LEADERBOARD_LIMIT + 1)}
+    # 整份替換，讀取端不會看到更新到一半的快照
+    snapshot_store.save('leaderboard', {'data': data, 'trip_details': trip_details})
+    return {'items': len(data), 'trip_details': sum(1 for d in trip_details.values() if d)}
+
+def _fresh_leaderboard_snapshot():
+    snapshot = snapshot_store.load('leaderboard', LEADERBOARD_SNAPSHOT_MAX_AGE)
+    if snapshot and snapshot['data']:
+        return snapshot
+    return None
+
+def get_leaderboard_data():
+    """取得排行榜資料：優先使用背景快照，沒有或過舊時才即時抓取"""
+    snapshot = _fresh_leaderboard_snapshot()
+    if snapshot:
+        return snapshot['data']
+    return scrape_leaderboard_data()
+
+def get_trip_details(rank):
+    """取得第 rank 名詳細行程：優先使用背景快照，沒有時才即時抓取"""
+    snapshot = _fresh_leaderboard_snapshot()
+    if snapshot and str(rank) in snapshot['trip_details']:
+        return snapshot['trip_details'][str(rank)]
+    return scrape_trip_details(rank)
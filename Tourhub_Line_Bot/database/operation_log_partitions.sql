@@ -0,0 +1,15 @@
+-- 操作日誌依月份分割與每日統計表
+-- 既有資料表請執行 python scripts/partition_operation_logs.py --apply：先執行本檔，再依 information_schema
+-- 查出的外鍵名稱移除外鍵、主鍵改為 (id, created_at)，並以執行當月的下個月一日為 p_history 上限建立分割
+-- 分割的新增、彙總與刪除由排程工作 operation_log_maintenance 執行（api/operation_log_retention.py）
+
+-- 每日統計：到期的分割刪除前先彙總到這裡（沒有網站模組時 module_id 記為 0）
+CREATE TABLE IF NOT EXISTS user_operation_daily_stats (
+    stat_date DATE NOT NULL COMMENT '日期',
+    operation_type VARCHAR(50) NOT NULL COMMENT '操作類型',
+    module_id INT NOT NULL DEFAULT 0 COMMENT '網站模組ID（0 為無）',
+    result_status ENUM('success', 'failed', 'pending') NOT NULL DEFAULT 'pending' COMMENT '操作結果',
+    operation_count INT NOT NULL DEFAULT 0 COMMENT '操作次數',
+    user_count INT NOT NULL DEFAULT 0 COMMENT '不重複用戶數',
+    PRIMARY KEY (stat_date, operation_type, module_id, result_status)
+) COMMENT='用戶操作每日統計表';
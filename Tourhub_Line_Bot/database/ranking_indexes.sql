@@ -0,0 +1,16 @@
+-- 排行榜與收藏查詢的索引
+-- 對應 api/database.py 的排行查詢；執行計畫以 scripts/check_query_plans.py 檢查
+
+-- 1. 排行榜排序（熱門分數、收藏數、分享數，同分依 trip_id）
+--    排行查詢由 trip_stats 依此索引倒序讀取並以主鍵接 line_trips，不需 filesort；
+--    「更多排行」的游標條件從索引中的游標位置開始範圍掃描。
+--    索引已含 trip_stats 端用到的全部欄位（覆蓋索引），不必回表
+ALTER TABLE trip_stats
+    ADD INDEX idx_ranking (popularity_score, favorite_count, share_count, trip_id);
+
+-- 2. 行程詳細安排：依 trip_id 取出並依日期、開始時間排序
+ALTER TABLE line_trip_details
+    ADD INDEX idx_trip_schedule (trip_id, date, start_time);
+
+-- 3. 收藏：user_favorites 的 UNIQUE KEY uniq_user_rank (line_user_id, `rank`)
+--    已涵蓋「WHERE line_user_id = ? ORDER BY rank」與單筆刪除，不需另建索引
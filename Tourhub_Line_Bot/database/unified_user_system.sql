@@ -60,7 +60,7 @@ CREATE TABLE IF NOT EXISTS user_website_bindings (
 
 -- 4. 用戶操作日誌表
 CREATE TABLE IF NOT EXISTS user_operation_logs (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     unified_user_id INT NOT NULL COMMENT '統一用戶ID',
     module_id INT COMMENT '操作的網站模組ID',
     operation_type VARCHAR(50) NOT NULL COMMENT '操作類型',
@@ -69,15 +69,30 @@ CREATE TABLE IF NOT EXISTS user_operation_logs (
     error_message TEXT COMMENT '錯誤訊息',
     ip_address VARCHAR(45) COMMENT '操作IP',
     user_agent TEXT COMMENT '用戶代理',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     
-    FOREIGN KEY (unified_user_id) REFERENCES unified_users(id) ON DELETE CASCADE,
-    FOREIGN KEY (module_id) REFERENCES website_modules(id) ON DELETE SET NULL,
+    -- 依月份分割（見 api/operation_log_retention.py）：分割表不支援外鍵，主鍵須含分割欄位；
+    -- 原外鍵的 ON DELETE（用戶 CASCADE、網站模組 SET NULL）由排程工作 operation_log_maintenance 補做
+    PRIMARY KEY (id, created_at),
     INDEX idx_unified_user_id (unified_user_id),
     INDEX idx_module_id (module_id),
     INDEX idx_operation_type (operation_type),
     INDEX idx_created_at (created_at)
-) COMMENT='用戶操作日誌表';
+) COMMENT='用戶操作日誌表'
+PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- 4.1 用戶操作每日統計表（到期的日誌分割刪除前彙總於此）
+CREATE TABLE IF NOT EXISTS user_operation_daily_stats (
+    stat_date DATE NOT NULL COMMENT '日期',
+    operation_type VARCHAR(50) NOT NULL COMMENT '操作類型',
+    module_id INT NOT NULL DEFAULT 0 COMMENT '網站模組ID（0 為無）',
+    result_status ENUM('success', 'failed', 'pending') NOT NULL DEFAULT 'pending' COMMENT '操作結果',
+    operation_count INT NOT NULL DEFAULT 0 COMMENT '操作次數',
+    user_count INT NOT NULL DEFAULT 0 COMMENT '不重複用戶數',
+    PRIMARY KEY (stat_date, operation_type, module_id, result_status)
+) COMMENT='用戶操作每日統計表';
 
 -- 5. 系統配置表
 CREATE TABLE IF NOT EXISTS system_configs (
@@ -0,0 +1,55 @@
+"""
+比較各 HTML 解析後端在每個來源 fixture 上的解析時間
+
+用法：python scripts/bench_html_parsers.py [--repeat 20]
+fixture 放在 fixtures/html/<來源名稱>.html
+"""
+
+import argparse
+import logging
+import time
+
+from scraper_sources import SOURCES, load_fixture, count_items
+
+from api import html_parser
+
+
+def bench_source(source, content, repeat):
+    """回傳 {backend: (每次解析毫秒數, 擷取筆數)}"""
+    results = {}
+    for backend in html_parser.available_backends():
+        html_parser.set_backend(backend)
+        try:
+            result = source['parse'](content)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                source['parse'](content)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+            results[backend] = (elapsed_ms, count_items(result))
+        finally:
+            html_parser.set_backend(None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTML 解析後端 benchmark')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    backends = html_parser.available_backends()
+    print(f"可用後端: {', '.join(backends)}")
+    print(f"{'來源':<26}" + ''.join(f"{b:>22}" for b in backends))
+
+    for source in SOURCES:
+        content = load_fixture(source)
+        if content is None:
+            print(f"{source['name']:<26}  (缺少 fixture，略過)")
+            continue
+        results = bench_source(source, content, args.repeat)
+        cells = ''.join(f"{results[b][0]:>12.2f} ms ({results[b][1]:>3})" for b in backends)
+        print(f"{source['name']:<26}{cells}")
+
+
+if __name__ == '__main__':
+    main()
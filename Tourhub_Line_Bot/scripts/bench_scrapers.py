@@ -0,0 +1,129 @@
+"""
+離線爬蟲 benchmark 與回歸檢查
+- 以 fixtures/html 內錄製的回應餵給各解析函式
+- 回報解析時間、記憶體配置峰值（tracemalloc）與擷取筆數
+- 與 fixtures/scraper_baseline.json 比較，變慢、擷取筆數改變或缺少基準時以非零狀態結束
+
+用法：
+    python scripts/bench_scrapers.py                    # 與基準比較
+    python scripts/bench_scrapers.py --update-baseline  # 重新產生基準
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+import tracemalloc
+
+from scraper_sources import (
+    SOURCES, FIXTURES_DIR, load_fixture, count_items, vacancy_inputs, parse_vacancy_texts
+)
+
+from api import web_scraper
+
+BASELINE_PATH = os.path.join(os.path.dirname(FIXTURES_DIR), 'scraper_baseline.json')
+
+
+def _reset_state():
+    # 排行榜會記住上次命中的選擇器，每次量測前重置以保持可重現
+    web_scraper._last_leaderboard_selector = None
+
+
+def measure(parse, data, repeat):
+    """回傳 (中位數毫秒, 配置峰值 KB, 結果)"""
+    _reset_state()
+    result = parse(data)  # 暖身（同時讓排行榜記住選擇器）
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(data)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        parse(data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak / 1024, result
+
+
+def run(repeat):
+    report = {}
+    for source in SOURCES:
+        content = load_fixture(source)
+        if content is None:
+            print(f"⚠️  {source['name']}: 缺少 fixture，略過")
+            continue
+        parse_ms, peak_kb, result = measure(source['parse'], content, repeat)
+        report[source['name']] = {'parse_ms': round(parse_ms, 3), 'peak_kb': round(peak_kb, 1),
+                                  'items': count_items(result)}
+
+    texts = vacancy_inputs()
+    parse_ms, peak_kb, result = measure(parse_vacancy_texts, texts, repeat)
+    report['vacancy_info'] = {'parse_ms': round(parse_ms, 3), 'peak_kb': round(peak_kb, 1),
+                              'items': len(result), 'inputs': len(texts)}
+    return report
+
+
+def compare(report, baseline, time_tolerance, memory_tolerance):
+    """回傳失敗訊息列表"""
+    failures = []
+    for name, current in report.items():
+        base = baseline.get(name)
+        if not base:
+            failures.append(f"{name}: 基準中沒有此來源，請執行 --update-baseline")
+            continue
+        if current['items'] != base['items']:
+            failures.append(f"{name}: 擷取筆數 {base['items']} -> {current['items']}")
+        if current['parse_ms'] > base['parse_ms'] * (1 + time_tolerance):
+            failures.append(f"{name}: 解析時間 {base['parse_ms']}ms -> {current['parse_ms']}ms")
+        if current['peak_kb'] > base['peak_kb'] * (1 + memory_tolerance):
+            failures.append(f"{name}: 記憶體峰值 {base['peak_kb']}KB -> {current['peak_kb']}KB")
+    for name in baseline:
+        if name not in report:
+            failures.append(f"{name}: 基準中有此來源但缺少 fixture")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='離線爬蟲 benchmark')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--time-tolerance', type=float, default=0.5, help='允許的解析時間增幅（0.5 = 50%%）')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25, help='允許的記憶體峰值增幅')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    report = run(args.repeat)
+    print(f"{'來源':<26}{'解析(ms)':>12}{'記憶體峰值(KB)':>16}{'筆數':>8}")
+    for name, row in report.items():
+        print(f"{name:<26}{row['parse_ms']:>12.2f}{row['peak_kb']:>16.1f}{row['items']:>8}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"已更新基準: {BASELINE_PATH}")
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        # 沒有基準就無法判斷回歸，視為失敗而不是略過
+        print(f"❌ 找不到基準檔 {BASELINE_PATH}，請先錄製 fixture 並執行 --update-baseline")
+        raise SystemExit(1)
+
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        baseline = json.load(f)
+    failures = compare(report, baseline, args.time_tolerance, args.memory_tolerance)
+    if failures:
+        print("❌ 爬蟲效能或擷取結果回歸：")
+        for failure in failures:
+            print(f"  - {failure}")
+        raise SystemExit(1)
+    print("✅ 與基準一致")
+
+
+if __name__ == '__main__':
+    main()
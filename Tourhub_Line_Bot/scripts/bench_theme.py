@@ -0,0 +1,190 @@
+"""
+apply_modern_theme benchmark
+- 與舊版遞迴實作比較：輸入為每次新建立、尚未套用主題的 payload（快速選單、詳細行程、置物櫃、我的收藏等），
+  與送出前交給 apply_modern_theme 的內容相同
+- 先確認兩者輸出完全一致，不一致時以非零狀態結束
+
+用法：python scripts/bench_theme.py [--repeat 2000]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from api import index  # noqa: E402
+from api.flex_templates import is_frozen  # noqa: E402
+from api.locker_service import build_lockers_carousel  # noqa: E402
+
+
+def legacy_apply_modern_theme(payload):
+    """改寫前的遞迴版本（逐節點重建 dict / list），作為比較基準"""
+    if payload is None:
+        return payload
+
+    def _transform(node, parent_key=None):
+        if isinstance(node, dict):
+            if node.get('backgroundColor') == '#FFA500':
+                node['backgroundColor'] = index.THEME_PRIMARY_BLUE
+            if node.get('type') == 'box' and parent_key == 'header':
+                if node.get('backgroundColor') not in [index.THEME_PRIMARY_BLUE, index.THEME_ACCENT_BLUE]:
+                    node['backgroundColor'] = index.THEME_PRIMARY_BLUE
+            if node.get('type') == 'button':
+                style = node.get('style')
+                if style == 'primary':
+                    current_color = node.get('color', '')
+                    if current_color in ['#FF6B6B', '#E74C3C']:
+                        node['color'] = index.THEME_ERROR
+                    elif current_color in ['#4ECDC4', '#2ECC71']:
+                        node['color'] = index.THEME_SUCCESS
+                    elif current_color in ['#FFA500', '#F59E0B']:
+                        node['color'] = index.THEME_WARNING
+                    elif current_color in ['#9B59B6', '#6C5CE7']:
+                        node['color'] = index.THEME_ACCENT_BLUE
+                    else:
+                        node['color'] = index.THEME_PRIMARY_BLUE
+                elif style == 'secondary':
+                    node.setdefault('color', index.THEME_TEXT_SECONDARY)
+            if node.get('type') == 'text':
+                if parent_key == 'header':
+                    node['color'] = '#ffffff'
+                else:
+                    current = node.get('color')
+                    if current in (None, '#333333', '#222222', '#000000'):
+                        node['color'] = index.THEME_TEXT_PRIMARY
+                    elif current in ('#666666', '#777777', '#888888', '#555555'):
+                        node['color'] = index.THEME_TEXT_SECONDARY
+                    elif current == '#999999':
+                        node['color'] = index.THEME_TEXT_MUTED
+            for k, v in list(node.items()):
+                node[k] = _transform(v, parent_key=k)
+            return node
+        elif isinstance(node, list):
+            return [_transform(child, parent_key=parent_key) for child in node]
+        else:
+            return node
+
+    return _transform(payload)
+
+
+def _sample_itinerary():
+    start = date(2024, 4, 1)
+    details = [
+        {'date': start + timedelta(days=i // 2), 'start_time': timedelta(hours=9 + i),
+         'end_time': timedelta(hours=10 + i), 'location': f'淺草寺・仲見世 {i}', 'description': None}
+        for i in range(6)
+    ]
+    return {'rank': 4, 'rank_title': '🏅 第四名', 'title': '東京經典行程', 'area': '東京',
+            'color': '#4ECDC4', 'details': details, 'detail_count': 9}
+
+
+def _sample_lockers():
+    return [
+        {'name': f'新宿站 東口 置物櫃 {i}', 'address': '東京都新宿区新宿3丁目', 'map_uri': 'https://maps.google.com/',
+         'distance_km': 0.3 * i, 'has_vacancy': bool(i % 2), 'available_slots': i, 'sizes': ['S', 'M'],
+         'price_range': '¥300-¥700', 'location_type': 'station'}
+        for i in range(1, 6)
+    ]
+
+
+def _sample_favorites():
+    from api.pagination import create_leaderboard_summary, _leaderboard_entry_from_trip
+    start = date(2024, 4, 1)
+    rows = [
+        {'title': f'大阪美食行程 {rank}', 'area': '大阪', 'start_date': start, 'end_date': start + timedelta(days=rank % 4)}
+        for rank in range(1, 11)
+    ]
+    return {
+        'type': 'carousel',
+        'contents': [
+            create_leaderboard_summary(rank, _leaderboard_entry_from_trip(rank, row), favorited=True)
+            for rank, row in enumerate(rows, 1)
+        ],
+    }
+
+
+# 每次呼叫都重新建立、尚未套用主題的 payload（與送出前交給 apply_modern_theme 的內容相同）；
+# 預先編譯並凍結的模板（排行榜 Top10、功能選單等）已在編譯時套用主題，不列入
+SAMPLE_BUILDERS = {
+    'quick_menu': lambda: index.create_new_quick_menu(),
+    'itinerary': lambda: index.create_optimized_flex_itinerary(_sample_itinerary()),
+    'locker_carousel': lambda: build_lockers_carousel(_sample_lockers(), 2),
+    'my_favorites': _sample_favorites,
+    'creation_help': lambda: index.create_creation_help(),
+}
+
+
+def _sample_top10_rows():
+    start = date(2024, 4, 1)
+    return [
+        {'trip_id': i, 'title': f'東京經典行程 {i}', 'area': '東京',
+         'start_date': start, 'end_date': start + timedelta(days=i % 5)}
+        for i in range(1, 11)
+    ]
+
+
+def sample_payloads():
+    """主要模板的實際輸出（含預先凍結的卡片），供 check_flex_budget.py 檢查大小"""
+    return {
+        'quick_menu': index.create_new_quick_menu(),
+        'leaderboard_top10': index.create_top10_carousel(_sample_top10_rows()),
+        'feature_menu': index.create_simple_flex_message('feature_menu'),
+        'help': index.create_simple_flex_message('help'),
+    }
+
+
+def _contains_frozen(node):
+    if is_frozen(node):
+        return True
+    if isinstance(node, dict):
+        return any(_contains_frozen(v) for v in node.values())
+    if isinstance(node, list):
+        return any(_contains_frozen(v) for v in node)
+    return False
+
+
+def bench(func, build, repeat):
+    # 每次都需要新建立、未套用主題的 payload，建立時間不列入
+    payloads = [build() for _ in range(repeat)]
+    start = time.perf_counter()
+    for item in payloads:
+        func(item)
+    return (time.perf_counter() - start) * 1e6 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='apply_modern_theme benchmark')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    failed = False
+    print(f"{'payload':<20}{'舊版(µs)':>12}{'新版(µs)':>12}{'加速':>8}")
+    for name, build in SAMPLE_BUILDERS.items():
+        payload = build()
+        if _contains_frozen(payload):
+            # 凍結子樹會被 apply_modern_theme 略過，量到的不是實際的主題套用
+            print(f"❌ {name}: 範例含預先套用主題的凍結子樹，請改用未套用主題的 payload")
+            failed = True
+            continue
+        expected = legacy_apply_modern_theme(payload)
+        actual = index.apply_modern_theme(build())
+        if actual != expected:
+            print(f"❌ {name}: 新舊版本輸出不一致")
+            failed = True
+            continue
+        legacy_us = bench(legacy_apply_modern_theme, build, args.repeat)
+        current_us = bench(index.apply_modern_theme, build, args.repeat)
+        print(f"{name:<20}{legacy_us:>12.1f}{current_us:>12.1f}{legacy_us / current_us:>7.2f}x")
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+建立啟動快照
+- 以內建設定產生關鍵字比對器、靜態卡片與 Flex 欄位白名單，寫入 build/startup_snapshot.pkl
+- 部署時執行（vercel.json buildCommand）；設定或模板程式變更後快照指紋不符，執行時會自動忽略
+- 寫入後重新讀取驗證，失敗時以非零狀態結束
+
+用法：python scripts/build_snapshot.py [--output build/startup_snapshot.pkl]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# 以目前程式碼重新建立，不沿用舊快照
+os.environ['STARTUP_SNAPSHOT'] = 'false'
+
+from api import index, startup_snapshot  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=startup_snapshot.STARTUP_SNAPSHOT_PATH)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    artifacts = index.build_startup_artifacts()
+    size = startup_snapshot.write_snapshot(artifacts, args.output)
+    print(f"✅ 已寫入 {args.output}（{size} bytes）")
+    for name, value in artifacts.items():
+        count = len(value) if hasattr(value, '__len__') else '-'
+        print(f"  {name:<20}{count}")
+
+    startup_snapshot.STARTUP_SNAPSHOT_ENABLED = True
+    if startup_snapshot.load_snapshot(args.output) is None:
+        print("❌ 無法讀回剛寫入的快照")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Flex payload 大小檢查
+- 列出主要模板壓縮前後的位元組數與送出時的訊息則數
+- 確認壓縮後與 SDK 轉換結果一致、所有訊息都在 LINE 限制內，否則以非零狀態結束
+
+用法：python scripts/check_flex_budget.py
+"""
+
+import copy
+import logging
+
+from bench_theme import sample_payloads
+
+from api import index
+from api import flex_budget
+from api.line_sender import sanitize_flex
+from linebot.v3.messaging import FlexContainer
+
+
+def _long_bubble():
+    # 內容遠超過 bubble 上限的長清單，用來確認會依 body 內容拆頁
+    lines = [{"type": "text", "text": f"第{i}項：" + "行程說明" * 40, "wrap": True, "size": "sm", "margin": "md"}
+             for i in range(200)]
+    return {
+        "type": "bubble",
+        "header": {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "長清單"}]},
+        "body": {"type": "box", "layout": "vertical", "contents": lines},
+        "footer": {"type": "box", "layout": "vertical", "contents": [
+            {"type": "button", "action": {"type": "message", "label": "返回", "text": "選單"}, "style": "primary"}
+        ]},
+    }
+
+
+def _oversized_payloads():
+    bubble = index.create_top10_carousel([])['contents'][0]
+    return {
+        'carousel_x15': {'type': 'carousel', 'contents': [copy.deepcopy(bubble) for _ in range(15)]},
+        'bubble_long': _long_bubble(),
+    }
+
+
+def _within_limits(contents) -> bool:
+    size = flex_budget.payload_size(contents)
+    if contents['type'] == 'bubble':
+        return size <= flex_budget.FLEX_BUBBLE_MAX_BYTES
+    return (size <= flex_budget.FLEX_CAROUSEL_MAX_BYTES
+            and len(contents['contents']) <= flex_budget.FLEX_CAROUSEL_MAX_BUBBLES)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    payloads = dict(sample_payloads(), **_oversized_payloads())
+
+    failed = False
+    print(f"{'payload':<20}{'原始(bytes)':>14}{'壓縮後(bytes)':>16}{'則數':>6}")
+    for name, payload in payloads.items():
+        themed = index.apply_modern_theme(payload)
+        if not themed:
+            print(f"{name:<20}  (無內容，略過)")
+            continue
+        raw_size = flex_budget.payload_size(themed)
+        pages = flex_budget.prepare_flex_messages('TourHub', sanitize_flex(themed), template=name)
+        compact_size = sum(flex_budget.payload_size(c) for _, c in pages)
+        print(f"{name:<20}{raw_size:>14}{compact_size:>16}{len(pages):>6}")
+
+        if len(pages) > flex_budget.LINE_MAX_MESSAGES_PER_REPLY:
+            print(f"❌ {name}: 超過單次回覆則數上限")
+            failed = True
+        for alt, contents in pages:
+            if not _within_limits(contents) or len(alt) > flex_budget.FLEX_ALT_TEXT_MAX_CHARS:
+                print(f"❌ {name}: 拆分後仍超過 LINE 限制")
+                failed = True
+            # SDK 仍能解析壓縮後的內容
+            FlexContainer.from_dict(contents)
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
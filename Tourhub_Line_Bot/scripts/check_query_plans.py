@@ -0,0 +1,334 @@
+"""
+SQL 執行計畫回歸檢查
+- 收集 api/database.py、api/pagination.py、api/index.py 的所有 SQL：
+  模組層級的查詢常數（含組合後的字串），以及函式內直接寫在 execute 的字串
+- 對本機 MySQL 的測試資料庫逐一執行 EXPLAIN，出現 filesort 或大表全表掃描時以非零狀態結束
+- --seed 會在測試資料庫建立替身資料表（欄位與程式用到的一致）、套用
+  database/ranking_indexes.sql 並灌入足量資料，讓最佳化器做出與正式環境相近的選擇
+- --skip-unavailable（或 PLAN_CHECK_SKIP_UNAVAILABLE=true）在沒有 MySQL 可用時印出「略過」並以 0 結束，
+  供沒有測試資料庫的環境使用；未加時連不上即失敗
+
+用法：
+    python scripts/check_query_plans.py --list                 # 只列出收集到的 SQL
+    python scripts/check_query_plans.py --seed                 # 建立測試資料後檢查
+    python scripts/check_query_plans.py --database tourhub_ci  # 檢查既有的測試資料庫
+    python scripts/check_query_plans.py --seed --skip-unavailable  # 沒有 MySQL 時略過
+"""
+
+import argparse
+import ast
+import importlib
+import os
+import random
+import re
+import sys
+from datetime import date, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+SOURCE_MODULES = ('api.database', 'api.pagination', 'api.index')
+MIGRATIONS = ('database/ranking_indexes.sql',)
+
+# 全表掃描只在這些資料表上算失敗（設定表等小表掃描無妨）
+LARGE_TABLES = ('line_trips', 'trip_stats', 'line_trip_details', 'user_favorites')
+
+# 已知且接受的計畫（名稱 → 原因）
+ALLOWED = {
+    'api.database._get_trips_by_location_like': "地區索引無法建立時的後備查詢，LIKE '%詞%' 無法使用索引",
+}
+
+_SQL_START_RE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_PARAM_RE = re.compile(r'%s')
+# INSERT ... (欄位) VALUES {rows} 或 WHERE (欄位) IN ({rows})
+_ROWS_COLUMNS_RE = re.compile(r'\(([^()]*)\)\s*(?:VALUES\s*\{rows\}|IN\s*\(\{rows\}\))', re.IGNORECASE)
+
+SEED_SCHEMA = (
+    """
+    CREATE TABLE line_trips (
+        trip_id INT PRIMARY KEY,
+        title VARCHAR(200),
+        description TEXT,
+        area VARCHAR(100),
+        start_date DATE,
+        end_date DATE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE trip_stats (
+        trip_id INT PRIMARY KEY,
+        favorite_count INT NOT NULL DEFAULT 0,
+        share_count INT NOT NULL DEFAULT 0,
+        popularity_score DECIMAL(10, 2) NOT NULL DEFAULT 0
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE line_trip_details (
+        detail_id INT AUTO_INCREMENT PRIMARY KEY,
+        trip_id INT NOT NULL,
+        location VARCHAR(200),
+        date DATE,
+        start_time TIME,
+        end_time TIME,
+        description TEXT
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE user_favorites (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        line_user_id VARCHAR(128) NOT NULL,
+        `rank` INT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uniq_user_rank (line_user_id, `rank`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE user_operation_logs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        unified_user_id INT NOT NULL,
+        module_id INT,
+        operation_type VARCHAR(50) NOT NULL,
+        operation_data JSON,
+        result_status ENUM('success', 'failed', 'pending') DEFAULT 'pending',
+        error_message TEXT,
+        ip_address VARCHAR(45),
+        user_agent TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_unified_user_id (unified_user_id),
+        INDEX idx_module_id (module_id),
+        INDEX idx_operation_type (operation_type),
+        INDEX idx_created_at (created_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+)
+SEED_TRIPS = 20000
+
+
+# ---- 收集 SQL ----
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+def _function_literals(module_name):
+    """函式內的 SQL 字串常數 → [(名稱, SQL)]"""
+    path = os.path.join(ROOT_DIR, *module_name.split('.')) + '.py'
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+
+    found = []
+
+    def visit(node, scope):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visit(child, child.name)
+            elif scope and isinstance(child, ast.Constant) and isinstance(child.value, str) \
+                    and _SQL_START_RE.match(child.value):
+                found.append((f"{module_name}.{scope}", child.value))
+            else:
+                visit(child, scope)
+
+    visit(tree, None)
+    return found
+
+
+def _expand_rows(sql):
+    """批次語句的 {rows} 以兩筆資料展開，每筆的欄位數取自前面的欄位列表"""
+    match = _ROWS_COLUMNS_RE.search(sql)
+    width = len(match.group(1).split(',')) if match else 1
+    row = '(' + ', '.join(['%s'] * width) + ')'
+    return sql.replace('{rows}', f"{row}, {row}")
+
+
+def _module_constants(module_name):
+    """模組層級、名稱以 QUERY 結尾的公開字串常數（已組合完成） → [(名稱, SQL)]"""
+    module = importlib.import_module(module_name)
+    found = []
+    for name, value in vars(module).items():
+        if name.startswith('_') or not name.endswith('QUERY') or not isinstance(value, str):
+            continue
+        if '{rows}' in value:
+            value = _expand_rows(value)
+        if _SQL_START_RE.match(value) and '{' not in value:
+            found.append((f"{module_name}.{name}", value))
+    return found
+
+
+def collect_statements():
+    statements = []
+    seen = set()
+    for module_name in SOURCE_MODULES:
+        for name, sql in _module_constants(module_name) + _function_literals(module_name):
+            key = _normalize(sql)
+            if key not in seen:
+                seen.add(key)
+                statements.append((name, sql))
+    return statements
+
+
+def bind_sample_params(sql):
+    """把 %s 換成合理的常數，讓 EXPLAIN 可以直接執行"""
+    parts = _PARAM_RE.split(sql)
+    bound = [parts[0]]
+    for part in parts[1:]:
+        before = bound[-1].rstrip()
+        if re.search(r'\bLIMIT\s*$', before, re.IGNORECASE) or re.search(r'\bLIMIT\s+\d+\s*,\s*$', before, re.IGNORECASE):
+            value = '10'
+        elif re.search(r'\bLIKE\s*$', before, re.IGNORECASE):
+            value = "'%東京%'"
+        else:
+            # 字串常數與數字欄位比較時會轉成數字，仍可使用索引；反之則不行，所以一律代入字串
+            value = "'1'"
+        bound.append(value)
+        bound.append(part)
+    return ''.join(bound)
+
+
+# ---- 測試資料庫 ----
+
+def _unavailable(args, reason):
+    if args.skip_unavailable:
+        print(f"⚠️ 略過執行計畫檢查：{reason}")
+        raise SystemExit(0)
+    raise SystemExit(reason)
+
+
+def connect(args, database=None):
+    try:
+        import mysql.connector
+    except ImportError:
+        _unavailable(args, "未安裝 mysql-connector-python")
+    try:
+        return mysql.connector.connect(
+            host=args.host, port=args.port, user=args.user, password=args.password,
+            database=database, autocommit=True
+        )
+    except mysql.connector.Error as e:
+        _unavailable(args, f"無法連線測試資料庫 {args.host}:{args.port}/{database or ''}: {e}")
+
+
+def seed(args):
+    if args.database == os.environ.get('MYSQL_DB', 'tourhub'):
+        raise SystemExit(f"拒絕在 {args.database} 建立測試資料，請以 --database 指定測試用資料庫")
+
+    connection = connect(args)
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}` DEFAULT CHARSET utf8mb4")
+    cursor.execute(f"USE `{args.database}`")
+    for table in ('user_operation_logs', 'user_favorites', 'line_trip_details', 'trip_stats', 'line_trips'):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    for ddl in SEED_SCHEMA:
+        cursor.execute(ddl)
+    for relative_path in MIGRATIONS:
+        with open(os.path.join(ROOT_DIR, relative_path), encoding='utf-8') as f:
+            script = '\n'.join(line for line in f if not line.lstrip().startswith('--'))
+        for statement in filter(None, (s.strip() for s in script.split(';'))):
+            cursor.execute(statement)
+
+    random.seed(0)
+    areas = ('東京', '大阪', '京都', '北海道', '沖繩', '名古屋', '福岡')
+    start = date(2024, 1, 1)
+    trips, stats, details = [], [], []
+    for trip_id in range(1, SEED_TRIPS + 1):
+        begin = start + timedelta(days=trip_id % 365)
+        trips.append((trip_id, f"行程 {trip_id}", None, random.choice(areas), begin, begin + timedelta(days=trip_id % 5)))
+        # 約一成行程沒有統計資料
+        if trip_id % 10:
+            stats.append((trip_id, random.randint(0, 500), random.randint(0, 200), round(random.uniform(0, 1000), 2)))
+        for day in range(3):
+            details.append((trip_id, f"景點 {day}", begin + timedelta(days=day), f"{9 + day}:00", f"{11 + day}:00", None))
+    favorites = [(f"U{user:010d}", rank) for user in range(2000) for rank in random.sample(range(1, 51), 5)]
+
+    batches = (
+        ("INSERT INTO line_trips (trip_id, title, description, area, start_date, end_date) VALUES (%s, %s, %s, %s, %s, %s)", trips),
+        ("INSERT INTO trip_stats (trip_id, favorite_count, share_count, popularity_score) VALUES (%s, %s, %s, %s)", stats),
+        ("INSERT INTO line_trip_details (trip_id, location, date, start_time, end_time, description) VALUES (%s, %s, %s, %s, %s, %s)", details),
+        ("INSERT INTO user_favorites (line_user_id, `rank`) VALUES (%s, %s)", favorites),
+    )
+    for statement, rows in batches:
+        for i in range(0, len(rows), 2000):
+            cursor.executemany(statement, rows[i:i + 2000])
+    cursor.execute("ANALYZE TABLE line_trips, trip_stats, line_trip_details, user_favorites")
+    cursor.fetchall()
+    cursor.close()
+    connection.close()
+    print(f"🌱 已建立測試資料：{len(trips)} 行程、{len(stats)} 筆統計、{len(details)} 筆行程明細、{len(favorites)} 筆收藏")
+
+
+# ---- 檢查 ----
+
+def problems_in_plan(plan):
+    problems = []
+    for row in plan:
+        table = row.get('table') or ''
+        extra = row.get('Extra') or ''
+        if 'Using filesort' in extra:
+            problems.append(f"{table}: Using filesort")
+        if row.get('type') == 'ALL' and table in LARGE_TABLES:
+            problems.append(f"{table}: 全表掃描（約 {row.get('rows')} 列）")
+    return problems
+
+
+def check(args, statements):
+    connection = connect(args, args.database)
+    cursor = connection.cursor(dictionary=True)
+    failed = 0
+    for name, sql in statements:
+        try:
+            cursor.execute("EXPLAIN " + bind_sample_params(sql))
+            plan = cursor.fetchall()
+        except Exception as e:
+            print(f"❌ {name}: EXPLAIN 失敗 {e}")
+            failed += 1
+            continue
+
+        problems = problems_in_plan(plan)
+        if not problems:
+            print(f"✅ {name}")
+        elif name in ALLOWED:
+            print(f"⚠️ {name}: {'; '.join(problems)}（允許：{ALLOWED[name]}）")
+        else:
+            print(f"❌ {name}: {'; '.join(problems)}")
+            if args.verbose:
+                for row in plan:
+                    print(f"    {row}")
+            failed += 1
+    cursor.close()
+    connection.close()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--list', action='store_true', help='只列出收集到的 SQL，不連線')
+    parser.add_argument('--seed', action='store_true', help='先重建測試資料表並灌入資料')
+    parser.add_argument('--host', default=os.environ.get('PLAN_CHECK_MYSQL_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PLAN_CHECK_MYSQL_PORT', '3306')))
+    parser.add_argument('--user', default=os.environ.get('PLAN_CHECK_MYSQL_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('PLAN_CHECK_MYSQL_PASSWORD', ''))
+    parser.add_argument('--database', default=os.environ.get('PLAN_CHECK_MYSQL_DB', 'tourhub_plan_check'))
+    parser.add_argument('--verbose', action='store_true', help='失敗時印出完整執行計畫')
+    parser.add_argument(
+        '--skip-unavailable', action='store_true',
+        default=os.environ.get('PLAN_CHECK_SKIP_UNAVAILABLE', 'false').lower() in ('1', 'true', 'yes'),
+        help='沒有可用的 MySQL 時略過（以 0 結束）'
+    )
+    args = parser.parse_args()
+
+    statements = collect_statements()
+    if args.list:
+        for name, sql in statements:
+            print(f"-- {name}\n{bind_sample_params(sql).strip()}\n")
+        print(f"共 {len(statements)} 個 SQL")
+        return
+
+    if args.seed:
+        seed(args)
+    failed = check(args, statements)
+    print(f"\n檢查 {len(statements)} 個 SQL，{failed} 個未通過")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+冷啟動 import 成本檢查
+- 以 python -X importtime 在新的程序中載入 api.index，列出累計耗時最高的模組
+- 重複數次取中位數；超過預算，或冷啟動就載入了應延遲的重量級相依時以非零狀態結束
+- vercel.json 的 buildCommand 在建立啟動快照後執行，超過預算時部署失敗（預算可用 IMPORT_BUDGET_MS 調整）
+
+用法：python scripts/import_budget.py [--budget-ms 400] [--runs 3] [--top 15]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGET_MODULE = 'api.index'
+# 只在實際使用時才需要的相依，不應出現在冷啟動
+DEFERRED_MODULES = ('linebot', 'requests', 'bs4', 'mysql.connector', 'pydantic', 'aiohttp')
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+
+def measure():
+    """回傳 {模組: (self_us, cumulative_us)}"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {TARGET_MODULE}'],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"無法載入 {TARGET_MODULE}:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            modules[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_BUDGET_MS', '400')))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    totals = [run[TARGET_MODULE][1] / 1000 for run in runs]
+    total_ms = statistics.median(totals)
+
+    last = runs[-1]
+    print(f"{'模組':<48}{'自身(ms)':>10}{'累計(ms)':>10}")
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda item: item[1][1], reverse=True)[:args.top]:
+        print(f"{name:<48}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+    print(f"\n{TARGET_MODULE} 冷啟動 import：{total_ms:.1f}ms（中位數，{args.runs} 次），預算 {args.budget_ms:.0f}ms")
+
+    failed = False
+    eager = sorted(name for name in last if any(name == d or name.startswith(d + '.') for d in DEFERRED_MODULES))
+    if eager:
+        print(f"❌ 冷啟動載入了應延遲的模組: {', '.join(eager[:10])}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"❌ 超過 import 預算 {total_ms - args.budget_ms:.1f}ms")
+        failed = True
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+操作日誌改為月份分割的一次性遷移（既有的 user_operation_logs）
+- 建立每日統計表（database/operation_log_partitions.sql）
+- 分割表不支援外鍵：外鍵名稱由 information_schema 查出後移除（不假設 MySQL 自動命名）；
+  原本 ON DELETE CASCADE / SET NULL 的效果改由排程工作清理（api/operation_log_retention.py）
+- 每個唯一鍵都必須包含分割欄位：主鍵改為 (id, created_at)
+- p_history 收納目前為止的所有資料，上限為執行當月的下個月一日（執行時計算），
+  再從 pmax 切出之後的月份（與排程工作 operation_log_maintenance 相同）
+- 已完成的步驟會略過，可重複執行；預設只列出要執行的 SQL，加 --apply 才實際執行
+
+用法：
+    python scripts/partition_operation_logs.py           # 只列出 SQL
+    python scripts/partition_operation_logs.py --apply   # 連線 MYSQL_* 設定的資料庫並執行
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from api.database import get_database_connection  # noqa: E402
+from api.operation_log_retention import (  # noqa: E402
+    LOG_TABLE, MAX_PARTITION, _boundary, create_future_partitions, list_partitions, month_start
+)
+
+MIGRATION_FILE = 'database/operation_log_partitions.sql'
+
+FOREIGN_KEYS_QUERY = """
+SELECT CONSTRAINT_NAME
+FROM information_schema.REFERENTIAL_CONSTRAINTS
+WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s
+ORDER BY CONSTRAINT_NAME
+"""
+PRIMARY_KEY_QUERY = """
+SELECT COLUMN_NAME
+FROM information_schema.KEY_COLUMN_USAGE
+WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+ORDER BY ORDINAL_POSITION
+"""
+
+
+def migration_statements(path=MIGRATION_FILE):
+    with open(os.path.join(ROOT_DIR, path), encoding='utf-8') as f:
+        script = '\n'.join(line for line in f if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in script.split(';') if statement.strip()]
+
+
+def plan(cursor, today):
+    """依目前資料表狀態列出還需要執行的 SQL"""
+    statements = migration_statements()
+
+    cursor.execute(FOREIGN_KEYS_QUERY, (LOG_TABLE,))
+    foreign_keys = [row[0] for row in cursor.fetchall()]
+    if foreign_keys:
+        statements.append(
+            f"ALTER TABLE {LOG_TABLE} " + ", ".join(f"DROP FOREIGN KEY `{name}`" for name in foreign_keys)
+        )
+
+    cursor.execute(PRIMARY_KEY_QUERY, (LOG_TABLE,))
+    if [row[0] for row in cursor.fetchall()] != ['id', 'created_at']:
+        statements.append(
+            f"ALTER TABLE {LOG_TABLE} "
+            "MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+        )
+
+    if not list_partitions(cursor):
+        statements.append(
+            f"ALTER TABLE {LOG_TABLE} PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ("
+            f"PARTITION p_history VALUES LESS THAN ({_boundary(month_start(today, 1))}), "
+            f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE)"
+        )
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--apply', action='store_true', help='實際執行（預設只列出 SQL）')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    connection = get_database_connection()
+    if not connection:
+        raise SystemExit("無法連線資料庫，請確認 MYSQL_* 環境變數")
+    today = date.today()
+    try:
+        cursor = connection.cursor()
+        try:
+            statements = plan(cursor, today)
+            for statement in statements:
+                print(f"{statement};\n")
+            if not args.apply:
+                print(f"共 {len(statements)} 個 SQL（未執行，加 --apply 執行）")
+                return
+            for statement in statements:
+                cursor.execute(statement)
+            created = create_future_partitions(cursor, list_partitions(cursor), today)
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+    print(f"✅ 已執行 {len(statements)} 個 SQL，新增分割 {created}")
+
+
+if __name__ == '__main__':
+    main()
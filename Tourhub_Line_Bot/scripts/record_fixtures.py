@@ -0,0 +1,75 @@
+"""
+錄製各爬蟲來源的真實回應到 fixtures/html，供離線 benchmark 與回歸檢查使用
+
+用法：python scripts/record_fixtures.py [--only 來源名稱 ...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from scraper_sources import SOURCES, FIXTURES_DIR, fixture_path
+
+from api.http_client import get_session
+from api.web_scraper import SCRAPER_HEADERS
+
+MANIFEST_PATH = os.path.join(FIXTURES_DIR, 'manifest.json')
+
+
+def _load_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def record_source(source, timeout=15):
+    """抓取單一來源並寫入 fixture，回傳 manifest 紀錄"""
+    response = get_session().get(source['url'], headers=SCRAPER_HEADERS, timeout=timeout)
+    response.raise_for_status()
+    content = response.content
+    path = fixture_path(source)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return {
+        'url': source['url'],
+        'status': response.status_code,
+        'content_type': response.headers.get('Content-Type'),
+        'bytes': len(content),
+        'sha256': hashlib.sha256(content).hexdigest(),
+        'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='錄製爬蟲來源 fixture')
+    parser.add_argument('--only', nargs='*', help='只錄製指定的來源名稱')
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    manifest = _load_manifest()
+    recorded = set()
+    failed = 0
+
+    for source in SOURCES:
+        name = source.get('fixture', source['name'])
+        if name in recorded or (args.only and name not in args.only):
+            continue
+        recorded.add(name)
+        try:
+            manifest[name] = record_source(source)
+            print(f"✅ {name}: {manifest[name]['bytes']} bytes")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+爬蟲來源與離線 fixture 對照表（供 benchmark / 錄製腳本共用）
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from api.web_scraper import TOURHUB_URL, _parse_leaderboard_html, _parse_trip_details_html  # noqa: E402
+from api.locker_service import DEFAULT_LOCKER_SOURCES, _parse_locker_html, _parse_vacancy_info  # noqa: E402
+from api.html_parser import make_soup  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT_DIR, 'fixtures', 'html')
+
+
+def _locker_source(name, url):
+    return {
+        'name': name,
+        'url': url,
+        'parse': lambda content, url=url: _parse_locker_html(url, content),
+    }
+
+
+# name 同時作為 fixture 檔名（fixtures/html/<name>.html）
+SOURCES = [
+    {'name': 'tourhub_leaderboard', 'url': TOURHUB_URL, 'parse': _parse_leaderboard_html},
+    {'name': 'tourhub_trip_details', 'url': TOURHUB_URL, 'fixture': 'tourhub_leaderboard',
+     'parse': lambda content: _parse_trip_details_html(content, 1)},
+    _locker_source('locker_akilocker', DEFAULT_LOCKER_SOURCES[0]),
+    _locker_source('locker_metocan', DEFAULT_LOCKER_SOURCES[1]),
+    _locker_source('locker_qrtranslator', DEFAULT_LOCKER_SOURCES[2]),
+    _locker_source('locker_coinlocker_navi', DEFAULT_LOCKER_SOURCES[3]),
+]
+
+
+def fixture_path(source) -> str:
+    return os.path.join(FIXTURES_DIR, f"{source.get('fixture', source['name'])}.html")
+
+
+def load_fixture(source):
+    """讀取來源對應的 fixture，不存在時回傳 None"""
+    path = fixture_path(source)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def count_items(result) -> int:
+    """計算解析結果的擷取筆數"""
+    if not result:
+        return 0
+    if isinstance(result, dict) and 'itinerary_list' in result:
+        return len(result['itinerary_list'])
+    return len(result)
+
+
+# 空位文字解析的固定樣本（涵蓋中文 / 日文 / 英文 / 分數格式）
+VACANCY_SAMPLES = [
+    '空位: 3 個', '剩餘 0 格', '空き3台', '空き 12', 'available 5', '2 slots free',
+    '3/20', '4 of 10', '尚有空位', '客滿', '満杯', 'sold out', '營業時間 9:00-21:00',
+]
+
+
+def vacancy_inputs():
+    """空位解析輸入：固定樣本加上各置物櫃 fixture 的頁面文字行"""
+    texts = list(VACANCY_SAMPLES)
+    for source in SOURCES:
+        if not source['name'].startswith('locker_'):
+            continue
+        content = load_fixture(source)
+        if content is None:
+            continue
+        page_text = make_soup(content).get_text('\n', strip=True)
+        texts.extend(line for line in page_text.split('\n') if line)
+    return texts
+
+
+def parse_vacancy_texts(texts):
+    """對每行文字解析空位資訊，回傳有解析結果的項目"""
+    results = []
+    for text in texts:
+        has_vacancy, available_slots = _parse_vacancy_info(text)
+        if has_vacancy is not None or available_slots is not None:
+            results.append((has_vacancy, available_slots))
+    return results